@@ -1,6 +1,7 @@
 """Endpoint REST API"""
 from fastapi import APIRouter, HTTPException, Depends, Request, Header
 from typing import List, Dict, Any, Optional
+import asyncio
 import hmac
 import hashlib
 import subprocess
@@ -102,6 +103,24 @@ async def get_telemetry(
     }
 
 
+@router.get("/models")
+async def get_models():
+    """Ottieni modelli residenti nel registro (memoria, tempi di caricamento e warmup)"""
+    from app.vision.model_registry import model_registry
+    
+    return {"models": model_registry.get_stats()}
+
+
+@router.get("/pipeline")
+async def get_pipeline():
+    """Ottieni stato pipeline per sorgente (decisioni controllo latenza: imgsz, fps, latenza misurata)"""
+    orchestrator = get_orchestrator()
+    if not orchestrator:
+        raise HTTPException(status_code=503, detail="Orchestratore non disponibile")
+    
+    return orchestrator.get_pipeline_stats()
+
+
 @router.post("/sources/mobile/register")
 async def register_mobile_source(
     request: dict,
@@ -126,10 +145,14 @@ async def register_mobile_source(
     
     if success:
         # Avvia elaborazione video per la sorgente appena registrata
+        # (già avviata se on_publish è arrivato prima della registrazione)
         orchestrator = get_orchestrator()
-        if orchestrator:
+        if orchestrator and not orchestrator.is_processing(source_id):
             try:
-                orchestrator.start_processing_source(source_id)
+                # Fuori dall'event loop: l'avvio può caricare modelli
+                await asyncio.get_running_loop().run_in_executor(
+                    None, orchestrator.start_processing_source, source_id
+                )
                 print(f"Elaborazione video avviata per sorgente mobile {source_id}")
             except Exception as e:
                 print(f"Attenzione: impossibile avviare elaborazione per {source_id}: {e}")
@@ -344,7 +367,19 @@ async def rtmp_on_publish(request: Request):
         if source:
             print(f"✅ Sorgente {source_id} trovata nel manager")
         else:
-            print(f"⚠️ Sorgente {source_id} NON trovata nel manager - potrebbe essere una connessione orfana")
+            print(f"⚠️ Sorgente {source_id} NON trovata nel manager - registrata da on_publish")
+        
+        orchestrator = get_orchestrator()
+        if settings.rtmp_start_on_publish and orchestrator and not orchestrator.is_processing(source_id):
+            # Il backend legge lo stream da nginx-rtmp (indirizzo interno, non quello usato dal telefono)
+            pull_url = f"{settings.rtmp_pull_base_url.rstrip('/')}/{app}/{name}"
+            if source_manager.register_mobile_phone(source_id=source_id, video_url=pull_url):
+                # Avvio in background: nginx attende questa risposta prima di accettare lo stream,
+                # il receiver si collega appena la pubblicazione parte
+                asyncio.get_running_loop().run_in_executor(
+                    None, orchestrator.start_processing_source, source_id
+                )
+                print(f"▶️ Elaborazione in avvio per {source_id} da {pull_url}")
         
         # Ritorna 200 OK per accettare la connessione
         # nginx-rtmp si aspetta un codice HTTP 2xx per permettere lo stream
@@ -374,8 +409,17 @@ async def rtmp_on_publish_done(request: Request):
         
         print(f"📹 RTMP PUBLISH DONE: source_id={source_id}, app={app}, addr={addr}, duration={duration}s")
         
-        # Qui potresti voler pulire risorse o notificare il source manager
-        # Per ora solo logging
+        orchestrator = get_orchestrator()
+        if settings.rtmp_start_on_publish and orchestrator:
+            # Stop fuori dall'event loop (attende la chiusura di thread e receiver)
+            await asyncio.get_running_loop().run_in_executor(
+                None, orchestrator.stop_processing_source, source_id
+            )
+            source = source_manager.get_source(source_id)
+            if source:
+                # La sorgente resta registrata: un nuovo publish la riattiva
+                source.disconnect()
+            print(f"⏹️ Elaborazione fermata per {source_id}")
         
         return {"status": "processed", "source_id": source_id}
         
@@ -1,6 +1,6 @@
 """Configurazioni globali del sistema"""
 from pydantic_settings import BaseSettings
-from typing import Optional
+from typing import Optional, List, Dict
 from enum import Enum
 
 
@@ -31,17 +31,70 @@ class Settings(BaseSettings):
     yolo_model: str = "yolov8n.pt"  # nano per velocità, può essere yolov8s/m/l/x
     yolo_conf_threshold: float = 0.5
     yolo_iou_threshold: float = 0.45
+    yolo_backend: str = "pytorch"  # pytorch, onnx (onnxruntime) o openvino
+    yolo_int8: bool = False  # variante quantizzata INT8 (solo onnx/openvino)
+    yolo_export_dir: str = "models/exported"  # cache modelli esportati
+    yolo_export_imgsz: int = 640  # dimensione input per l'export
+    yolo_int8_calibration_data: str = "coco8.yaml"  # calibrazione INT8 (dataset YAML Ultralytics o cartella immagini)
+    yolo_int8_calibration_samples: int = 64  # immagini di calibrazione per la quantizzazione statica ONNX
+    detection_interval_frames: int = 1  # detection completa ogni N frame (1 = ogni frame)
+    detection_adaptive: bool = True  # anticipa la detection quando i track diventano incerti
+    
+    # Tracking
+    tracker_motion_model: str = "velocity"  # "velocity" (media mobile) o "kalman" (velocità costante, stile SORT)
+    tracker_association: str = "greedy"  # "greedy" o "hungarian" (assegnamento ottimo con gating per classe)
+    tracker_type: str = "iou"  # "iou" o "appearance" (re-identificazione per aspetto)
+    
+    # Re-identificazione per aspetto (tracker_type = "appearance")
+    reid_model_path: Optional[str] = None  # modello ONNX di embedding (None = istogrammi colore HSV)
+    reid_input_width: int = 64  # dimensione input del modello re-id
+    reid_input_height: int = 128
+    reid_gallery_size: int = 16  # embedding conservati per track (i più vecchi vengono scartati)
+    reid_max_distance: float = 0.3  # distanza coseno massima per riconoscere un track
+    reid_confident_iou: float = 0.6  # match IoU univoci sopra soglia non calcolano embedding
+    reid_max_age: int = 90  # frame di conservazione dei track persi con gallery (recuperabili per aspetto)
+    
+    # Motion gate (telecamere fisse): salta YOLO se la scena non cambia
+    motion_gate_enabled: bool = False
+    motion_gate_scale_width: int = 160  # larghezza frame ridotto per la differenza
+    motion_gate_pixel_threshold: int = 25  # differenza intensità (0-255) per pixel cambiato
+    motion_gate_min_area_ratio: float = 0.002  # frazione minima di pixel cambiati
+    motion_gate_max_skip_frames: int = 150  # forza una detection dopo N frame saltati
+    motion_gate_background_alpha: float = 0.05  # velocità aggiornamento sfondo
+    
+    # Inferenza a tile (oggetti piccoli da drone in quota)
+    tiled_inference_source_types: List[SourceType] = []  # es. ["drone"]
+    tiled_inference_tile_size: int = 640  # lato tile in pixel
+    tiled_inference_overlap: float = 0.2  # sovrapposizione tra tile adiacenti
+    tiled_inference_include_full_frame: bool = True  # aggiunge il frame intero per oggetti grandi
     
     # Face Detection
     enable_face_detection: bool = True
     face_detection_model_path: Optional[str] = None  # None = usa Haar Cascade (fallback)
     face_conf_threshold: float = 0.5
+    face_detection_mode: str = "full"  # "full" = intero frame, "persons" = solo nei box person
+    face_min_person_height: int = 80  # altezza minima box person (pixel) per cercare volti
+    face_person_upper_fraction: float = 0.4  # frazione alta del box person in cui cercare
+    face_roi_max_side: int = 160  # lato massimo ROI dopo riduzione (pixel)
     
     # Camera Calibration (default, override con calibrazione specifica)
     camera_fov_horizontal: float = 84.0  # gradi
     camera_fov_vertical: float = 53.0  # gradi
     camera_resolution_width: int = 1920
     camera_resolution_height: int = 1080
+    geolocation_camera_model: str = "flat"  # "flat" = angoli per asse (storico, tilt positivo = basso), "3d" = assetto + gimbal + distorsione
+    geolocation_camera_model_by_source: Dict[SourceType, str] = {SourceType.DRONE: "3d"}  # modello per tipo sorgente (MAVLink: tilt negativo = basso); l'app iOS invia tilt/pan "flat"
+    geolocation_gimbal_stabilized: bool = False  # tilt/pan riferiti all'orizzonte: ignora roll/pitch del corpo
+    static_camera_lut_enabled: bool = True  # tabella precalcolata pixel -> terreno per telecamere fisse
+    static_camera_lut_step: int = 8  # passo griglia della tabella (pixel, interpolazione bilineare)
+    static_camera_lut_tolerance_meters: float = 0.25  # errore massimo di interpolazione (oltre: proiezione esatta)
+    
+    # Modello del terreno (DEM/DTM locale, nessun accesso di rete)
+    dem_directory: Optional[str] = None  # cartella con tile SRTM .hgt o GeoTIFF EPSG:4326 (richiede rasterio)
+    dem_cache_tiles: int = 16  # tile aperti/decodificati tenuti in memoria (LRU)
+    dem_max_iterations: int = 8  # iterazioni massime intersezione raggio-terreno
+    dem_convergence_meters: float = 0.5  # correzione di quota sotto cui l'intersezione è considerata convergente
+    default_ground_altitude: float = 0.0  # quota terreno (metri slm) senza DEM o fuori copertura
     
     # API Configuration
     api_host: str = "0.0.0.0"
@@ -51,6 +104,39 @@ class Settings(BaseSettings):
     # Performance
     target_latency_seconds: float = 2.0
     video_buffer_size: int = 10
+    video_grab_latest_frame: bool = True  # per stream live elabora sempre il frame più recente
+    rtmp_pull_base_url: str = "rtmp://ermes-rtmp:1935"  # nginx-rtmp visto dal backend (stream = base/app/name)
+    rtmp_start_on_publish: bool = True  # avvia/ferma l'elaborazione dai callback on_publish/on_publish_done
+    prewarmed_processor_slots: int = 1  # VideoProcessor pronti (modelli caricati) per nuovi stream
+    rtmp_decoder_backend: str = "ffmpeg"  # "ffmpeg" (subprocess + pipe) o "pyav" (decode in-process)
+    rtmp_frame_ring_slots: int = 4  # buffer frame preallocati per ogni stream RTMP
+    rtmp_output_max_side: Optional[int] = None  # ridimensiona in ffmpeg al lato lungo massimo (es. 640)
+    rtmp_output_fps: Optional[float] = None  # riduce in ffmpeg il frame rate (es. 10)
+    rtmp_probe_timeout_seconds: float = 10.0  # attesa massima ffprobe per la geometria dello stream
+    
+    # Controllo adattivo latenza: riduce imgsz e poi fps per restare nel budget
+    adaptive_latency_enabled: bool = False
+    adaptive_latency_budget_seconds: Optional[float] = None  # None = target_latency_seconds
+    adaptive_imgsz_levels: List[int] = [640, 512, 416, 320]  # dalla qualità più alta
+    adaptive_min_fps: float = 2.0  # frame rate elaborato minimo
+    adaptive_high_watermark: float = 0.8  # frazione del budget oltre cui degradare
+    adaptive_low_watermark: float = 0.4  # frazione del budget sotto cui recuperare qualità
+    adaptive_cooldown_frames: int = 15  # misure tra due decisioni
+    adaptive_latency_smoothing: float = 0.2  # peso media mobile esponenziale
+    
+    # Inferenza a batch condivisa tra sorgenti
+    inference_batching_enabled: bool = False
+    inference_max_batch_size: int = 8  # frame per singola chiamata predict
+    inference_max_wait_ms: float = 15.0  # attesa massima per riempire un batch
+    model_warmup_on_startup: bool = True  # carica e scalda i modelli all'avvio
+    
+    # Modalità esecuzione inferenza: "thread" (nel processo API) o "process_pool" (worker separati)
+    execution_mode: str = "thread"
+    process_pool_workers: int = 2  # processi worker di inferenza
+    process_pool_slots: int = 8  # slot frame in shared memory
+    process_pool_max_frame_width: int = 3840  # dimensione massima frame per slot
+    process_pool_max_frame_height: int = 2160
+    process_pool_start_timeout_seconds: float = 120.0  # attesa caricamento modello nei worker (poi fallback nel processo)
     
     # Logging
     log_level: str = "INFO"
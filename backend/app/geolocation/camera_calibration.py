@@ -1,12 +1,24 @@
 """Calibrazione camera e gestione parametri"""
-from typing import Dict, Any, Optional
+from typing import Dict, Any, List, Optional
 import json
+import cv2
 import numpy as np
 from app.config import settings
 
 
 class CameraCalibration:
-    """Gestisce parametri di calibrazione camera"""
+    """
+    Gestisce parametri di calibrazione camera
+    
+    Ogni modifica di un parametro incrementa version: chi deriva matrici o
+    tabelle dalla calibrazione le ricalcola solo quando version cambia.
+    """
+    
+    # Parametri che invalidano le grandezze derivate
+    _CALIBRATION_FIELDS = frozenset({
+        'fov_horizontal', 'fov_vertical', 'resolution_width', 'resolution_height',
+        'focal_length', 'sensor_width', 'sensor_height', 'distortion_coefficients'
+    })
     
     def __init__(
         self,
@@ -16,7 +28,8 @@ class CameraCalibration:
         resolution_height: Optional[int] = None,
         focal_length: Optional[float] = None,
         sensor_width: Optional[float] = None,
-        sensor_height: Optional[float] = None
+        sensor_height: Optional[float] = None,
+        distortion_coefficients: Optional[List[float]] = None
     ):
         """
         Args:
@@ -27,19 +40,19 @@ class CameraCalibration:
             focal_length: Lunghezza focale (mm) - calcolata se non fornita
             sensor_width: Larghezza sensore (mm) - calcolata se non fornita
             sensor_height: Altezza sensore (mm) - calcolata se non fornita
+            distortion_coefficients: Coefficienti distorsione lente in ordine OpenCV
+                (k1, k2, p1, p2[, k3, ...]) - None = lente ideale
         """
+        self.version = 0
+        self._intrinsic_matrix: Optional[np.ndarray] = None
         self.fov_horizontal = fov_horizontal or settings.camera_fov_horizontal
         self.fov_vertical = fov_vertical or settings.camera_fov_vertical
         self.resolution_width = resolution_width or settings.camera_resolution_width
         self.resolution_height = resolution_height or settings.camera_resolution_height
+        self.distortion_coefficients = list(distortion_coefficients) if distortion_coefficients else None
         
         # Calcola parametri derivati se non forniti
-        if focal_length is None:
-            # Stima focale da FOV e risoluzione
-            self.focal_length = self._estimate_focal_length()
-        else:
-            self.focal_length = focal_length
-        
+        # (sensore prima della focale: la stima della focale lo usa)
         if sensor_width is None or sensor_height is None:
             # Stima dimensioni sensore (assumendo rapporto standard)
             self.sensor_width = 36.0  # mm (full frame equivalente)
@@ -47,6 +60,19 @@ class CameraCalibration:
         else:
             self.sensor_width = sensor_width
             self.sensor_height = sensor_height
+        
+        if focal_length is None:
+            # Stima focale da FOV e risoluzione
+            self.focal_length = self._estimate_focal_length()
+        else:
+            self.focal_length = focal_length
+    
+    def __setattr__(self, name: str, value: Any):
+        super().__setattr__(name, value)
+        if name in self._CALIBRATION_FIELDS:
+            # Invalida le grandezze derivate (matrice intrinseca in cache, tabelle esterne)
+            super().__setattr__('version', self.version + 1)
+            super().__setattr__('_intrinsic_matrix', None)
     
     def _estimate_focal_length(self) -> float:
         """Stima lunghezza focale da FOV e risoluzione"""
@@ -57,18 +83,55 @@ class CameraCalibration:
         focal_length_mm = (focal_length_pixels / self.resolution_width) * self.sensor_width
         return focal_length_mm
     
+    def set_resolution(self, width: int, height: int):
+        """
+        Aggiorna la risoluzione dei frame effettivamente elaborati
+        
+        FOV e focale (mm) non cambiano: un frame ridimensionato copre lo
+        stesso campo visivo con meno pixel.
+        """
+        self.resolution_width = width
+        self.resolution_height = height
+    
     def get_intrinsic_matrix(self) -> np.ndarray:
-        """Ottieni matrice intrinseca camera (K)"""
-        fx = (self.focal_length / self.sensor_width) * self.resolution_width
-        fy = (self.focal_length / self.sensor_height) * self.resolution_height
-        cx = self.resolution_width / 2.0
-        cy = self.resolution_height / 2.0
+        """Ottieni matrice intrinseca camera (K), in cache finché la calibrazione non cambia"""
+        if self._intrinsic_matrix is None:
+            fx = (self.focal_length / self.sensor_width) * self.resolution_width
+            fy = (self.focal_length / self.sensor_height) * self.resolution_height
+            cx = self.resolution_width / 2.0
+            cy = self.resolution_height / 2.0
+            
+            matrix = np.array([
+                [fx, 0, cx],
+                [0, fy, cy],
+                [0, 0, 1]
+            ], dtype=np.float32)
+            matrix.flags.writeable = False  # condivisa tra i chiamanti
+            self._intrinsic_matrix = matrix
+        return self._intrinsic_matrix
+    
+    def undistort_points(self, pixels: np.ndarray) -> np.ndarray:
+        """
+        Coordinate normalizzate (x/z, y/z) dei raggi per N pixel, in un'unica chiamata batch
+        
+        Args:
+            pixels: Array Nx2 di coordinate pixel (x, y)
+        
+        Returns:
+            Array Nx2 di coordinate normalizzate senza distorsione
+        """
+        pixels = np.asarray(pixels, dtype=np.float64).reshape(-1, 2)
+        K = self.get_intrinsic_matrix()
+        if not self.distortion_coefficients or len(pixels) == 0:
+            # Lente ideale: solo intrinseci
+            return (pixels - (K[0, 2], K[1, 2])) / (K[0, 0], K[1, 1])
         
-        return np.array([
-            [fx, 0, cx],
-            [0, fy, cy],
-            [0, 0, 1]
-        ], dtype=np.float32)
+        points = cv2.undistortPoints(
+            pixels.reshape(-1, 1, 2),
+            K.astype(np.float64),
+            np.asarray(self.distortion_coefficients, dtype=np.float64)
+        )
+        return points.reshape(-1, 2).astype(np.float64)
     
     def to_dict(self) -> Dict[str, Any]:
         """Converte calibrazione a dict per serializzazione"""
@@ -79,7 +142,8 @@ class CameraCalibration:
             'resolution_height': self.resolution_height,
             'focal_length': self.focal_length,
             'sensor_width': self.sensor_width,
-            'sensor_height': self.sensor_height
+            'sensor_height': self.sensor_height,
+            'distortion_coefficients': self.distortion_coefficients
         }
     
     @classmethod
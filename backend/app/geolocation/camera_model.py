@@ -0,0 +1,63 @@
+"""Modello geometrico 3D della camera: catena di rotazioni corpo -> gimbal -> camera"""
+import math
+import numpy as np
+from app.sources import TelemetryData
+
+
+# Assi camera (OpenCV: x destra, y basso, z avanti) -> assi gimbal (x avanti, y destra, z basso)
+_CAMERA_TO_GIMBAL = np.array([
+    [0.0, 0.0, 1.0],
+    [1.0, 0.0, 0.0],
+    [0.0, 1.0, 0.0]
+])
+
+
+def _rot_x(angle: float) -> np.ndarray:
+    c, s = math.cos(angle), math.sin(angle)
+    return np.array([[1.0, 0.0, 0.0], [0.0, c, -s], [0.0, s, c]])
+
+
+def _rot_y(angle: float) -> np.ndarray:
+    c, s = math.cos(angle), math.sin(angle)
+    return np.array([[c, 0.0, s], [0.0, 1.0, 0.0], [-s, 0.0, c]])
+
+
+def _rot_z(angle: float) -> np.ndarray:
+    c, s = math.cos(angle), math.sin(angle)
+    return np.array([[c, -s, 0.0], [s, c, 0.0], [0.0, 0.0, 1.0]])
+
+
+def body_to_ned(roll: float, pitch: float, yaw: float) -> np.ndarray:
+    """
+    Rotazione corpo -> NED (nord, est, basso), convenzione aeronautica ZYX di MAVLink ATTITUDE
+
+    Args:
+        roll: Rollio (gradi, positivo = ala destra in basso)
+        pitch: Beccheggio (gradi, positivo = muso in alto)
+        yaw: Imbardata (gradi, 0 = nord, 90 = est)
+    """
+    return _rot_z(math.radians(yaw)) @ _rot_y(math.radians(pitch)) @ _rot_x(math.radians(roll))
+
+
+def camera_to_ned(telemetry: TelemetryData, gimbal_stabilized: bool = False) -> np.ndarray:
+    """
+    Rotazione assi camera -> NED per uno snapshot di telemetria
+
+    Catena: corpo (roll/pitch/yaw) -> gimbal (pan attorno all'asse verticale
+    del corpo, poi tilt attorno all'asse laterale; tilt negativo = verso il
+    basso) -> camera. Valori mancanti valgono 0: una sorgente fissa senza
+    assetto usa solo pan e tilt (pan 0 = nord).
+
+    Args:
+        telemetry: Dati telemetria sorgente
+        gimbal_stabilized: Gimbal stabilizzato sull'orizzonte (tilt/pan riferiti
+            all'orizzonte): dell'assetto del corpo si usa solo l'imbardata
+
+    Returns:
+        Matrice 3x3 che porta direzioni in assi camera in direzioni NED
+    """
+    roll = 0.0 if gimbal_stabilized else (telemetry.roll or 0.0)
+    pitch = 0.0 if gimbal_stabilized else (telemetry.pitch or 0.0)
+    body = body_to_ned(roll, pitch, telemetry.yaw or 0.0)
+    gimbal = _rot_z(math.radians(telemetry.camera_pan or 0.0)) @ _rot_y(math.radians(telemetry.camera_tilt or 0.0))
+    return body @ gimbal @ _CAMERA_TO_GIMBAL
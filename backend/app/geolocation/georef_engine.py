@@ -3,6 +3,9 @@ import numpy as np
 from typing import List, Dict, Any, Tuple, Optional
 import math
 from app.geolocation.camera_calibration import CameraCalibration
+from app.geolocation.camera_model import camera_to_ned
+from app.geolocation.ground_lut import GroundLookupTable
+from app.geolocation.terrain import TerrainService
 from app.sources import TelemetryData
 from app.config import GPSPrecision, settings
 
@@ -10,20 +13,268 @@ from app.config import GPSPrecision, settings
 class GeolocationEngine:
     """Engine per geolocalizzazione oggetti rilevati"""
     
-    def __init__(self, camera_calibration: Optional[CameraCalibration] = None):
+    def __init__(
+        self,
+        camera_calibration: Optional[CameraCalibration] = None,
+        terrain: Optional[TerrainService] = None
+    ):
         """
         Args:
             camera_calibration: Calibrazione camera (usa default se None)
+            terrain: Modello del terreno (DEM) per l'intersezione raggio-terreno;
+                se None il terreno è un piano a settings.default_ground_altitude
         """
         self.calibration = camera_calibration or CameraCalibration()
+        self.terrain = terrain
         self.earth_radius = 6371000  # Raggio Terra in metri
+        
+        # Tabella pixel -> terreno per sorgenti fisse (costruita al primo uso)
+        self._ground_lut: Optional[GroundLookupTable] = None
+        self._ground_lut_key: Optional[tuple] = None
+    
+    def pixels_to_ground_coordinates(
+        self,
+        pixels: np.ndarray,
+        telemetry: TelemetryData,
+        ground_altitude: Optional[float] = None
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Converte N coordinate pixel a coordinate geografiche terreno (forma vettoriale)
+        
+        Args:
+            pixels: Array Nx2 di coordinate pixel (x, y) con origine in alto a sinistra
+            telemetry: Dati telemetria sorgente (unico snapshot per tutti i punti)
+            ground_altitude: Altitudine terreno (metri sopra livello mare);
+                None = quota dal DEM se disponibile
+        
+        Returns:
+            Tuple (latitudes, longitudes) array di N elementi
+        """
+        pixels = np.asarray(pixels, dtype=np.float64).reshape(-1, 2)
+        
+        ground_lut = self._get_ground_lut(telemetry, ground_altitude)
+        if ground_lut is None:
+            latitudes, longitudes, _ = self._project_to_ground(pixels, telemetry, ground_altitude)
+            return latitudes, longitudes
+        
+        # Posa fissa: interpolazione in tabella, proiezione esatta solo per i punti non coperti
+        latitudes, longitudes, found = ground_lut.lookup(pixels)
+        if not found.all():
+            missing = ~found
+            latitudes[missing], longitudes[missing], _ = self._project_to_ground(
+                pixels[missing], telemetry, ground_altitude
+            )
+        return latitudes, longitudes
+    
+    def _project_to_ground(
+        self,
+        pixels: np.ndarray,
+        telemetry: TelemetryData,
+        ground_altitude: Optional[float]
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Proiezione esatta pixel -> terreno
+        
+        I raggi si calcolano una volta (undistorsione batch compresa) e si
+        intersecano con il piano a quota nota o, con DEM e quota non indicata,
+        con il terreno.
+        
+        Returns:
+            Tuple (latitudes, longitudes, hits_ground) array di N elementi
+        """
+        rays = self._pixel_rays(pixels, telemetry)
+        if ground_altitude is None:
+            if self.terrain is not None:
+                return self._intersect_terrain(rays, telemetry)
+            ground_altitude = settings.default_ground_altitude
+        return self._intersect_plane(rays, telemetry, ground_altitude)
+    
+    @staticmethod
+    def _camera_model(telemetry: TelemetryData) -> str:
+        """
+        Modello camera per la sorgente della telemetria
+        
+        Le convenzioni degli angoli dipendono dal client: l'app iOS invia tilt
+        positivo = basso, pan da bussola e assetto CoreMotion (yaw con
+        riferimento arbitrario), adatti solo al modello "flat"; MAVLink usa
+        l'assetto aeronautico del modello "3d".
+        
+        Returns:
+            "3d" o "flat" (settings.geolocation_camera_model_by_source, altrimenti
+            settings.geolocation_camera_model)
+        """
+        return settings.geolocation_camera_model_by_source.get(
+            telemetry.source_type, settings.geolocation_camera_model
+        )
+    
+    def _pixel_rays(self, pixels: np.ndarray, telemetry: TelemetryData) -> np.ndarray:
+        """
+        Direzioni dei raggi in assi NED (nord, est, basso) per N pixel
+        
+        Entrambi i modelli partono dai pixel non distorti (cv2.undistortPoints
+        in batch, solo intrinseci per lente ideale). Modello "3d": raggi
+        ruotati dalla catena corpo -> gimbal -> camera. Modello "flat"
+        (storico): angoli per asse atan(coordinata normalizzata) sommati a
+        tilt/pan, senza assetto, con tilt positivo = verso il basso.
+        Il modello dipende dal tipo di sorgente (vedi _camera_model).
+        
+        Returns:
+            Array Nx3 di direzioni (non normalizzate)
+        """
+        normalized = self.calibration.undistort_points(pixels)
+        if self._camera_model(telemetry) == "flat":
+            theta_x = np.arctan(normalized[:, 0])  # Azimuth relativo
+            theta_y = np.arctan(normalized[:, 1])  # Elevazione relativa
+            # Angolo sotto l'orizzonte e azimuth assoluti
+            depression = math.radians(telemetry.camera_tilt or 0.0) - theta_y
+            azimuth = math.radians(telemetry.camera_pan or 0.0) + theta_x
+            return np.column_stack([
+                np.cos(depression) * np.cos(azimuth),
+                np.cos(depression) * np.sin(azimuth),
+                np.sin(depression)
+            ])
+        
+        rotation = camera_to_ned(telemetry, settings.geolocation_gimbal_stabilized)
+        # Raggio camera (x, y, 1) ruotato: rotation @ r per ogni riga
+        return normalized @ rotation[:, :2].T + rotation[:, 2]
+    
+    def _reference_ground_altitude(self, telemetry: TelemetryData) -> float:
+        """Quota del terreno sotto la sorgente (DEM, altrimenti default)"""
+        if self.terrain is not None:
+            elevation = self.terrain.elevation(telemetry.latitude, telemetry.longitude)
+            if elevation is not None:
+                return elevation
+        return settings.default_ground_altitude
+    
+    def _intersect_terrain(
+        self,
+        rays: np.ndarray,
+        telemetry: TelemetryData
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Intersezione iterativa raggio-terreno sul DEM
+        
+        Parte dal piano alla quota del terreno sotto la sorgente e ad ogni
+        iterazione sposta il piano di ogni punto alla quota DEM del punto
+        proiettato (un'unica interrogazione batch per iterazione). Quando la
+        correzione di un punto cambia segno (pendenza vicina a quella del
+        raggio) il passo di quel punto viene dimezzato per evitare oscillazioni.
+        Punti senza copertura DEM restano sull'ultima quota stimata.
+        
+        Returns:
+            Tuple (latitudes, longitudes, hits_ground) array di N elementi
+        """
+        count = len(rays)
+        ground = np.full(count, self._reference_ground_altitude(telemetry))
+        # Il terreno non può stare sopra la sorgente (altezza minima 1 m)
+        ceiling = telemetry.altitude - 1.0
+        relaxation = np.ones(count)
+        previous_step = np.zeros(count)
+        
+        for _ in range(max(1, settings.dem_max_iterations)):
+            latitudes, longitudes, hits = self._intersect_plane(rays, telemetry, ground)
+            elevations = self.terrain.elevations(latitudes, longitudes)
+            step = np.where(np.isnan(elevations), 0.0, np.minimum(elevations, ceiling) - ground)
+            # Raggi sopra l'orizzonte: nessuna intersezione da raffinare
+            step[~hits] = 0.0
+            if not np.any(np.abs(step) > settings.dem_convergence_meters):
+                ground += step
+                break
+            relaxation[step * previous_step < 0] *= 0.5
+            ground += relaxation * step
+            previous_step = step
+        
+        return self._intersect_plane(rays, telemetry, ground)
+    
+    def _intersect_plane(
+        self,
+        rays: np.ndarray,
+        telemetry: TelemetryData,
+        ground_altitude
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Intersezione raggi NED con il piano del terreno
+        
+        Args:
+            rays: Array Nx3 di direzioni (nord, est, basso)
+            telemetry: Dati telemetria sorgente (posizione)
+            ground_altitude: Quota del piano, scalare o array di N elementi (una per punto)
+        
+        Returns:
+            Tuple (latitudes, longitudes, hits_ground) array di N elementi
+        """
+        # Altezza sorgente sopra terreno
+        source_height = np.broadcast_to(
+            telemetry.altitude - np.asarray(ground_altitude, dtype=np.float64), (len(rays),)
+        )
+        
+        # Raggio verso il basso: intersezione a t = altezza / componente verticale
+        # (raggio orizzontale o verso l'alto = fuori dal terreno: fallback a distanza pari all'altezza)
+        hits = rays[:, 2] > 1e-9
+        horizontal = np.hypot(rays[:, 0], rays[:, 1])
+        scale = source_height / np.maximum(horizontal, 1e-12)
+        scale[hits] = source_height[hits] / rays[hits, 2]
+        north = rays[:, 0] * scale
+        east = rays[:, 1] * scale
+        
+        # Converti offset metrici a offset lat/lon
+        # Usa approssimazione locale (per distanze < 1km)
+        lat_offset = north / self.earth_radius
+        lon_offset = east / (self.earth_radius * math.cos(math.radians(telemetry.latitude)))
+        
+        return (
+            telemetry.latitude + np.degrees(lat_offset),
+            telemetry.longitude + np.degrees(lon_offset),
+            hits
+        )
+    
+    def _get_ground_lut(
+        self,
+        telemetry: TelemetryData,
+        ground_altitude: Optional[float]
+    ) -> Optional[GroundLookupTable]:
+        """
+        Tabella pixel -> terreno per la posa corrente di una sorgente fissa
+        
+        Ricostruita quando cambiano calibrazione (version), posa o quota terreno.
+        Solo per l'intersezione con un piano: con il DEM la proiezione esatta
+        salta tra rilievi diversi anche tra pixel adiacenti (occlusioni, raggi
+        radenti) e l'interpolazione tra nodi non è affidabile.
+        
+        Returns:
+            Tabella, o None se la sorgente non è fissa, la quota viene dal DEM
+            o le tabelle sono disabilitate
+        """
+        if not settings.static_camera_lut_enabled or not (telemetry.metadata or {}).get('is_static'):
+            return None
+        if ground_altitude is None and self.terrain is not None:
+            return None
+        
+        key = (
+            self.calibration.version,
+            telemetry.latitude, telemetry.longitude, telemetry.altitude,
+            telemetry.roll, telemetry.pitch, telemetry.yaw,
+            telemetry.camera_tilt, telemetry.camera_pan,
+            self._camera_model(telemetry), settings.geolocation_gimbal_stabilized,
+            ground_altitude, self.terrain, settings.default_ground_altitude
+        )
+        if self._ground_lut is None or self._ground_lut_key != key:
+            self._ground_lut = GroundLookupTable(
+                lambda pixels: self._project_to_ground(pixels, telemetry, ground_altitude),
+                self.calibration.resolution_width,
+                self.calibration.resolution_height,
+                settings.static_camera_lut_step,
+                settings.static_camera_lut_tolerance_meters
+            )
+            self._ground_lut_key = key
+        return self._ground_lut
     
     def pixel_to_ground_coordinates(
         self,
         pixel_x: float,
         pixel_y: float,
         telemetry: TelemetryData,
-        ground_altitude: float = 0.0
+        ground_altitude: Optional[float] = None
     ) -> Tuple[float, float]:
         """
         Converte coordinate pixel a coordinate geografiche terreno
@@ -32,55 +283,46 @@ class GeolocationEngine:
             pixel_x: Coordinata X pixel (0 = sinistra)
             pixel_y: Coordinata Y pixel (0 = alto)
             telemetry: Dati telemetria sorgente
-            ground_altitude: Altitudine terreno (metri sopra livello mare)
+            ground_altitude: Altitudine terreno (metri sopra livello mare);
+                None = quota dal DEM se disponibile
         
         Returns:
             Tuple (latitude, longitude) coordinate oggetto
         """
-        # Altezza sorgente sopra terreno
-        source_height = telemetry.altitude - ground_altitude
-        
-        # Angoli camera (tilt/pan)
-        camera_tilt = telemetry.camera_tilt or 0.0
-        camera_pan = telemetry.camera_pan or 0.0
-        
-        # Converti pixel a angoli relativi camera
-        K = self.calibration.get_intrinsic_matrix()
-        fx, fy = K[0, 0], K[1, 1]
-        cx, cy = K[0, 2], K[1, 2]
-        
-        # Angoli relativi al centro camera
-        theta_x = math.atan((pixel_x - cx) / fx)  # Azimuth relativo
-        theta_y = math.atan((pixel_y - cy) / fy)  # Elevazione relativa
-        
-        # Converti a angoli assoluti
-        # Considera tilt camera (negativo = verso basso)
-        elevation = math.radians(camera_tilt) - theta_y
-        azimuth = math.radians(camera_pan) + theta_x
-        
-        # Calcola distanza al terreno usando altezza e angolo elevazione
-        if elevation > 0:
-            distance = source_height / math.tan(elevation)
-        else:
-            # Angolo negativo o zero = fuori campo visivo verso l'alto
-            distance = source_height  # Fallback
-        
-        # Converti distanza + azimuth a offset lat/lon
-        # Usa approssimazione locale (per distanze < 1km)
-        lat_offset = distance * math.cos(azimuth) / self.earth_radius
-        lon_offset = distance * math.sin(azimuth) / (self.earth_radius * math.cos(math.radians(telemetry.latitude)))
+        latitudes, longitudes = self.pixels_to_ground_coordinates(
+            np.array([[pixel_x, pixel_y]]), telemetry, ground_altitude
+        )
+        return float(latitudes[0]), float(longitudes[0])
+    
+    def geolocate_points(
+        self,
+        pixels: np.ndarray,
+        telemetry: TelemetryData,
+        ground_altitude: Optional[float] = None
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Geolocalizza N punti pixel con un unico passaggio su array
         
-        # Calcola coordinate finali
-        latitude = telemetry.latitude + math.degrees(lat_offset)
-        longitude = telemetry.longitude + math.degrees(lon_offset)
+        Args:
+            pixels: Array Nx2 di coordinate pixel (x, y)
+            telemetry: Dati telemetria sorgente
+            ground_altitude: Altitudine terreno (None = quota dal DEM se disponibile)
         
-        return latitude, longitude
+        Returns:
+            Tuple (latitudes, longitudes, accuracies_meters) array di N elementi
+        """
+        latitudes, longitudes = self.pixels_to_ground_coordinates(pixels, telemetry, ground_altitude)
+        if ground_altitude is None:
+            ground_altitude = self._reference_ground_altitude(telemetry)
+        accuracy = self._estimate_accuracy(telemetry, source_height=telemetry.altitude - ground_altitude)
+        return latitudes, longitudes, np.full(len(latitudes), accuracy)
     
     def geolocate_detections(
         self,
         detections: List[Dict[str, Any]],
         telemetry: TelemetryData,
-        ground_altitude: float = 0.0
+        ground_altitude: Optional[float] = None,
+        in_place: bool = False
     ) -> List[Dict[str, Any]]:
         """
         Geolocalizza lista di detection
@@ -88,45 +330,51 @@ class GeolocationEngine:
         Args:
             detections: Lista detection con 'center' o 'bbox'
             telemetry: Dati telemetria sorgente
-            ground_altitude: Altitudine terreno
+            ground_altitude: Altitudine terreno (None = quota dal DEM se disponibile)
+            in_place: Aggiunge le coordinate ai dict ricevuti invece di copiarli
+                (per detection non condivise con altri consumatori)
         
         Returns:
             Lista detection con coordinate geografiche aggiunte
         """
-        geolocated = []
-        
+        located = []
+        pixels = []
         for det in detections:
             # Usa centro bounding box
             if 'center' in det:
-                pixel_x, pixel_y = det['center']
+                pixels.append(det['center'])
             elif 'bbox' in det:
                 x1, y1, x2, y2 = det['bbox']
-                pixel_x = (x1 + x2) / 2
-                pixel_y = (y1 + y2) / 2
+                pixels.append(((x1 + x2) / 2, (y1 + y2) / 2))
             else:
                 continue
-            
-            try:
-                latitude, longitude = self.pixel_to_ground_coordinates(
-                    pixel_x, pixel_y, telemetry, ground_altitude
-                )
-                
-                # Aggiungi coordinate a detection
-                det_copy = det.copy()
-                det_copy['latitude'] = latitude
-                det_copy['longitude'] = longitude
-                det_copy['source_id'] = telemetry.source_id
-                det_copy['source_type'] = telemetry.source_type.value
-                
-                # Aggiungi precisione stimata
-                det_copy['accuracy_meters'] = self._estimate_accuracy(
-                    telemetry, source_height=telemetry.altitude - ground_altitude
-                )
-                
-                geolocated.append(det_copy)
-            except Exception as e:
-                print(f"Errore geolocalizzazione detection: {e}")
-                continue
+            located.append(det)
+        
+        if not located:
+            return []
+        
+        try:
+            latitudes, longitudes, accuracies = self.geolocate_points(
+                np.array(pixels, dtype=np.float64), telemetry, ground_altitude
+            )
+        except Exception as e:
+            print(f"Errore geolocalizzazione detection: {e}")
+            return []
+        
+        source_id = telemetry.source_id
+        source_type = telemetry.source_type.value
+        geolocated = []
+        for det, latitude, longitude, accuracy in zip(
+            located, latitudes.tolist(), longitudes.tolist(), accuracies.tolist()
+        ):
+            det_copy = det if in_place else det.copy()
+            det_copy['latitude'] = latitude
+            det_copy['longitude'] = longitude
+            det_copy['source_id'] = source_id
+            det_copy['source_type'] = source_type
+            # Precisione stimata
+            det_copy['accuracy_meters'] = accuracy
+            geolocated.append(det_copy)
         
         return geolocated
     
@@ -0,0 +1,138 @@
+"""Tabella precalcolata pixel -> coordinate terreno per sorgenti con posa fissa"""
+import numpy as np
+from typing import Callable, Tuple
+
+
+class GroundLookupTable:
+    """
+    Griglia di coordinate terreno campionata ogni `step` pixel
+
+    Per una telecamera fissa la proiezione pixel -> terreno non cambia: la
+    griglia si calcola una volta (un'unica proiezione batch dei nodi) e ogni
+    detection si geolocalizza per interpolazione bilineare dei 4 nodi vicini.
+    Ogni cella viene verificata alla costruzione confrontando con la
+    proiezione esatta il valore interpolato al centro e ai punti medi dei 4
+    lati: vicino all'orizzonte la distanza cresce in modo molto non lineare e
+    l'interpolazione non è affidabile. Il controllo a campione presuppone una
+    proiezione continua (intersezione con un piano): con un DEM le occlusioni
+    la rendono discontinua dentro le celle e la tabella non va usata. Per i
+    punti in celle oltre tolleranza (o con nodi sopra l'orizzonte) lookup()
+    segnala che serve la proiezione esatta.
+    """
+
+    METERS_PER_DEGREE = 111320.0
+
+    def __init__(
+        self,
+        project: Callable[[np.ndarray], Tuple[np.ndarray, np.ndarray, np.ndarray]],
+        width: int,
+        height: int,
+        step: int,
+        tolerance_meters: float
+    ):
+        """
+        Args:
+            project: Proiezione esatta pixel Nx2 -> (lat, lon, valido) array di N elementi
+            width: Larghezza frame (pixel)
+            height: Altezza frame (pixel)
+            step: Passo griglia (pixel)
+            tolerance_meters: Errore massimo di interpolazione ammesso per cella
+        """
+        step = max(1, int(step))
+        self.width = width
+        self.height = height
+        self.nx = int(np.ceil(width / step)) + 1
+        self.ny = int(np.ceil(height / step)) + 1
+        self.step_x = width / (self.nx - 1)
+        self.step_y = height / (self.ny - 1)
+
+        xs = np.linspace(0.0, width, self.nx)
+        ys = np.linspace(0.0, height, self.ny)
+        grid_x, grid_y = np.meshgrid(xs, ys)
+        latitudes, longitudes, valid = project(np.column_stack([grid_x.ravel(), grid_y.ravel()]))
+
+        latitudes = latitudes.reshape(self.ny, self.nx)
+        longitudes = longitudes.reshape(self.ny, self.nx)
+        valid = valid.reshape(self.ny, self.nx)
+        # Cella interpolabile solo se tutti e 4 i nodi sono validi...
+        cell_valid = valid[:-1, :-1] & valid[:-1, 1:] & valid[1:, :-1] & valid[1:, 1:]
+
+        # ...e se centro e punti medi dei lati interpolati coincidono (entro tolleranza)
+        # con la proiezione esatta; tutti i punti di controllo in un'unica proiezione batch
+        mid_x = (xs[:-1] + xs[1:]) / 2.0
+        mid_y = (ys[:-1] + ys[1:]) / 2.0
+        checks = [
+            # (x, y del punto di controllo, funzione di interpolazione, riduzione punto -> cella)
+            (mid_x, mid_y, self._cell_mean, lambda ok: ok),
+            (mid_x, ys, lambda grid: (grid[:, :-1] + grid[:, 1:]) / 2.0, lambda ok: ok[:-1] & ok[1:]),
+            (xs, mid_y, lambda grid: (grid[:-1] + grid[1:]) / 2.0, lambda ok: ok[:, :-1] & ok[:, 1:])
+        ]
+        check_grids = [np.meshgrid(x, y) for x, y, _, _ in checks]
+        exact_lat, exact_lon, exact_valid = project(np.concatenate([
+            np.column_stack([check_x.ravel(), check_y.ravel()]) for check_x, check_y in check_grids
+        ]))
+
+        offset = 0
+        for (_, _, interpolate, to_cells), (check_x, _) in zip(checks, check_grids):
+            shape = check_x.shape
+            span = slice(offset, offset + check_x.size)
+            offset += check_x.size
+            interp_lat = interpolate(latitudes)
+            interp_lon = interpolate(longitudes)
+            error = self.METERS_PER_DEGREE * np.hypot(
+                exact_lat[span].reshape(shape) - interp_lat,
+                (exact_lon[span].reshape(shape) - interp_lon) * np.cos(np.radians(interp_lat))
+            )
+            cell_valid &= to_cells(exact_valid[span].reshape(shape) & (error <= tolerance_meters))
+        self.cell_valid = cell_valid
+        # Griglie appiattite (indice = riga * nx + colonna)
+        self.latitudes = latitudes.ravel()
+        self.longitudes = longitudes.ravel()
+
+    @staticmethod
+    def _cell_mean(grid: np.ndarray) -> np.ndarray:
+        """Valore interpolato al centro di ogni cella (media dei 4 nodi)"""
+        return (grid[:-1, :-1] + grid[:-1, 1:] + grid[1:, :-1] + grid[1:, 1:]) / 4.0
+
+    @property
+    def coverage(self) -> float:
+        """Frazione di celle interpolabili"""
+        return float(self.cell_valid.mean())
+
+    @property
+    def nbytes(self) -> int:
+        return self.latitudes.nbytes + self.longitudes.nbytes + self.cell_valid.nbytes
+
+    def lookup(self, pixels: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Coordinate terreno per interpolazione bilineare
+
+        Args:
+            pixels: Array Nx2 di coordinate pixel (x, y)
+
+        Returns:
+            Tuple (latitudes, longitudes, found): found è False per i punti
+            fuori dal frame o in celle non interpolabili (valori da ignorare)
+        """
+        pixels = np.asarray(pixels, dtype=np.float64).reshape(-1, 2)
+        gx = pixels[:, 0] / self.step_x
+        gy = pixels[:, 1] / self.step_y
+        ix = np.clip(np.floor(gx).astype(np.int64), 0, self.nx - 2)
+        iy = np.clip(np.floor(gy).astype(np.int64), 0, self.ny - 2)
+        fx = gx - ix
+        fy = gy - iy
+
+        found = (
+            (gx >= 0) & (gx <= self.nx - 1) & (gy >= 0) & (gy <= self.ny - 1)
+            & self.cell_valid[iy, ix]
+        )
+
+        # Indici lineari dei 4 nodi, letture con np.take sulle griglie appiattite
+        i00 = iy * self.nx + ix
+        i10 = i00 + self.nx
+        results = []
+        for grid in (self.latitudes, self.longitudes):
+            top = np.take(grid, i00) * (1 - fx) + np.take(grid, i00 + 1) * fx
+            bottom = np.take(grid, i10) * (1 - fx) + np.take(grid, i10 + 1) * fx
+            results.append(top * (1 - fy) + bottom * fy)
+        return results[0], results[1], found
@@ -0,0 +1,288 @@
+"""Quota del terreno da modelli digitali locali (DEM/DTM), senza accesso di rete"""
+import os
+import re
+import numpy as np
+from collections import OrderedDict
+from threading import Lock
+from typing import Dict, List, Optional, Tuple
+from app.config import settings
+
+try:
+    import rasterio
+    RASTERIO_AVAILABLE = True
+except ImportError:
+    RASTERIO_AVAILABLE = False
+
+
+# Nome tile SRTM: N45E009.hgt = angolo sud-ovest a 45°N 9°E
+_HGT_NAME = re.compile(r'^([NS])(\d{2})([EW])(\d{3})\.hgt$', re.IGNORECASE)
+_HGT_VOID = -32768
+_GEOTIFF_EXTENSIONS = ('.tif', '.tiff')
+
+
+class _TileInfo:
+    """Tile indicizzato (dati caricati solo al primo uso)"""
+
+    __slots__ = ('path', 'kind', 'south', 'west', 'north', 'east')
+
+    def __init__(self, path: str, kind: str, south: float, west: float, north: float, east: float):
+        self.path = path
+        self.kind = kind
+        self.south = south
+        self.west = west
+        self.north = north
+        self.east = east
+
+
+class _TileData:
+    """Griglia di quote di un tile con trasformazione lat/lon -> riga/colonna"""
+
+    __slots__ = ('grid', 'north', 'west', 'row_step', 'col_step', 'nodata')
+
+    def __init__(self, grid: np.ndarray, north: float, west: float, row_step: float, col_step: float, nodata):
+        self.grid = grid  # riga 0 = bordo nord
+        self.north = north
+        self.west = west
+        self.row_step = row_step  # gradi per riga
+        self.col_step = col_step  # gradi per colonna
+        self.nodata = nodata
+
+    def sample(self, latitudes: np.ndarray, longitudes: np.ndarray) -> np.ndarray:
+        """Quote per interpolazione bilineare (NaN su celle senza dato)"""
+        rows = (self.north - latitudes) / self.row_step
+        cols = (longitudes - self.west) / self.col_step
+        height, width = self.grid.shape
+        r0 = np.clip(np.floor(rows).astype(np.int64), 0, height - 2)
+        c0 = np.clip(np.floor(cols).astype(np.int64), 0, width - 2)
+        fr = np.clip(rows - r0, 0.0, 1.0)
+        fc = np.clip(cols - c0, 0.0, 1.0)
+
+        # Lettura dei soli 4 vicini: con memmap vengono toccate solo le pagine necessarie
+        corners = [
+            self.grid[r0, c0], self.grid[r0, c0 + 1],
+            self.grid[r0 + 1, c0], self.grid[r0 + 1, c0 + 1]
+        ]
+        corners = [np.asarray(c, dtype=np.float64) for c in corners]
+        if self.nodata is not None:
+            for c in corners:
+                c[c == self.nodata] = np.nan
+
+        top = corners[0] * (1 - fc) + corners[1] * fc
+        bottom = corners[2] * (1 - fc) + corners[3] * fc
+        return top * (1 - fr) + bottom * fr
+
+
+class TerrainService:
+    """
+    Quote del terreno da tile DEM locali
+
+    Formati supportati:
+    - SRTM .hgt (griglia grezza int16 big-endian), letti via memory mapping
+    - GeoTIFF in coordinate geografiche (EPSG:4326), se rasterio è installato
+
+    La cartella viene indicizzata all'avvio (solo nomi e limiti dei tile);
+    i dati vengono aperti al primo uso e tenuti in una LRU limitata a
+    max_tiles tile. Le interrogazioni sono batch: i punti vengono raggruppati
+    per tile e ogni tile viene campionato una sola volta per chiamata.
+    """
+
+    def __init__(self, directory: str, max_tiles: Optional[int] = None):
+        """
+        Args:
+            directory: Cartella con i tile DEM
+            max_tiles: Tile tenuti aperti/decodificati (default: settings.dem_cache_tiles)
+        """
+        self.directory = directory
+        self.max_tiles = max(1, max_tiles or settings.dem_cache_tiles)
+        self._hgt_index: Dict[Tuple[int, int], _TileInfo] = {}  # (lat sud, lon ovest) -> tile
+        self._raster_index: List[_TileInfo] = []
+        self._cache: 'OrderedDict[str, _TileData]' = OrderedDict()
+        self._lock = Lock()
+
+        # Statistiche
+        self.tile_loads = 0
+        self.cache_hits = 0
+
+        self._build_index()
+
+    def _build_index(self):
+        """Indicizza i tile presenti nella cartella"""
+        if not os.path.isdir(self.directory):
+            print(f"Warning: cartella DEM non trovata: {self.directory}")
+            return
+
+        skipped_geotiff = 0
+        for name in sorted(os.listdir(self.directory)):
+            path = os.path.join(self.directory, name)
+            match = _HGT_NAME.match(name)
+            if match:
+                lat = int(match.group(2)) * (1 if match.group(1).upper() == 'N' else -1)
+                lon = int(match.group(4)) * (1 if match.group(3).upper() == 'E' else -1)
+                self._hgt_index[(lat, lon)] = _TileInfo(path, 'hgt', lat, lon, lat + 1, lon + 1)
+            elif name.lower().endswith(_GEOTIFF_EXTENSIONS):
+                if not RASTERIO_AVAILABLE:
+                    skipped_geotiff += 1
+                    continue
+                info = self._index_geotiff(path)
+                if info is not None:
+                    self._raster_index.append(info)
+
+        if skipped_geotiff:
+            print(f"Warning: rasterio non disponibile, {skipped_geotiff} GeoTIFF DEM ignorati")
+        print(f"DEM: {len(self._hgt_index)} tile .hgt, {len(self._raster_index)} GeoTIFF in {self.directory}")
+
+    @staticmethod
+    def _index_geotiff(path: str) -> Optional[_TileInfo]:
+        """Limiti di un GeoTIFF (solo metadati)"""
+        try:
+            with rasterio.open(path) as dataset:
+                if dataset.crs is not None and not dataset.crs.is_geographic:
+                    print(f"Warning: DEM {path} non in coordinate geografiche ({dataset.crs}), ignorato")
+                    return None
+                bounds = dataset.bounds
+                return _TileInfo(path, 'geotiff', bounds.bottom, bounds.left, bounds.top, bounds.right)
+        except Exception as e:
+            print(f"Warning: DEM {path} non leggibile: {e}")
+            return None
+
+    @property
+    def tile_count(self) -> int:
+        return len(self._hgt_index) + len(self._raster_index)
+
+    def _get_tile(self, info: _TileInfo) -> Optional[_TileData]:
+        """Dati del tile dalla LRU, aprendolo se necessario"""
+        with self._lock:
+            tile = self._cache.get(info.path)
+            if tile is not None:
+                self._cache.move_to_end(info.path)
+                self.cache_hits += 1
+                return tile
+
+        tile = self._load_hgt(info) if info.kind == 'hgt' else self._load_geotiff(info)
+        if tile is None:
+            return None
+
+        with self._lock:
+            self._cache[info.path] = tile
+            self._cache.move_to_end(info.path)
+            self.tile_loads += 1
+            while len(self._cache) > self.max_tiles:
+                self._cache.popitem(last=False)
+        return tile
+
+    @staticmethod
+    def _load_hgt(info: _TileInfo) -> Optional[_TileData]:
+        """Mappa in memoria un tile SRTM (quadrato, 1201 o 3601 campioni per lato)"""
+        samples = int(round((os.path.getsize(info.path) / 2) ** 0.5))
+        if samples * samples * 2 != os.path.getsize(info.path) or samples < 2:
+            print(f"Warning: tile DEM {info.path} con dimensione non valida")
+            return None
+        grid = np.memmap(info.path, dtype='>i2', mode='r', shape=(samples, samples))
+        step = 1.0 / (samples - 1)
+        return _TileData(grid, info.north, info.west, step, step, _HGT_VOID)
+
+    @staticmethod
+    def _load_geotiff(info: _TileInfo) -> Optional[_TileData]:
+        """Decodifica la prima banda di un GeoTIFF"""
+        try:
+            with rasterio.open(info.path) as dataset:
+                grid = dataset.read(1)
+                transform = dataset.transform
+                nodata = dataset.nodata
+        except Exception as e:
+            print(f"Warning: DEM {info.path} non leggibile: {e}")
+            return None
+        # Centri pixel: rasterio riferisce la trasformazione all'angolo del pixel
+        return _TileData(
+            grid,
+            transform.f + transform.e / 2.0,
+            transform.c + transform.a / 2.0,
+            -transform.e,
+            transform.a,
+            nodata
+        )
+
+    def elevations(self, latitudes: np.ndarray, longitudes: np.ndarray) -> np.ndarray:
+        """
+        Quote del terreno per N punti
+
+        Args:
+            latitudes: Array di N latitudini (gradi)
+            longitudes: Array di N longitudini (gradi)
+
+        Returns:
+            Array di N quote (metri slm), NaN dove non c'è copertura DEM
+        """
+        latitudes = np.asarray(latitudes, dtype=np.float64).reshape(-1)
+        longitudes = np.asarray(longitudes, dtype=np.float64).reshape(-1)
+        result = np.full(len(latitudes), np.nan)
+        if len(latitudes) == 0:
+            return result
+
+        pending = np.isfinite(latitudes) & np.isfinite(longitudes)
+
+        # Tile SRTM: chiave dal grado intero, un campionamento per tile
+        if self._hgt_index and pending.any():
+            keys = np.stack([np.floor(latitudes), np.floor(longitudes)], axis=1)
+            keys[~pending] = np.nan
+            unique_keys, inverse = np.unique(keys, axis=0, return_inverse=True)
+            inverse = inverse.reshape(-1)
+            for k, (lat, lon) in enumerate(unique_keys.tolist()):
+                if not np.isfinite(lat):
+                    continue
+                info = self._hgt_index.get((int(lat), int(lon)))
+                if info is None:
+                    continue
+                tile = self._get_tile(info)
+                if tile is None:
+                    continue
+                mask = inverse == k
+                result[mask] = tile.sample(latitudes[mask], longitudes[mask])
+                pending &= ~mask
+
+        # GeoTIFF: il primo che contiene il punto
+        for info in self._raster_index:
+            if not pending.any():
+                break
+            mask = pending & (
+                (latitudes >= info.south) & (latitudes <= info.north)
+                & (longitudes >= info.west) & (longitudes <= info.east)
+            )
+            if not mask.any():
+                continue
+            tile = self._get_tile(info)
+            if tile is None:
+                continue
+            result[mask] = tile.sample(latitudes[mask], longitudes[mask])
+            pending &= ~mask
+
+        return result
+
+    def elevation(self, latitude: float, longitude: float) -> Optional[float]:
+        """Quota di un singolo punto (None se non coperto)"""
+        value = self.elevations(np.array([latitude]), np.array([longitude]))[0]
+        return None if np.isnan(value) else float(value)
+
+    def get_stats(self) -> Dict[str, int]:
+        """Statistiche indice e cache tile"""
+        return {
+            'tiles_indexed': self.tile_count,
+            'tiles_cached': len(self._cache),
+            'tile_loads': self.tile_loads,
+            'cache_hits': self.cache_hits
+        }
+
+
+_terrain_service: Optional[TerrainService] = None
+_terrain_lock = Lock()
+
+
+def get_terrain_service() -> Optional[TerrainService]:
+    """Servizio terreno condiviso dal processo (None se settings.dem_directory non è configurata)"""
+    global _terrain_service
+    if not settings.dem_directory:
+        return None
+    with _terrain_lock:
+        if _terrain_service is None or _terrain_service.directory != settings.dem_directory:
+            _terrain_service = TerrainService(settings.dem_directory)
+        return _terrain_service
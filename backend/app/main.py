@@ -11,6 +11,8 @@ from app.config import settings
 from app.globals import source_manager, get_orchestrator
 from app.orchestrator import TrackingOrchestrator
 from app.auto_updater import AutoUpdater
+from app.vision.model_registry import model_registry
+import asyncio
 import os
 
 
@@ -25,6 +27,14 @@ async def lifespan(app: FastAPI):
     await orchestrator.start_async()
     print("ERMES orchestrator avviato")
     
+    # Precarica modelli in background: la prima sorgente non paga il cold-start
+    if settings.model_warmup_on_startup:
+        asyncio.get_running_loop().run_in_executor(None, model_registry.preload_default_models)
+    
+    # Processor pronti per gli stream RTMP: on_publish non attende il caricamento modelli
+    if settings.prewarmed_processor_slots > 0:
+        asyncio.get_running_loop().run_in_executor(None, orchestrator.prewarm_processors)
+    
     # Avvia auto-updater se abilitato
     from app.globals import set_auto_updater
     auto_updater = None
@@ -1,15 +1,20 @@
 """Orchestratore principale per integrazione moduli"""
 import asyncio
+import functools
 import threading
 import queue
 from typing import Dict, Optional, List, Any
 from app.sources.source_manager import SourceManager
 from app.sources import VideoSource, TelemetryData
 from app.vision.video_processor import VideoProcessor
+from app.vision.frame_hub import FrameHub, POLICY_LATEST, POLICY_ALL
+from app.vision.inference_scheduler import InferenceScheduler
+from app.vision.process_pool import ProcessPoolDetector
 from app.geolocation.georef_engine import GeolocationEngine
 from app.geolocation.camera_calibration import CameraCalibration
+from app.geolocation.terrain import get_terrain_service
 from app.api.websocket import connection_manager
-from app.config import settings
+from app.config import settings, SourceType
 
 
 class TrackingOrchestrator:
@@ -23,52 +28,233 @@ class TrackingOrchestrator:
         """
         self.source_manager = source_manager
         self.video_processors: Dict[str, VideoProcessor] = {}
+        self.frame_hubs: Dict[str, FrameHub] = {}  # un solo decode per sorgente
         self.geolocation_engines: Dict[str, GeolocationEngine] = {}
         self.running = False
         self.processing_threads: Dict[str, threading.Thread] = {}
         self.detection_queue: queue.Queue = queue.Queue()
         self.event_loop = event_loop or asyncio.get_event_loop()
+        self.inference_scheduler = None  # InferenceScheduler o ProcessPoolDetector condiviso
+        
+        # VideoProcessor pre-scaldati (modelli caricati) pronti per nuovi stream
+        self.warm_processors: List[VideoProcessor] = []
+        self._prewarming = 0  # processor in costruzione, contati nella riserva
+        self._lifecycle_lock = threading.Lock()
+        self._starting: set = set()  # sorgenti in fase di avvio (on_publish e register concorrenti)
+    
+    def _get_inference_scheduler(self):
+        """
+        Ottieni scheduler inferenza condiviso (creato al primo uso se abilitato)
+        
+        Returns:
+            ProcessPoolDetector se execution_mode == "process_pool",
+            InferenceScheduler se inference_batching_enabled, altrimenti None
+            (ogni VideoProcessor usa il proprio detector)
+        """
+        if self.inference_scheduler is None:
+            if settings.execution_mode == "process_pool":
+                self.inference_scheduler = ProcessPoolDetector()
+            elif settings.inference_batching_enabled:
+                self.inference_scheduler = InferenceScheduler()
+            else:
+                return None
+            try:
+                self.inference_scheduler.start()
+            except Exception:
+                # Nessun backend di inferenza avviabile: si ritenta al prossimo processor
+                self.inference_scheduler = None
+                raise
+        return self.inference_scheduler
+    
+    def prewarm_processors(self, count: Optional[int] = None):
+        """
+        Prepara VideoProcessor con modelli già caricati e scaldati
+        
+        Bloccante (carica i modelli): da eseguire in un thread o executor.
+        Chiamate concorrenti non superano la riserva: i processor in
+        costruzione contano come già pronti.
+        
+        Args:
+            count: Numero di processor pronti da mantenere (default: settings.prewarmed_processor_slots)
+        """
+        count = settings.prewarmed_processor_slots if count is None else count
+        while True:
+            with self._lifecycle_lock:
+                if len(self.warm_processors) + self._prewarming >= count:
+                    return
+                self._prewarming += 1
+            try:
+                processor = VideoProcessor(
+                    source_id="",
+                    on_detection_callback=self._on_detection_callback,
+                    inference_scheduler=self._get_inference_scheduler()
+                )
+            except Exception as e:
+                print(f"Warning: pre-riscaldamento processor fallito: {e}")
+                with self._lifecycle_lock:
+                    self._prewarming -= 1
+                return
+            with self._lifecycle_lock:
+                self._prewarming -= 1
+                # Ricontrollo: la riserva può essere stata riempita da un'altra chiamata
+                surplus = len(self.warm_processors) >= count
+                if not surplus:
+                    self.warm_processors.append(processor)
+            if surplus:
+                processor.close()
+                return
     
-    def start_processing_source(self, source_id: str):
-        """Avvia elaborazione per una sorgente"""
+    def _acquire_processor(self, source_id: str, **options) -> VideoProcessor:
+        """Assegna un processor pre-scaldato alla sorgente (o ne crea uno nuovo)"""
+        with self._lifecycle_lock:
+            processor = self.warm_processors.pop() if self.warm_processors else None
+        
+        if processor is None:
+            processor = VideoProcessor(
+                source_id=source_id,
+                on_detection_callback=self._on_detection_callback,
+                inference_scheduler=self._get_inference_scheduler(),
+                **options
+            )
+        else:
+            processor.configure(source_id, **options)
+        
+        # Ripristina la riserva in background per il prossimo stream
+        if settings.prewarmed_processor_slots > 0:
+            threading.Thread(target=self.prewarm_processors, daemon=True).start()
+        return processor
+    
+    def is_processing(self, source_id: str) -> bool:
+        """Verifica se una sorgente è in elaborazione (o in avvio)"""
+        with self._lifecycle_lock:
+            return source_id in self.video_processors or source_id in self._starting
+    
+    def start_processing_source(
+        self,
+        source_id: str,
+        detection_interval: Optional[int] = None,
+        motion_gate: Optional[bool] = None
+    ):
+        """
+        Avvia elaborazione per una sorgente
+        
+        Args:
+            source_id: ID sorgente
+            detection_interval: Detection completa ogni N frame (default: settings.detection_interval_frames)
+            motion_gate: Abilita motion gate (default: settings.motion_gate_enabled per telecamere fisse)
+        """
         source = self.source_manager.get_source(source_id)
         if not source or not source.is_available():
             print(f"Sorgente {source_id} non disponibile")
             return False
         
+        # Idempotente: on_publish e registrazione dell'app possono arrivare insieme
+        with self._lifecycle_lock:
+            if source_id in self.video_processors or source_id in self._starting:
+                return True
+            self._starting.add(source_id)
+        
+        try:
+            return self._start_processing_source(source, detection_interval, motion_gate)
+        finally:
+            with self._lifecycle_lock:
+                self._starting.discard(source_id)
+    
+    def _start_processing_source(
+        self,
+        source: VideoSource,
+        detection_interval: Optional[int],
+        motion_gate: Optional[bool]
+    ) -> bool:
+        """Crea pipeline (geolocalizzazione, hub, processor) per una sorgente disponibile"""
+        source_id = source.source_id
+        
         # Crea geolocation engine per questa sorgente
         calibration = CameraCalibration()
-        geoloc_engine = GeolocationEngine(calibration)
+        geoloc_engine = GeolocationEngine(calibration, terrain=get_terrain_service())
         self.geolocation_engines[source_id] = geoloc_engine
         
-        # Crea video processor
-        processor = VideoProcessor(
-            source_id=source_id,
-            on_detection_callback=self._on_detection_callback
+        if motion_gate is None:
+            motion_gate = (
+                settings.motion_gate_enabled and
+                source.source_type == SourceType.STATIC_CAMERA
+            )
+        
+        # Video processor (pre-scaldato se disponibile)
+        processor = self._acquire_processor(
+            source_id,
+            detection_interval=detection_interval,
+            motion_gate=motion_gate,
+            tiled_inference=source.source_type in settings.tiled_inference_source_types,
+            adaptive_latency=settings.adaptive_latency_enabled
         )
         
         try:
-            # Ottieni stream video dalla sorgente
+            # Ottieni stream video dalla sorgente: decodificato una volta dall'hub
             video_stream = source.get_video_stream()
-            processor.start_processing(video_stream)
+            hub = FrameHub(source_id, video_stream)
+            hub.start()
+            self.frame_hubs[source_id] = hub
+            
+            # Analisi sul frame più recente per stream live, su tutti i frame per file video
+            policy = POLICY_LATEST if hub.is_live and settings.video_grab_latest_frame else POLICY_ALL
+            processor.start_processing(hub.subscribe("analysis", policy=policy))
             
-            self.video_processors[source_id] = processor
+            with self._lifecycle_lock:
+                self.video_processors[source_id] = processor
             print(f"Elaborazione avviata per sorgente {source_id}")
             return True
         except Exception as e:
             print(f"Errore avvio elaborazione {source_id}: {e}")
+            hub = self.frame_hubs.pop(source_id, None)
+            if hub:
+                hub.stop()
+            processor.stop_processing()
+            processor.close()
             return False
     
+    def get_frame_hub(self, source_id: str) -> Optional[FrameHub]:
+        """
+        Hub frame di una sorgente in elaborazione
+        
+        Consumatori aggiuntivi (anteprima, registrazione) si sottoscrivono
+        all'hub invece di aprire un nuovo stream: nessun decode in più.
+        """
+        return self.frame_hubs.get(source_id)
+    
     def stop_processing_source(self, source_id: str):
         """Ferma elaborazione per una sorgente"""
-        if source_id in self.video_processors:
-            processor = self.video_processors[source_id]
+        with self._lifecycle_lock:
+            processor = self.video_processors.pop(source_id, None)
+        if processor:
             processor.stop_processing()
-            del self.video_processors[source_id]
+            processor.close()
+        
+        if source_id in self.frame_hubs:
+            self.frame_hubs.pop(source_id).stop()
         
         if source_id in self.geolocation_engines:
             del self.geolocation_engines[source_id]
     
+    def get_pipeline_stats(self) -> Dict[str, Any]:
+        """
+        Statistiche pipeline per sorgente (decisioni controllo latenza, grabber, motion gate)
+        e dello scheduler di inferenza condiviso
+        """
+        return {
+            'sources': {
+                source_id: processor.get_stats()
+                for source_id, processor in list(self.video_processors.items())
+            },
+            'frame_hubs': {
+                source_id: hub.get_stats()
+                for source_id, hub in list(self.frame_hubs.items())
+            },
+            'inference_scheduler': (
+                self.inference_scheduler.get_stats() if self.inference_scheduler else None
+            )
+        }
+    
     def _on_detection_callback(
         self,
         source_id: str,
@@ -80,7 +266,8 @@ class TrackingOrchestrator:
         try:
             self.detection_queue.put_nowait({
                 'source_id': source_id,
-                'detections': detections
+                'detections': detections,
+                'frame_size': (frame.shape[1], frame.shape[0])
             })
         except queue.Full:
             print(f"Coda detection piena, detection persa per {source_id}")
@@ -128,12 +315,17 @@ class TrackingOrchestrator:
                 if not telemetry:
                     continue
                 
-                # Geolocalizza detection
-                geoloc_engine = self.geolocation_engines[source_id]
-                geolocated = geoloc_engine.geolocate_detections(
-                    detections,
-                    telemetry,
-                    ground_altitude=0.0  # TODO: Calcolare da DTM o configurazione
+                # Geolocalizza detection in un thread: proiezione, DEM e costruzione della
+                # tabella per camere fisse non devono bloccare l'event loop (WebSocket)
+                geolocated = await asyncio.get_event_loop().run_in_executor(
+                    None,
+                    functools.partial(
+                        self._geolocate,
+                        self.geolocation_engines[source_id],
+                        detections,
+                        telemetry,
+                        item['frame_size']
+                    )
                 )
                 
                 # Invia via WebSocket
@@ -144,6 +336,38 @@ class TrackingOrchestrator:
             except Exception as e:
                 print(f"Errore processamento detection: {e}")
     
+    @staticmethod
+    def _geolocate(
+        geoloc_engine: GeolocationEngine,
+        detections: List[Dict[str, Any]],
+        telemetry: TelemetryData,
+        frame_size: tuple
+    ) -> List[Dict[str, Any]]:
+        """
+        Geolocalizza le detection di un frame (eseguito fuori dall'event loop)
+        
+        Args:
+            geoloc_engine: Engine della sorgente
+            detections: Detection del frame
+            telemetry: Telemetria corrente della sorgente
+            frame_size: (larghezza, altezza) del frame elaborato
+        
+        Returns:
+            Detection con coordinate geografiche
+        """
+        # Coordinate pixel riferite al frame elaborato (può essere ridimensionato da ffmpeg)
+        frame_width, frame_height = frame_size
+        calibration = geoloc_engine.calibration
+        if (calibration.resolution_width, calibration.resolution_height) != (frame_width, frame_height):
+            calibration.set_resolution(frame_width, frame_height)
+        
+        return geoloc_engine.geolocate_detections(
+            detections,
+            telemetry,
+            ground_altitude=None,  # quota dal DEM (settings.dem_directory) o default
+            in_place=True  # detection del solo frame corrente, non condivise
+        )
+    
     async def broadcast_telemetry_loop(self):
         """Loop per broadcast periodico telemetria sorgenti"""
         while self.running:
@@ -188,4 +412,12 @@ class TrackingOrchestrator:
         # Ferma tutti i processor
         for source_id in list(self.video_processors.keys()):
             self.stop_processing_source(source_id)
+        with self._lifecycle_lock:
+            warm_processors, self.warm_processors = self.warm_processors, []
+        for processor in warm_processors:
+            processor.close()
+        
+        if self.inference_scheduler:
+            self.inference_scheduler.stop()
+            self.inference_scheduler = None
 
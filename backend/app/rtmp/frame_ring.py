@@ -0,0 +1,121 @@
+"""Anello di buffer frame preallocati (nessuna allocazione per frame)"""
+import numpy as np
+from collections import deque
+from threading import Condition
+from typing import Optional, Tuple, Dict, Any
+
+
+class FrameRing:
+    """
+    Insieme fisso di buffer frame riutilizzati tra produttore e consumatori
+
+    Ogni slot è in uno di tre stati: libero, pronto (scritto e non ancora
+    letto) oppure in prestito a un consumatore. Il produttore scrive in uno
+    slot libero; se non ce ne sono riusa lo slot pronto più vecchio (frame
+    scartato). I consumatori prendono in prestito lo slot pronto più vecchio
+    e lo restituiscono con release(). La memoria resta num_slots * frame_bytes.
+    """
+
+    def __init__(self, num_slots: int, frame_shape: Tuple[int, ...]):
+        """
+        Args:
+            num_slots: Numero di buffer (almeno 2: uno in scrittura, uno in lettura)
+            frame_shape: Shape dei frame (height, width, 3)
+        """
+        self.num_slots = max(2, num_slots)
+        self.frame_shape = tuple(frame_shape)
+        self.buffers = [np.empty(self.frame_shape, dtype=np.uint8) for _ in range(self.num_slots)]
+        self.capture_times = [0.0] * self.num_slots
+
+        self._free = deque(range(self.num_slots))
+        self._ready: deque = deque()
+        self._borrowed = set()
+        self.condition = Condition()
+        self.closed = False
+
+        # Statistiche
+        self.frames_written = 0
+        self.frames_dropped = 0
+
+    @property
+    def frame_bytes(self) -> int:
+        return self.buffers[0].nbytes
+
+    def acquire_write(self) -> Optional[int]:
+        """
+        Ottieni uno slot in cui scrivere il prossimo frame
+
+        Returns:
+            Indice slot, o None se tutti gli slot sono in prestito ai consumatori
+        """
+        with self.condition:
+            if self._free:
+                return self._free.popleft()
+            if self._ready:
+                # Consumatori in ritardo: sovrascrivi il frame pronto più vecchio
+                self.frames_dropped += 1
+                return self._ready.popleft()
+            return None
+
+    def commit(self, slot: int, capture_time: float):
+        """Pubblica uno slot scritto come frame pronto"""
+        with self.condition:
+            self.capture_times[slot] = capture_time
+            self._ready.append(slot)
+            self.frames_written += 1
+            self.condition.notify()
+
+    def cancel(self, slot: int):
+        """Restituisce uno slot acquisito per la scrittura senza pubblicarlo"""
+        with self.condition:
+            self._free.append(slot)
+
+    def mark_dropped(self):
+        """Conta un frame scartato dal produttore senza essere scritto (nessuno slot disponibile)"""
+        with self.condition:
+            self.frames_dropped += 1
+
+    def borrow(self, timeout: Optional[float] = None) -> Optional[int]:
+        """
+        Prendi in prestito il frame pronto più vecchio
+
+        Args:
+            timeout: Attesa massima (secondi) per un frame pronto
+
+        Returns:
+            Indice slot (da restituire con release), o None se nessun frame entro il timeout
+        """
+        with self.condition:
+            if not self._ready and not self.closed:
+                self.condition.wait_for(lambda: self._ready or self.closed, timeout=timeout)
+            if not self._ready:
+                return None
+            slot = self._ready.popleft()
+            self._borrowed.add(slot)
+            return slot
+
+    def release(self, slot: int):
+        """Restituisce uno slot preso in prestito"""
+        with self.condition:
+            if slot in self._borrowed:
+                self._borrowed.discard(slot)
+                self._free.append(slot)
+
+    def close(self):
+        """Sblocca i consumatori in attesa"""
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Statistiche anello"""
+        with self.condition:
+            return {
+                'slots': self.num_slots,
+                'frame_bytes': self.frame_bytes,
+                'memory_bytes': self.frame_bytes * self.num_slots,
+                'ready': len(self._ready),
+                'borrowed': len(self._borrowed),
+                'frames_written': self.frames_written,
+                'frames_dropped': self.frames_dropped
+            }
@@ -0,0 +1,235 @@
+"""Ricevitore RTMP con decoder in-process PyAV (nessun subprocess, PTS per frame)"""
+import time
+import threading
+from collections import deque
+from typing import Optional, Callable, Dict, Any
+import logging
+import numpy as np
+from app.rtmp.rtmp_receiver import compute_output_size
+from app.vision.frames import timestamp_frame
+from app.config import settings
+
+try:
+    import av
+    PYAV_AVAILABLE = True
+except ImportError:
+    PYAV_AVAILABLE = False
+
+try:
+    import cv2
+    OPENCV_AVAILABLE = True
+except ImportError:
+    OPENCV_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+
+class PyAVStreamReceiver:
+    """
+    Riceve stream RTMP decodificando nel processo con PyAV
+
+    Rispetto a RTMPStreamReceiver evita il subprocess ffmpeg e la copia del
+    frame attraverso la pipe. Il decoder usa thread multipli (thread_type
+    AUTO), la conversione a BGR avviene solo se il frame non lo è già
+    (insieme all'eventuale ridimensionamento, in un solo passaggio swscale).
+    Ogni frame porta pts (secondi di stream) e capture_time (orologio di sistema).
+    Stesso contratto read_frame() di RTMPStreamReceiver.
+    """
+
+    def __init__(
+        self,
+        rtmp_url: str,
+        on_frame_callback: Optional[Callable] = None,
+        output_max_side: Optional[int] = None,
+        output_fps: Optional[float] = None
+    ):
+        """
+        Args:
+            rtmp_url: URL stream RTMP (es. rtmp://localhost:1935/stream/source_id)
+            on_frame_callback: Callback chiamato per ogni frame ricevuto
+            output_max_side: Lato lungo massimo frame in uscita (default: settings.rtmp_output_max_side)
+            output_fps: Frame rate massimo in uscita (default: settings.rtmp_output_fps)
+        """
+        if not PYAV_AVAILABLE:
+            raise ImportError("PyAV non disponibile. Installa con: pip install av")
+
+        self.rtmp_url = rtmp_url
+        self.on_frame_callback = on_frame_callback
+        self.output_max_side = output_max_side or settings.rtmp_output_max_side
+        self.output_fps = output_fps or settings.rtmp_output_fps
+        self.container = None
+        self.is_running = False
+        self.thread: Optional[threading.Thread] = None
+
+        # Geometria nota dopo l'apertura dello stream
+        self.source_width: Optional[int] = None
+        self.source_height: Optional[int] = None
+        self.source_fps: Optional[float] = None
+        self.width: Optional[int] = None
+        self.height: Optional[int] = None
+        self._scaled_size: Optional[tuple] = None  # dimensioni dopo swscale, prima della rotazione
+
+        # Ultimi frame decodificati (memoria limitata: i più vecchi vengono scartati)
+        self._frames: deque = deque(maxlen=max(1, settings.rtmp_frame_ring_slots))
+        self.condition = threading.Condition()
+        self._next_pts: Optional[float] = None  # PTS del prossimo frame da tenere
+
+        # Statistiche
+        self.frames_decoded = 0
+        self.frames_decimated = 0
+        self.frames_dropped = 0
+        self.frames_converted = 0
+
+    def start(self):
+        """Avvia ricezione stream (apertura e decode nel thread dedicato)"""
+        if self.is_running:
+            return
+
+        self.is_running = True
+        self.thread = threading.Thread(target=self._decode_loop, daemon=True)
+        self.thread.start()
+        logger.info(f"PyAV stream receiver avviato per {self.rtmp_url}")
+
+    def stop(self):
+        """Ferma ricezione stream"""
+        self.is_running = False
+        with self.condition:
+            self.condition.notify_all()
+        if self.thread:
+            self.thread.join(timeout=2.0)
+            self.thread = None
+
+    def _open(self):
+        """Apre lo stream e configura il decoder"""
+        timeout = settings.rtmp_probe_timeout_seconds
+        self.container = av.open(
+            self.rtmp_url,
+            options={'fflags': 'nobuffer', 'flags': 'low_delay'},
+            timeout=(timeout, timeout)
+        )
+        stream = self.container.streams.video[0]
+        stream.thread_type = 'AUTO'  # decode multi-thread (frame + slice)
+
+        self.source_width = stream.codec_context.width
+        self.source_height = stream.codec_context.height
+        rate = stream.average_rate or stream.guessed_rate
+        self.source_fps = float(rate) if rate else None
+        self._scaled_size = compute_output_size(
+            self.source_width, self.source_height, self.output_max_side
+        )
+        self.width, self.height = self._scaled_size
+        logger.info(
+            f"Stream {self.rtmp_url}: {self.source_width}x{self.source_height} -> "
+            f"{self.width}x{self.height}" + (f" @ {self.output_fps} fps" if self.output_fps else "")
+        )
+        return stream
+
+    def _decode_loop(self):
+        """Decodifica pacchetti e pubblica i frame convertiti"""
+        try:
+            stream = self._open()
+            for av_frame in self.container.decode(stream):
+                if not self.is_running:
+                    break
+                capture_time = time.time()
+                self.frames_decoded += 1
+
+                pts = None
+                if av_frame.pts is not None and av_frame.time_base:
+                    pts = float(av_frame.pts * av_frame.time_base)
+                if self._decimate(pts):
+                    self.frames_decimated += 1
+                    continue
+
+                frame = timestamp_frame(self._to_bgr(av_frame), capture_time, pts)
+
+                if self.on_frame_callback:
+                    self.on_frame_callback(frame)
+                    continue
+
+                with self.condition:
+                    if len(self._frames) == self._frames.maxlen:
+                        self.frames_dropped += 1
+                    self._frames.append(frame)
+                    self.condition.notify()
+        except Exception as e:
+            if self.is_running:
+                logger.error(f"Errore decode stream {self.rtmp_url}: {e}")
+        finally:
+            self.is_running = False
+            if self.container is not None:
+                self.container.close()
+                self.container = None
+            with self.condition:
+                self.condition.notify_all()
+
+    def _decimate(self, pts: Optional[float]) -> bool:
+        """Scarta il frame se arriva prima del prossimo istante della cadenza output_fps (in base al PTS)"""
+        if not self.output_fps or pts is None:
+            return False
+        period = 1.0 / self.output_fps
+        if self._next_pts is not None and self._next_pts - period <= pts < self._next_pts:
+            return True
+        if self._next_pts is not None and 0 <= pts - self._next_pts < period:
+            self._next_pts += period  # cadenza regolare, senza deriva
+        else:
+            # Primo frame, salto in avanti o PTS all'indietro (stream riavviato): riparti da qui
+            self._next_pts = pts + period
+        return False
+
+    def _to_bgr(self, av_frame) -> np.ndarray:
+        """Converte in BGR (solo se necessario), ridimensionando nello stesso passaggio"""
+        width, height = self._scaled_size
+        if av_frame.format.name == 'bgr24' and (av_frame.width, av_frame.height) == (width, height):
+            image = av_frame.to_ndarray()
+        else:
+            self.frames_converted += 1
+            image = av_frame.reformat(width=width, height=height, format='bgr24').to_ndarray()
+
+        # Video verticale da telefono: PyAV non applica la rotazione dichiarata
+        rotation = int(getattr(av_frame, 'rotation', 0) or 0) % 360
+        if rotation and OPENCV_AVAILABLE:
+            codes = {
+                90: cv2.ROTATE_90_COUNTERCLOCKWISE,
+                180: cv2.ROTATE_180,
+                270: cv2.ROTATE_90_CLOCKWISE
+            }
+            if rotation in codes:
+                image = cv2.rotate(image, codes[rotation])
+                self.height, self.width = image.shape[:2]
+        return image
+
+    def read_frame(self) -> Optional[np.ndarray]:
+        """
+        Legge il frame più vecchio non ancora letto
+
+        Returns:
+            Frame come numpy array (BGR) con attributi pts e capture_time, o None se non disponibile
+        """
+        with self.condition:
+            if not self._frames and self.is_running:
+                self.condition.wait_for(lambda: self._frames or not self.is_running, timeout=1.0)
+            if not self._frames:
+                return None
+            return self._frames.popleft()
+
+    def release_frame(self):
+        """Compatibilità con RTMPStreamReceiver: i frame PyAV non sono in prestito"""
+        pass
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Statistiche ricezione"""
+        return {
+            'backend': 'pyav',
+            'is_running': self.is_running,
+            'source_width': self.source_width,
+            'source_height': self.source_height,
+            'source_fps': self.source_fps,
+            'width': self.width,
+            'height': self.height,
+            'output_fps': self.output_fps,
+            'frames_decoded': self.frames_decoded,
+            'frames_decimated': self.frames_decimated,
+            'frames_dropped': self.frames_dropped,
+            'frames_converted': self.frames_converted
+        }
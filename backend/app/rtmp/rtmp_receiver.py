@@ -1,68 +1,150 @@
 """Ricevitore RTMP stream e conversione a OpenCV VideoCapture"""
+import json
 import subprocess
 import threading
-import queue
+import time
 import cv2
 import numpy as np
-from typing import Optional, Callable
+from typing import Optional, Callable, Dict, Any, Tuple
 import logging
+from app.rtmp.frame_ring import FrameRing
+from app.vision.frames import timestamp_frame
+from app.config import settings
 
 logger = logging.getLogger(__name__)
 
 
+def probe_stream(url: str, timeout: float) -> Optional[Tuple[int, int, Optional[float]]]:
+    """
+    Legge geometria e frame rate reali dello stream video con ffprobe
+    
+    La rotazione dichiarata (video verticale da telefono) è applicata:
+    ffmpeg ruota automaticamente i frame, quindi larghezza e altezza
+    vengono scambiate per rotazioni di 90/270 gradi.
+    
+    Args:
+        url: URL stream
+        timeout: Attesa massima (secondi)
+    
+    Returns:
+        Tuple (width, height, fps) o None se il probe fallisce
+    """
+    cmd = [
+        'ffprobe',
+        '-v', 'error',
+        '-select_streams', 'v:0',
+        '-show_streams',
+        '-of', 'json',
+        url
+    ]
+    try:
+        result = subprocess.run(cmd, capture_output=True, timeout=timeout)
+        streams = json.loads(result.stdout or b'{}').get('streams', [])
+    except (subprocess.TimeoutExpired, OSError, ValueError) as e:
+        logger.warning(f"Probe stream {url} fallito: {e}")
+        return None
+    
+    if not streams or not streams[0].get('width') or not streams[0].get('height'):
+        return None
+    
+    stream = streams[0]
+    width, height = int(stream['width']), int(stream['height'])
+    
+    rotation = stream.get('tags', {}).get('rotate')
+    for side_data in stream.get('side_data_list', []):
+        if 'rotation' in side_data:
+            rotation = side_data['rotation']
+    try:
+        if int(float(rotation or 0)) % 180 != 0:
+            width, height = height, width
+    except ValueError:
+        pass
+    
+    fps = None
+    for key in ('avg_frame_rate', 'r_frame_rate'):
+        num, _, den = str(stream.get(key, '0/0')).partition('/')
+        try:
+            if float(den or 1) > 0 and float(num) > 0:
+                fps = float(num) / float(den or 1)
+                break
+        except ValueError:
+            continue
+    
+    return width, height, fps
+
+
+def compute_output_size(width: int, height: int, max_side: Optional[int]) -> Tuple[int, int]:
+    """
+    Dimensioni di uscita dopo il ridimensionamento (mai ingrandimento)
+    
+    Args:
+        width: Larghezza sorgente
+        height: Altezza sorgente
+        max_side: Lato lungo massimo (None = nessun ridimensionamento)
+    
+    Returns:
+        Tuple (width, height) pari (richiesto dai formati yuv)
+    """
+    if not max_side or max(width, height) <= max_side:
+        return width, height
+    scale = max_side / max(width, height)
+    out_width = max(2, int(round(width * scale / 2.0)) * 2)
+    out_height = max(2, int(round(height * scale / 2.0)) * 2)
+    return out_width, out_height
+
+
 class RTMPStreamReceiver:
     """
     Riceve stream RTMP e li converte in frame OpenCV
     
-    Usa ffmpeg per ricevere stream RTMP e convertirli in frame
+    Usa ffmpeg per ricevere stream RTMP e convertirli in frame.
+    La geometria è letta dallo stream con ffprobe; ridimensionamento e
+    riduzione del frame rate sono fatti da ffmpeg prima della pipe.
+    I frame sono letti con readinto in un FrameRing preallocato: nessuna
+    allocazione per frame e memoria costante per stream.
     """
     
-    def __init__(self, rtmp_url: str, on_frame_callback: Optional[Callable] = None):
+    def __init__(
+        self,
+        rtmp_url: str,
+        on_frame_callback: Optional[Callable] = None,
+        output_max_side: Optional[int] = None,
+        output_fps: Optional[float] = None
+    ):
         """
         Args:
             rtmp_url: URL stream RTMP (es. rtmp://localhost:1935/stream/source_id)
             on_frame_callback: Callback chiamato per ogni frame ricevuto
+            output_max_side: Lato lungo massimo frame in uscita (default: settings.rtmp_output_max_side)
+            output_fps: Frame rate massimo in uscita (default: settings.rtmp_output_fps)
         """
         self.rtmp_url = rtmp_url
         self.on_frame_callback = on_frame_callback
+        self.output_max_side = output_max_side or settings.rtmp_output_max_side
+        self.output_fps = output_fps or settings.rtmp_output_fps
         self.ffmpeg_process: Optional[subprocess.Popen] = None
         self.is_running = False
-        self.frame_queue = queue.Queue(maxsize=10)
         self.thread: Optional[threading.Thread] = None
+        
+        # Geometria nota solo dopo il probe (nel thread di lettura)
+        self.source_width: Optional[int] = None
+        self.source_height: Optional[int] = None
+        self.source_fps: Optional[float] = None
+        self.width: Optional[int] = None
+        self.height: Optional[int] = None
+        self.frame_ring: Optional[FrameRing] = None
+        self._ring_ready = threading.Event()
+        self._leased_slot: Optional[int] = None  # slot restituito al prossimo read_frame
     
     def start(self):
-        """Avvia ricezione stream RTMP"""
+        """Avvia ricezione stream RTMP (probe e avvio ffmpeg nel thread di lettura)"""
         if self.is_running:
             return
         
         self.is_running = True
-        
-        # Comando ffmpeg per ricevere RTMP e convertire in raw video
-        cmd = [
-            'ffmpeg',
-            '-i', self.rtmp_url,
-            '-f', 'rawvideo',
-            '-pix_fmt', 'bgr24',
-            '-vcodec', 'rawvideo',
-            '-'  # Output su stdout
-        ]
-        
-        try:
-            self.ffmpeg_process = subprocess.Popen(
-                cmd,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                bufsize=10**8
-            )
-            
-            # Avvia thread per leggere frame
-            self.thread = threading.Thread(target=self._read_frames, daemon=True)
-            self.thread.start()
-            
-            logger.info(f"RTMP stream receiver avviato per {self.rtmp_url}")
-        except Exception as e:
-            logger.error(f"Errore avvio RTMP receiver: {e}")
-            self.is_running = False
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+        logger.info(f"RTMP stream receiver avviato per {self.rtmp_url}")
     
     def stop(self):
         """Ferma ricezione stream"""
@@ -76,56 +158,206 @@ class RTMPStreamReceiver:
                 self.ffmpeg_process.kill()
             self.ffmpeg_process = None
         
+        if self.frame_ring:
+            self.frame_ring.close()
+        self._ring_ready.set()
         if self.thread:
             self.thread.join(timeout=2.0)
     
+    def _run(self):
+        """Thread di lettura: apre lo stream e legge i frame fino al termine"""
+        try:
+            if self._open_stream():
+                self._read_frames()
+        except Exception as e:
+            logger.error(f"Errore avvio RTMP receiver: {e}")
+        finally:
+            self.is_running = False
+            if self.frame_ring:
+                self.frame_ring.close()
+            self._ring_ready.set()
+    
+    def _open_stream(self) -> bool:
+        """Rileva geometria, prepara il FrameRing e avvia ffmpeg con scala/fps richiesti"""
+        geometry = probe_stream(self.rtmp_url, settings.rtmp_probe_timeout_seconds)
+        if geometry is None:
+            logger.warning(
+                f"Geometria stream {self.rtmp_url} non rilevata, uso "
+                f"{settings.camera_resolution_width}x{settings.camera_resolution_height}"
+            )
+            geometry = (settings.camera_resolution_width, settings.camera_resolution_height, None)
+        self.source_width, self.source_height, self.source_fps = geometry
+        self.width, self.height = compute_output_size(self.source_width, self.source_height, self.output_max_side)
+        
+        if not self.is_running:
+            return False  # Fermato durante il probe
+        
+        filters = []
+        if (self.width, self.height) != (self.source_width, self.source_height):
+            filters.append(f"scale={self.width}:{self.height}:flags=area")
+        if self.output_fps and (self.source_fps is None or self.output_fps < self.source_fps):
+            filters.append(f"fps={self.output_fps}")
+        
+        # Comando ffmpeg per ricevere RTMP e convertire in raw video
+        cmd = ['ffmpeg', '-loglevel', 'error', '-i', self.rtmp_url]
+        if filters:
+            cmd += ['-vf', ','.join(filters)]
+        cmd += [
+            '-f', 'rawvideo',
+            '-pix_fmt', 'bgr24',
+            '-vcodec', 'rawvideo',
+            '-'  # Output su stdout
+        ]
+        
+        self.frame_ring = FrameRing(settings.rtmp_frame_ring_slots, (self.height, self.width, 3))
+        self.ffmpeg_process = subprocess.Popen(
+            cmd,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            bufsize=0  # stdout non bufferizzato: readinto scrive direttamente nello slot
+        )
+        # stderr va svuotato di continuo, altrimenti a pipe piena ffmpeg si blocca
+        threading.Thread(target=self._drain_stderr, args=(self.ffmpeg_process.stderr,), daemon=True).start()
+        self._ring_ready.set()
+        logger.info(
+            f"Stream {self.rtmp_url}: {self.source_width}x{self.source_height} -> "
+            f"{self.width}x{self.height}" + (f" @ {self.output_fps} fps" if self.output_fps else "")
+        )
+        return True
+    
+    def _drain_stderr(self, stderr):
+        """Legge i messaggi di ffmpeg (solo errori, vedi -loglevel) e li inoltra al log"""
+        for line in iter(stderr.readline, b''):
+            message = line.decode('utf-8', errors='replace').strip()
+            if message:
+                logger.warning(f"ffmpeg {self.rtmp_url}: {message}")
+        stderr.close()
+    
+    def _read_exact(self, stdout, view: memoryview) -> bool:
+        """Riempie completamente il buffer dalla pipe (False se lo stream termina)"""
+        filled = 0
+        total = len(view)
+        while filled < total:
+            count = stdout.readinto(view[filled:])
+            if not count:
+                return False
+            filled += count
+        return True
+    
     def _read_frames(self):
-        """Legge frame da ffmpeg stdout"""
-        # Assumiamo risoluzione 1920x1080 (modificare se necessario)
-        width, height = 1920, 1080
-        frame_size = width * height * 3  # BGR24 = 3 bytes per pixel
+        """Legge frame da ffmpeg stdout direttamente nei buffer del FrameRing"""
+        ring = self.frame_ring
+        stdout = self.ffmpeg_process.stdout
+        # Buffer di scarto per tenere drenata la pipe quando tutti gli slot sono in prestito
+        scratch = None
         
         while self.is_running and self.ffmpeg_process:
             try:
-                raw_frame = self.ffmpeg_process.stdout.read(frame_size)
+                slot = ring.acquire_write()
+                if slot is None:
+                    if scratch is None:
+                        scratch = np.empty(ring.frame_shape, dtype=np.uint8)
+                    if not self._read_exact(stdout, memoryview(scratch).cast('B')):
+                        break  # Stream terminato
+                    ring.mark_dropped()
+                    continue
                 
-                if len(raw_frame) != frame_size:
+                if not self._read_exact(stdout, memoryview(ring.buffers[slot]).cast('B')):
+                    ring.cancel(slot)
                     break  # Stream terminato
                 
-                # Converti bytes a numpy array
-                frame = np.frombuffer(raw_frame, dtype=np.uint8)
-                frame = frame.reshape((height, width, 3))
+                ring.commit(slot, time.time())
                 
-                # Aggiungi a coda o chiama callback
+                # Callback: lo slot resta in prestito solo per la durata della chiamata
                 if self.on_frame_callback:
-                    self.on_frame_callback(frame)
-                else:
-                    try:
-                        self.frame_queue.put_nowait(frame)
-                    except queue.Full:
-                        # Rimuovi frame più vecchio
+                    borrowed = self.borrow_frame(timeout=0)
+                    if borrowed is not None:
+                        frame, borrowed_slot = borrowed
                         try:
-                            self.frame_queue.get_nowait()
-                            self.frame_queue.put_nowait(frame)
-                        except queue.Empty:
-                            pass
+                            self.on_frame_callback(frame)
+                        finally:
+                            self.release_slot(borrowed_slot)
             except Exception as e:
                 logger.error(f"Errore lettura frame: {e}")
                 break
+    
+    def borrow_frame(self, timeout: float = 1.0) -> Optional[Tuple[np.ndarray, int]]:
+        """
+        Prende in prestito il frame pronto più vecchio come vista sullo slot
         
-        self.is_running = False
+        Returns:
+            Tuple (frame, slot) con slot da restituire con release_slot(), o None
+        """
+        if self.frame_ring is None:
+            # Probe ancora in corso
+            self._ring_ready.wait(timeout=timeout)
+            if self.frame_ring is None:
+                return None
+        slot = self.frame_ring.borrow(timeout=timeout)
+        if slot is None:
+            return None
+        frame = timestamp_frame(self.frame_ring.buffers[slot], self.frame_ring.capture_times[slot])
+        return frame, slot
+    
+    def release_slot(self, slot: int):
+        """Restituisce al ring uno slot ottenuto con borrow_frame()"""
+        self.frame_ring.release(slot)
     
     def read_frame(self) -> Optional[np.ndarray]:
         """
-        Legge un frame dalla coda
+        Legge il prossimo frame dal ring
+        
+        Il frame è una vista sul buffer preallocato, valida fino alla chiamata
+        successiva di read_frame() o release_frame(): chi deve conservarlo
+        oltre deve copiarlo.
         
         Returns:
             Frame come numpy array (BGR) o None se non disponibile
         """
-        try:
-            return self.frame_queue.get(timeout=1.0)
-        except queue.Empty:
+        self.release_frame()
+        borrowed = self.borrow_frame(timeout=1.0)
+        if borrowed is None:
             return None
+        frame, self._leased_slot = borrowed
+        return frame
+    
+    def release_frame(self):
+        """Restituisce al ring lo slot dell'ultimo frame letto"""
+        if self._leased_slot is not None:
+            self.release_slot(self._leased_slot)
+            self._leased_slot = None
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """Statistiche ricezione"""
+        return {
+            'is_running': self.is_running,
+            'source_width': self.source_width,
+            'source_height': self.source_height,
+            'source_fps': self.source_fps,
+            'width': self.width,
+            'height': self.height,
+            'output_fps': self.output_fps,
+            'frame_ring': self.frame_ring.get_stats() if self.frame_ring else None
+        }
+
+
+def create_stream_receiver(rtmp_url: str, on_frame_callback: Optional[Callable] = None):
+    """
+    Crea il ricevitore stream secondo settings.rtmp_decoder_backend
+    
+    Args:
+        rtmp_url: URL stream RTMP
+        on_frame_callback: Callback chiamato per ogni frame ricevuto
+    
+    Returns:
+        PyAVStreamReceiver se backend "pyav" e PyAV è installato, altrimenti RTMPStreamReceiver
+    """
+    if settings.rtmp_decoder_backend == "pyav":
+        from app.rtmp.pyav_receiver import PyAVStreamReceiver, PYAV_AVAILABLE
+        if PYAV_AVAILABLE:
+            return PyAVStreamReceiver(rtmp_url, on_frame_callback)
+        logger.warning("PyAV non installato, uso decoder ffmpeg. Installa con: pip install av")
+    return RTMPStreamReceiver(rtmp_url, on_frame_callback)
 
 
 def create_video_capture_from_rtmp(rtmp_url: str):
@@ -136,9 +368,8 @@ def create_video_capture_from_rtmp(rtmp_url: str):
         rtmp_url: URL stream RTMP
     
     Returns:
-        RTMPStreamReceiver configurato come VideoCapture-like object
+        Ricevitore stream (vedi create_stream_receiver) già avviato
     """
-    receiver = RTMPStreamReceiver(rtmp_url)
+    receiver = create_stream_receiver(rtmp_url)
     receiver.start()
     return receiver
-
@@ -51,8 +51,8 @@ class MobilePhoneSource(VideoSource):
         
         # Se è un URL RTMP, usa il receiver RTMP
         if self.video_url.startswith("rtmp://"):
-            from app.rtmp.rtmp_receiver import RTMPStreamReceiver
-            receiver = RTMPStreamReceiver(self.video_url)
+            from app.rtmp.rtmp_receiver import create_stream_receiver
+            receiver = create_stream_receiver(self.video_url)
             receiver.start()
             return receiver
         else:
@@ -1,4 +1,5 @@
 """Implementazione sorgente telecamera fissa (piazza/strada)"""
+import copy
 from datetime import datetime
 from typing import Optional
 from app.sources import VideoSource, TelemetryData
@@ -6,7 +7,19 @@ from app.config import SourceType
 
 
 class StaticCameraSource(VideoSource):
-    """Sorgente video/telemetria per telecamere fisse"""
+    """
+    Sorgente video/telemetria per telecamere fisse
+    
+    La posa è costante: la telemetria viene creata una volta e riusata finché
+    non cambia un parametro di posa (posizione, tilt, pan, FOV); ogni lettura
+    ne restituisce una copia con il timestamp corrente.
+    """
+    
+    # Parametri che invalidano la telemetria in cache
+    _POSE_FIELDS = frozenset({
+        'latitude', 'longitude', 'altitude', 'camera_tilt', 'camera_pan',
+        'camera_fov_horizontal', 'camera_fov_vertical'
+    })
     
     def __init__(
         self,
@@ -31,6 +44,7 @@ class StaticCameraSource(VideoSource):
             camera_fov_vertical: Campo visivo verticale (gradi)
         """
         super().__init__(source_id, SourceType.STATIC_CAMERA)
+        self._telemetry: Optional[TelemetryData] = None
         self.latitude = latitude
         self.longitude = longitude
         self.altitude = altitude
@@ -40,6 +54,11 @@ class StaticCameraSource(VideoSource):
         self.camera_fov_vertical = camera_fov_vertical
         self.video_url: Optional[str] = None
     
+    def __setattr__(self, name: str, value):
+        super().__setattr__(name, value)
+        if name in self._POSE_FIELDS:
+            super().__setattr__('_telemetry', None)
+    
     def connect(self) -> bool:
         """Connetti alla telecamera"""
         # Per telecamere fisse, la connessione è principalmente verificare
@@ -59,12 +78,25 @@ class StaticCameraSource(VideoSource):
         """Ottieni stream video dalla telecamera"""
         if not self.video_url:
             raise ValueError(f"Video URL non configurato per camera {self.source_id}")
-        # TODO: Implementare acquisizione stream basata su URL
-        # OpenCV può gestire RTSP, HTTP, file, ecc.
-        raise NotImplementedError("Video stream acquisition da implementare")
+        # OpenCV gestisce RTSP, HTTP, file, ecc.
+        import cv2
+        return cv2.VideoCapture(self.video_url)
     
     def get_latest_telemetry(self) -> Optional[TelemetryData]:
-        """Ottieni dati telemetria (statici per telecamera fissa)"""
+        """
+        Ottieni dati telemetria (posa statica per telecamera fissa)
+        
+        Il timestamp è quello della lettura, come per le sorgenti in movimento.
+        """
+        if self._telemetry is None:
+            self._telemetry = self._build_telemetry()
+        telemetry = copy.copy(self._telemetry)
+        telemetry.timestamp = datetime.now()
+        telemetry.metadata = dict(self._telemetry.metadata)
+        return telemetry
+    
+    def _build_telemetry(self) -> TelemetryData:
+        """Crea la telemetria per la posa corrente"""
         return TelemetryData(
             source_type=SourceType.STATIC_CAMERA,
             source_id=self.source_id,
@@ -0,0 +1,92 @@
+"""Risultati di detection in forma di array (conversione lazy al formato dict)"""
+import numpy as np
+from typing import List, Dict, Any
+
+
+class DetectionBatch:
+    """
+    Detection di un frame come array paralleli
+
+    Evita la creazione di un dict per box nel percorso caldo; il formato
+    dict usato da tracker e orchestratore viene prodotto solo su richiesta
+    con to_dicts().
+    """
+
+    __slots__ = ('boxes', 'scores', 'class_ids', 'class_names')
+
+    def __init__(
+        self,
+        boxes: np.ndarray,
+        scores: np.ndarray,
+        class_ids: np.ndarray,
+        class_names: Dict[int, str]
+    ):
+        """
+        Args:
+            boxes: Array Nx4 [x1, y1, x2, y2] (pixel)
+            scores: Array N confidenze
+            class_ids: Array N id classe
+            class_names: Mappa id classe -> nome
+        """
+        self.boxes = np.asarray(boxes, dtype=np.float32).reshape(-1, 4)
+        self.scores = np.asarray(scores, dtype=np.float32).reshape(-1)
+        self.class_ids = np.asarray(class_ids, dtype=np.int64).reshape(-1)
+        self.class_names = class_names
+
+    @classmethod
+    def empty(cls, class_names: Dict[int, str]) -> 'DetectionBatch':
+        """Batch senza detection"""
+        return cls(np.empty((0, 4)), np.empty(0), np.empty(0), class_names)
+
+    @classmethod
+    def concatenate(cls, batches: List['DetectionBatch'], class_names: Dict[int, str]) -> 'DetectionBatch':
+        """Unisce più batch in uno solo"""
+        if not batches:
+            return cls.empty(class_names)
+        return cls(
+            np.concatenate([b.boxes for b in batches]),
+            np.concatenate([b.scores for b in batches]),
+            np.concatenate([b.class_ids for b in batches]),
+            class_names
+        )
+
+    def __len__(self) -> int:
+        return len(self.scores)
+
+    @property
+    def centers(self) -> np.ndarray:
+        """Centri dei box (Nx2)"""
+        return (self.boxes[:, :2] + self.boxes[:, 2:]) / 2.0
+
+    def select(self, indices: np.ndarray) -> 'DetectionBatch':
+        """Sottoinsieme per indici o maschera booleana"""
+        return DetectionBatch(
+            self.boxes[indices], self.scores[indices], self.class_ids[indices], self.class_names
+        )
+
+    def shifted(self, dx: float, dy: float) -> 'DetectionBatch':
+        """Copia con box traslati (es. da coordinate tile a coordinate frame)"""
+        offset = np.array([dx, dy, dx, dy], dtype=np.float32)
+        return DetectionBatch(self.boxes + offset, self.scores, self.class_ids, self.class_names)
+
+    def to_dicts(self) -> List[Dict[str, Any]]:
+        """
+        Converte nel formato dict standard:
+        {'bbox', 'class_id', 'class_name', 'confidence', 'center'}
+
+        Le liste Python vengono create con una sola conversione per array.
+        """
+        boxes = self.boxes.tolist()
+        centers = self.centers.tolist()
+        scores = self.scores.tolist()
+        class_ids = self.class_ids.tolist()
+        return [
+            {
+                'bbox': box,
+                'class_id': class_id,
+                'class_name': self.class_names.get(class_id, str(class_id)),
+                'confidence': score,
+                'center': center
+            }
+            for box, center, score, class_id in zip(boxes, centers, scores, class_ids)
+        ]
@@ -3,6 +3,8 @@ import cv2
 import numpy as np
 from typing import List, Dict, Any, Optional
 import os
+from app.vision.model_registry import model_registry
+from app.config import settings
 
 
 class FaceDetector:
@@ -23,13 +25,16 @@ class FaceDetector:
             # Usa il cascade predefinito di OpenCV
             cascade_path = cv2.data.haarcascades + 'haarcascade_frontalface_default.xml'
         
+        # Cascade condiviso tra tutte le sorgenti tramite registro modelli
+        self.model_entry = None
+        self.face_cascade = None
+        self._released = False
         if os.path.exists(cascade_path):
-            self.face_cascade = cv2.CascadeClassifier(cascade_path)
-            if self.face_cascade.empty():
+            self.model_entry = model_registry.get_face_cascade(cascade_path)
+            self.face_cascade = self.model_entry.model
+            if self.face_cascade is None:
                 print("Warning: Haar Cascade caricato ma vuoto. Face detection potrebbe non funzionare.")
-                self.face_cascade = None
         else:
-            self.face_cascade = None
             print(f"Warning: Cascade file non trovato: {cascade_path}")
     
     def detect(self, frame: np.ndarray) -> List[Dict[str, Any]]:
@@ -57,44 +62,122 @@ class FaceDetector:
         # Converti in scala di grigi per Haar Cascade
         gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
         
+        faces = self._detect_faces(gray, min_size=(30, 30))
+        
+        h, w = frame.shape[:2]
+        for (x, y, width, height) in faces:
+            detections.append(self._make_detection(x, y, width, height, w * h))
+        
+        return detections
+    
+    def detect_in_persons(
+        self,
+        frame: np.ndarray,
+        person_detections: List[Dict[str, Any]]
+    ) -> List[Dict[str, Any]]:
+        """
+        Rileva volti solo nella parte alta dei box 'person', a scala ridotta
+        
+        Il costo scala con il numero di persone inquadrate invece che con la
+        risoluzione del frame. Le persone troppo piccole vengono ignorate
+        (il volto non sarebbe comunque rilevabile).
+        
+        Args:
+            frame: Frame video (BGR format)
+            person_detections: Detection YOLO del frame (vengono usate solo le 'person')
+        
+        Returns:
+            Lista di detection volti in coordinate del frame (stesso formato di detect)
+        """
+        detections = []
+        
+        if self.face_cascade is None:
+            return detections
+        
+        h, w = frame.shape[:2]
+        frame_area = w * h
+        max_side = settings.face_roi_max_side
+        
+        for person in person_detections:
+            if person.get('class_name') != 'person':
+                continue
+            
+            x1, y1, x2, y2 = person['bbox']
+            if (y2 - y1) < settings.face_min_person_height:
+                continue
+            
+            # Regione di ricerca: parte alta del box, limitata al frame
+            rx1 = max(0, int(x1))
+            ry1 = max(0, int(y1))
+            rx2 = min(w, int(np.ceil(x2)))
+            ry2 = min(h, int(np.ceil(y1 + (y2 - y1) * settings.face_person_upper_fraction)))
+            if rx2 - rx1 < 2 or ry2 - ry1 < 2:
+                continue
+            
+            roi = cv2.cvtColor(frame[ry1:ry2, rx1:rx2], cv2.COLOR_BGR2GRAY)
+            
+            # Riduci la ROI a dimensione limitata: il costo per persona resta costante
+            scale = min(1.0, max_side / max(roi.shape[:2]))
+            if scale < 1.0:
+                roi = cv2.resize(roi, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+            
+            min_side = max(12, int(30 * scale))
+            for (x, y, width, height) in self._detect_faces(roi, min_size=(min_side, min_side)):
+                detections.append(self._make_detection(
+                    rx1 + x / scale,
+                    ry1 + y / scale,
+                    width / scale,
+                    height / scale,
+                    frame_area
+                ))
+        
+        return detections
+    
+    def _detect_faces(self, gray: np.ndarray, min_size: tuple):
+        """Esegue detectMultiScale su immagine in scala di grigi"""
         # Parametri per detectMultiScale
         # scaleFactor: quanto ridurre l'immagine ad ogni scala (1.1 = piccolo incremento, più preciso ma più lento)
         # minNeighbors: numero minimo di vicini per confermare una detection (più alto = meno falsi positivi)
         # minSize: dimensione minima del volto da rilevare
         min_neighbors = max(3, int(self.conf_threshold * 10))  # Converte threshold in minNeighbors (3-10)
         
-        faces = self.face_cascade.detectMultiScale(
-            gray,
-            scaleFactor=1.1,
-            minNeighbors=min_neighbors,
-            minSize=(30, 30),
-            flags=cv2.CASCADE_SCALE_IMAGE
-        )
-        
-        h, w = frame.shape[:2]
-        for (x, y, width, height) in faces:
-            # Calcola confidence basata sulla dimensione del volto rilevato
-            # Volti più grandi tendono ad essere più affidabili
-            face_area = width * height
-            frame_area = w * h
-            area_ratio = face_area / frame_area
-            # Confidence più alta per volti più grandi (normalizzati)
-            confidence = min(0.95, 0.6 + (area_ratio * 10))
-            
-            detections.append({
-                'bbox': [float(x), float(y), float(x + width), float(y + height)],
-                'class_id': -1,  # ID speciale per volti
-                'class_name': 'face',
-                'confidence': confidence,
-                'center': [
-                    float(x + width / 2),
-                    float(y + height / 2)
-                ]
-            })
+        with self.model_entry.lock:
+            return self.face_cascade.detectMultiScale(
+                gray,
+                scaleFactor=1.1,
+                minNeighbors=min_neighbors,
+                minSize=min_size,
+                flags=cv2.CASCADE_SCALE_IMAGE
+            )
+    
+    @staticmethod
+    def _make_detection(x: float, y: float, width: float, height: float, frame_area: float) -> Dict[str, Any]:
+        """Crea detection volto in coordinate frame"""
+        # Calcola confidence basata sulla dimensione del volto rilevato
+        # Volti più grandi tendono ad essere più affidabili
+        face_area = width * height
+        area_ratio = face_area / frame_area
+        # Confidence più alta per volti più grandi (normalizzati)
+        confidence = min(0.95, 0.6 + (area_ratio * 10))
         
-        return detections
+        return {
+            'bbox': [float(x), float(y), float(x + width), float(y + height)],
+            'class_id': -1,  # ID speciale per volti
+            'class_name': 'face',
+            'confidence': float(confidence),
+            'center': [
+                float(x + width / 2),
+                float(y + height / 2)
+            ]
+        }
     
     def is_available(self) -> bool:
         """Verifica se il detector è disponibile"""
         return self.face_cascade is not None and not self.face_cascade.empty()
+    
+    def close(self):
+        """Rilascia il cascade condiviso nel registro (il modello resta residente)"""
+        if self.model_entry is not None and not self._released:
+            self._released = True
+            model_registry.release(self.model_entry)
 
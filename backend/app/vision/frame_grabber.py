@@ -0,0 +1,105 @@
+"""Grabber dedicato che mantiene solo l'ultimo frame decodificato di un cv2.VideoCapture"""
+import cv2
+import time
+import numpy as np
+from threading import Thread, Condition
+from typing import Optional, Dict, Any
+from app.vision.frames import timestamp_frame
+
+
+class LatestFrameGrabber:
+    """
+    Legge continuamente da cv2.VideoCapture in un thread separato e conserva
+    solo il frame più recente
+
+    Se l'inferenza è più lenta dello stream, i frame non consumati vengono
+    sovrascritti (e contati come scartati) invece di accumularsi nel decoder:
+    la latenza resta limitata a un intervallo di elaborazione.
+    Espone lo stesso contratto read_frame() di RTMPStreamReceiver.
+    """
+
+    def __init__(self, capture: cv2.VideoCapture):
+        """
+        Args:
+            capture: VideoCapture già aperto (RTSP, HTTP, ecc.)
+        """
+        self.capture = capture
+        self.is_running = False
+        self.thread: Optional[Thread] = None
+        self.condition = Condition()
+
+        self._latest_frame: Optional[np.ndarray] = None
+        self._has_new_frame = False
+        self.last_capture_time: Optional[float] = None
+
+        # Statistiche
+        self.frames_grabbed = 0
+        self.frames_dropped = 0
+
+    def start(self):
+        """Avvia thread di acquisizione"""
+        if self.is_running:
+            return
+        self.is_running = True
+        self.thread = Thread(target=self._grab_loop, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        """Ferma thread di acquisizione (il VideoCapture va rilasciato dal chiamante)"""
+        self.is_running = False
+        with self.condition:
+            self.condition.notify_all()
+        if self.thread:
+            self.thread.join(timeout=2.0)
+            self.thread = None
+
+    def _grab_loop(self):
+        """Decodifica frame in continuo, sovrascrivendo quello non ancora letto"""
+        while self.is_running:
+            ret, frame = self.capture.read()
+            if not ret:
+                break
+
+            capture_time = time.time()
+            with self.condition:
+                if self._has_new_frame:
+                    self.frames_dropped += 1
+                self._latest_frame = timestamp_frame(frame, capture_time)
+                self._has_new_frame = True
+                self.last_capture_time = capture_time
+                self.frames_grabbed += 1
+                self.condition.notify()
+
+        # Stream terminato: sblocca eventuali lettori in attesa
+        with self.condition:
+            self.is_running = False
+            self.condition.notify_all()
+
+    def read_frame(self, timeout: float = 1.0) -> Optional[np.ndarray]:
+        """
+        Restituisce il frame più recente non ancora letto
+
+        Args:
+            timeout: Attesa massima (secondi) per un nuovo frame
+
+        Returns:
+            Frame BGR o None se non arriva un nuovo frame entro il timeout
+        """
+        with self.condition:
+            if not self._has_new_frame:
+                self.condition.wait_for(
+                    lambda: self._has_new_frame or not self.is_running,
+                    timeout=timeout
+                )
+            if not self._has_new_frame:
+                return None
+            self._has_new_frame = False
+            return self._latest_frame
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Statistiche acquisizione"""
+        return {
+            'is_running': self.is_running,
+            'frames_grabbed': self.frames_grabbed,
+            'frames_dropped': self.frames_dropped
+        }
@@ -0,0 +1,345 @@
+"""Hub frame per sorgente: un solo decode, più consumatori"""
+import cv2
+import time
+import numpy as np
+from collections import deque
+from threading import Thread, Condition, Lock
+from typing import Optional, Callable, List, Dict, Any
+from app.vision.frames import timestamp_frame
+
+POLICY_LATEST = "latest"  # solo il frame più recente (per analisi in tempo reale)
+POLICY_ALL = "all"  # ogni frame, in coda limitata (registrazione)
+POLICY_EVERY_N = "every_n"  # un frame ogni N (anteprima, analisi lente)
+
+
+class _SharedFrame:
+    """Frame decodificato condiviso tra le sottoscrizioni, con conteggio riferimenti"""
+
+    __slots__ = ('frame', 'sequence', 'refs', 'release')
+
+    def __init__(self, frame: np.ndarray, sequence: int, release: Optional[Callable]):
+        self.frame = frame
+        self.sequence = sequence
+        self.refs = 1  # riferimento del produttore durante la distribuzione
+        self.release = release
+
+
+class FrameSubscription:
+    """
+    Consumatore di un FrameHub
+
+    Espone lo stesso contratto read_frame() di RTMPStreamReceiver: il frame
+    restituito è una vista in sola lettura, valida fino alla chiamata
+    successiva di read_frame() o release_frame().
+    """
+
+    def __init__(self, hub: 'FrameHub', name: str, policy: str, every_n: int, max_queue: int):
+        """
+        Args:
+            hub: Hub di origine
+            name: Nome consumatore (per statistiche)
+            policy: POLICY_LATEST, POLICY_ALL o POLICY_EVERY_N
+            every_n: Intervallo frame per POLICY_EVERY_N
+            max_queue: Frame massimi in coda (POLICY_ALL / POLICY_EVERY_N)
+        """
+        if policy not in (POLICY_LATEST, POLICY_ALL, POLICY_EVERY_N):
+            raise ValueError(f"Policy sottoscrizione sconosciuta: {policy}")
+
+        self.hub = hub
+        self.name = name
+        self.policy = policy
+        self.every_n = max(1, every_n)
+        self.max_queue = 1 if policy == POLICY_LATEST else max(1, max_queue)
+        self.closed = False
+        self.condition = Condition()
+        self._queue: deque = deque()
+        self._current: Optional[_SharedFrame] = None
+
+        # Statistiche
+        self.frames_received = 0
+        self.frames_dropped = 0
+
+    @property
+    def is_running(self) -> bool:
+        """True finché ci sono frame in coda o l'hub può produrne altri"""
+        return not self.closed and (self.hub.is_running or bool(self._queue))
+
+    @property
+    def width(self) -> Optional[int]:
+        return self.hub.frame_size[0] if self.hub.frame_size else None
+
+    @property
+    def height(self) -> Optional[int]:
+        return self.hub.frame_size[1] if self.hub.frame_size else None
+
+    def _offer(self, shared: _SharedFrame, backpressure: bool):
+        """Consegna un frame secondo la policy (chiamato dal thread dell'hub)"""
+        if self.policy == POLICY_EVERY_N and shared.sequence % self.every_n != 0:
+            return
+
+        with self.condition:
+            if self.closed:
+                return
+            if len(self._queue) >= self.max_queue:
+                if backpressure and self.policy != POLICY_LATEST:
+                    # Sorgente file: attendi il consumatore invece di perdere frame
+                    self.condition.wait_for(
+                        lambda: len(self._queue) < self.max_queue or self.closed or not self.hub.is_running
+                    )
+                while len(self._queue) >= self.max_queue:
+                    self.hub._release(self._queue.popleft())
+                    self.frames_dropped += 1
+                if self.closed:
+                    return
+            self.hub._retain(shared)
+            self._queue.append(shared)
+            self.frames_received += 1
+            self.condition.notify_all()
+
+    def read_frame(self, timeout: float = 1.0) -> Optional[np.ndarray]:
+        """
+        Legge il prossimo frame secondo la policy
+
+        Args:
+            timeout: Attesa massima (secondi) per un nuovo frame
+
+        Returns:
+            Frame BGR in sola lettura o None se non disponibile
+        """
+        self.release_frame()
+        with self.condition:
+            if not self._queue:
+                self.condition.wait_for(
+                    lambda: self._queue or self.closed or not self.hub.is_running,
+                    timeout=timeout
+                )
+            if not self._queue:
+                return None
+            self._current = self._queue.popleft()
+            self.condition.notify_all()  # libera il produttore in backpressure
+            return self._current.frame
+
+    def release_frame(self):
+        """Restituisce il frame corrente all'hub"""
+        if self._current is not None:
+            self.hub._release(self._current)
+            self._current = None
+
+    def close(self):
+        """Chiude la sottoscrizione e rilascia i frame in coda"""
+        self.hub.unsubscribe(self)
+
+    def stop(self):
+        """Alias di close() (stessa interfaccia dei ricevitori stream)"""
+        self.close()
+
+    def _close(self):
+        """Svuota la coda (chiamato dall'hub)"""
+        with self.condition:
+            self.closed = True
+            while self._queue:
+                self.hub._release(self._queue.popleft())
+            self.condition.notify_all()
+        self.release_frame()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Statistiche sottoscrizione"""
+        return {
+            'name': self.name,
+            'policy': self.policy,
+            'every_n': self.every_n,
+            'queued': len(self._queue),
+            'frames_received': self.frames_received,
+            'frames_dropped': self.frames_dropped
+        }
+
+
+class FrameHub:
+    """
+    Decodifica una sorgente una sola volta e distribuisce i frame a più consumatori
+
+    Il thread dell'hub è l'unico lettore della sorgente (RTMPStreamReceiver,
+    PyAVStreamReceiver, cv2.VideoCapture). Ogni frame viene condiviso come
+    vista in sola lettura: nessuna copia per consumatore. Con un ricevitore
+    a FrameRing lo slot torna al ring quando l'ultimo consumatore lo rilascia.
+    Per file video (non live) l'hub applica backpressure alle code POLICY_ALL
+    invece di scartare frame.
+    """
+
+    def __init__(self, source_id: str, video_source):
+        """
+        Args:
+            source_id: ID sorgente
+            video_source: Ricevitore stream (read_frame), cv2.VideoCapture, URL o file path
+        """
+        self.source_id = source_id
+        if isinstance(video_source, str):
+            video_source = cv2.VideoCapture(video_source)
+
+        self.source = video_source
+        self.capture: Optional[cv2.VideoCapture] = None
+        if isinstance(video_source, cv2.VideoCapture):
+            if not video_source.isOpened():
+                raise RuntimeError(f"Impossibile aprire stream video per sorgente {source_id}")
+            self.capture = video_source
+        elif not hasattr(video_source, 'read_frame'):
+            raise ValueError("video_source deve essere stringa, cv2.VideoCapture o ricevitore stream")
+
+        # I file hanno un numero di frame noto: vanno elaborati tutti, senza scarti
+        self.is_live = self.capture is None or self.capture.get(cv2.CAP_PROP_FRAME_COUNT) <= 0
+
+        self.subscriptions: List[FrameSubscription] = []
+        self.lock = Lock()
+        self._ref_lock = Lock()
+        self.is_running = False
+        self.thread: Optional[Thread] = None
+        self.frame_size: Optional[tuple] = None  # (width, height) dell'ultimo frame
+
+        # Statistiche
+        self.frames_decoded = 0
+
+    def subscribe(
+        self,
+        name: str,
+        policy: str = POLICY_LATEST,
+        every_n: int = 1,
+        max_queue: int = 4
+    ) -> FrameSubscription:
+        """
+        Aggiunge un consumatore
+
+        Args:
+            name: Nome consumatore (es. "analysis", "preview", "recorder")
+            policy: POLICY_LATEST, POLICY_ALL o POLICY_EVERY_N
+            every_n: Intervallo frame per POLICY_EVERY_N
+            max_queue: Frame massimi in coda (POLICY_ALL / POLICY_EVERY_N)
+        """
+        subscription = FrameSubscription(self, name, policy, every_n, max_queue)
+        with self.lock:
+            self.subscriptions.append(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: FrameSubscription):
+        """Rimuove un consumatore (i suoi frame tornano alla sorgente)"""
+        with self.lock:
+            if subscription in self.subscriptions:
+                self.subscriptions.remove(subscription)
+        subscription._close()
+
+    def start(self):
+        """Avvia thread di decode"""
+        if self.is_running:
+            return
+        self.is_running = True
+        self.thread = Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        """Ferma il decode, chiude le sottoscrizioni e rilascia la sorgente"""
+        self.is_running = False
+        with self.lock:
+            subscriptions = list(self.subscriptions)
+        for subscription in subscriptions:
+            with subscription.condition:
+                subscription.condition.notify_all()
+        if self.thread:
+            self.thread.join(timeout=2.0)
+            self.thread = None
+        for subscription in subscriptions:
+            self.unsubscribe(subscription)
+
+        if self.capture is not None:
+            self.capture.release()
+        else:
+            self.source.stop()
+
+    def _read_next(self):
+        """
+        Legge il prossimo frame dalla sorgente
+
+        Returns:
+            Tuple (frame, release) con release da chiamare a fine uso (o None),
+            None se nessun frame disponibile; imposta is_running False a fine stream
+        """
+        if self.capture is not None:
+            ret, frame = self.capture.read()
+            if not ret:
+                self.is_running = False
+                return None
+            return timestamp_frame(frame, time.time()), None
+
+        if hasattr(self.source, 'borrow_frame'):
+            # Ricevitore a FrameRing: lo slot resta in prestito finché serve ai consumatori
+            borrowed = self.source.borrow_frame(timeout=1.0)
+            if borrowed is None:
+                if not self.source.is_running:
+                    self.is_running = False
+                return None
+            frame, slot = borrowed
+            return frame, lambda: self.source.release_slot(slot)
+
+        frame = self.source.read_frame()
+        if frame is None:
+            if not getattr(self.source, 'is_running', True):
+                self.is_running = False
+            return None
+        return frame, None
+
+    def _run(self):
+        """Loop di decode e distribuzione"""
+        sequence = 0
+        while self.is_running:
+            item = self._read_next()
+            if item is None:
+                continue
+            frame, release = item
+
+            if getattr(frame, 'capture_time', None) is None:
+                frame = timestamp_frame(frame, time.time())
+            view = frame.view()
+            view.flags.writeable = False  # condiviso: nessun consumatore può modificarlo
+
+            self.frame_size = (view.shape[1], view.shape[0])
+            self.frames_decoded += 1
+            shared = _SharedFrame(view, sequence, release)
+            sequence += 1
+
+            with self.lock:
+                subscriptions = list(self.subscriptions)
+            for subscription in subscriptions:
+                subscription._offer(shared, backpressure=not self.is_live)
+            self._release(shared)  # riferimento del produttore
+
+        # Fine stream: sblocca i consumatori in attesa
+        with self.lock:
+            subscriptions = list(self.subscriptions)
+        for subscription in subscriptions:
+            with subscription.condition:
+                subscription.condition.notify_all()
+
+    def _retain(self, shared: _SharedFrame):
+        with self._ref_lock:
+            shared.refs += 1
+
+    def _release(self, shared: _SharedFrame):
+        with self._ref_lock:
+            shared.refs -= 1
+            done = shared.refs == 0
+        if done and shared.release is not None:
+            shared.release()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Statistiche hub e sottoscrizioni"""
+        with self.lock:
+            subscriptions = list(self.subscriptions)
+        stats = {
+            'source_id': self.source_id,
+            'is_running': self.is_running,
+            'is_live': self.is_live,
+            'frame_size': self.frame_size,
+            'frames_decoded': self.frames_decoded,
+            'subscriptions': [s.get_stats() for s in subscriptions]
+        }
+        if hasattr(self.source, 'get_stats'):
+            stats['source'] = self.source.get_stats()
+        return stats
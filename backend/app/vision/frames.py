@@ -0,0 +1,29 @@
+"""Frame video con metadati temporali"""
+import numpy as np
+from typing import Optional
+
+
+class TimestampedFrame(np.ndarray):
+    """
+    Frame numpy con istante di acquisizione e PTS dello stream
+
+    È una vista sull'array originale (nessuna copia): chi si aspetta un
+    semplice np.ndarray continua a funzionare.
+    """
+
+    capture_time: Optional[float] = None  # time.time() all'acquisizione
+    pts: Optional[float] = None  # presentation timestamp dello stream (secondi)
+
+    def __array_finalize__(self, obj):
+        if obj is None:
+            return
+        self.capture_time = getattr(obj, 'capture_time', None)
+        self.pts = getattr(obj, 'pts', None)
+
+
+def timestamp_frame(frame: np.ndarray, capture_time: float, pts: Optional[float] = None) -> TimestampedFrame:
+    """Associa istante di acquisizione (e PTS) a un frame senza copiarlo"""
+    stamped = frame.view(TimestampedFrame)
+    stamped.capture_time = capture_time
+    stamped.pts = pts
+    return stamped
@@ -0,0 +1,237 @@
+"""Scheduler condiviso per inferenza YOLO a batch tra più sorgenti"""
+import time
+import queue
+import numpy as np
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from threading import Thread, Lock
+from typing import List, Dict, Any, Optional
+from app.vision.yolo_detector import YOLODetector
+from app.vision.detections import DetectionBatch
+from app.vision.tiling import split_frame, merge_tile_batches
+from app.config import settings
+
+
+class _InferenceRequest:
+    """Richiesta di inferenza in attesa nel scheduler"""
+
+    __slots__ = ('source_id', 'frame', 'imgsz', 'future', 'submitted_at')
+
+    def __init__(self, source_id: str, frame: np.ndarray, imgsz: Optional[int] = None):
+        self.source_id = source_id
+        self.frame = frame
+        self.imgsz = imgsz
+        self.future: Future = Future()
+        self.submitted_at = time.monotonic()
+
+
+class InferenceScheduler:
+    """
+    Raccoglie i frame di tutti i VideoProcessor e li elabora con una
+    singola chiamata predict a batch
+
+    Ogni sorgente chiama detect() dal proprio thread: la richiesta viene
+    accodata e il thread resta in attesa del risultato. Il thread del
+    scheduler forma un batch quando raggiunge max_batch_size oppure quando
+    il frame più vecchio ha atteso max_wait_ms.
+    """
+
+    def __init__(
+        self,
+        detector: Optional[YOLODetector] = None,
+        max_batch_size: Optional[int] = None,
+        max_wait_ms: Optional[float] = None
+    ):
+        """
+        Args:
+            detector: Detector YOLO condiviso (default: ne crea uno nuovo)
+            max_batch_size: Numero massimo di frame per batch
+            max_wait_ms: Attesa massima (ms) per riempire un batch
+        """
+        self.detector = detector or YOLODetector()
+        self.max_batch_size = max(1, max_batch_size or settings.inference_max_batch_size)
+
+        # L'attesa per formare il batch non deve mai consumare il budget di latenza
+        max_wait_ms = settings.inference_max_wait_ms if max_wait_ms is None else max_wait_ms
+        max_wait_seconds = max(0.0, max_wait_ms / 1000.0)
+        self.max_wait_seconds = min(max_wait_seconds, settings.target_latency_seconds / 4)
+
+        self.request_queue: queue.Queue = queue.Queue()
+        self.is_running = False
+        self.thread: Optional[Thread] = None
+        self.lock = Lock()
+
+        # Statistiche
+        self.batches_processed = 0
+        self.frames_processed = 0
+        self.frames_expired = 0
+        self.frames_timed_out = 0
+
+    def start(self):
+        """Avvia thread di inferenza"""
+        with self.lock:
+            if self.is_running:
+                return
+            self.is_running = True
+            self.thread = Thread(target=self._run_loop, daemon=True)
+            self.thread.start()
+
+    def stop(self):
+        """Ferma thread di inferenza e sblocca le richieste pendenti"""
+        with self.lock:
+            self.is_running = False
+        if self.thread:
+            self.thread.join(timeout=2.0)
+            self.thread = None
+
+        # Risolvi richieste rimaste in coda per non bloccare i VideoProcessor
+        while True:
+            try:
+                request = self.request_queue.get_nowait()
+            except queue.Empty:
+                break
+            if not request.future.done():
+                request.future.set_result(self._empty_result())
+
+    def submit(self, source_id: str, frame: np.ndarray, imgsz: Optional[int] = None) -> Future:
+        """
+        Accoda un frame per l'inferenza
+
+        Args:
+            source_id: ID sorgente
+            frame: Frame video (BGR format)
+            imgsz: Dimensione input inferenza (None = quella del modello)
+
+        Returns:
+            Future che verrà risolto con il DetectionBatch del frame
+        """
+        if not self.is_running:
+            self.start()
+
+        request = _InferenceRequest(source_id, frame, imgsz)
+        self.request_queue.put(request)
+        return request.future
+
+    def detect(
+        self,
+        frame: np.ndarray,
+        source_id: str = "",
+        tiled: bool = False,
+        imgsz: Optional[int] = None
+    ) -> Optional[List[Dict[str, Any]]]:
+        """
+        Rileva oggetti in un frame passando dal batch condiviso (bloccante)
+
+        Stessa interfaccia di YOLODetector.detect, così il VideoProcessor
+        può usare indifferentemente detector locale o scheduler.
+
+        Args:
+            frame: Frame video (BGR format)
+            source_id: ID sorgente (per statistiche)
+            tiled: Dividi il frame in tile, accodati come immagini dello stesso batch
+            imgsz: Dimensione input inferenza (deciso dal controllo adattivo di latenza)
+        
+        Returns:
+            Lista detection, o None se il frame non è stato elaborato entro
+            target_latency_seconds (da non confondere con una scena vuota)
+        """
+        if tiled:
+            images, offsets = split_frame(frame)
+        else:
+            images, offsets = [frame], [(0, 0)]
+
+        futures = [self.submit(source_id, image, imgsz) for image in images]
+        deadline = time.monotonic() + settings.target_latency_seconds
+        results = []
+        try:
+            for future in futures:
+                results.append(future.result(timeout=max(0.0, deadline - time.monotonic())))
+        except FutureTimeoutError:
+            # Il frame è troppo vecchio per essere utile: il worker lo scarterà
+            self.frames_timed_out += 1
+            return None
+
+        if not tiled:
+            return results[0].to_dicts()
+        return merge_tile_batches(results, offsets, self.detector.iou_threshold).to_dicts()
+
+    def _empty_result(self) -> DetectionBatch:
+        """Risultato vuoto (frame scartato o errore)"""
+        return DetectionBatch.empty(self.detector.TARGET_CLASSES)
+
+    def _collect_batch(self) -> List[_InferenceRequest]:
+        """Attende il primo frame e raccoglie gli altri fino a batch pieno o timeout"""
+        try:
+            first = self.request_queue.get(timeout=0.1)
+        except queue.Empty:
+            return []
+
+        batch = [first]
+        deadline = first.submitted_at + self.max_wait_seconds
+
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining <= 0:
+                    # Prendi comunque ciò che è già in coda, senza attendere
+                    batch.append(self.request_queue.get_nowait())
+                else:
+                    batch.append(self.request_queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+
+        return batch
+
+    def _run_loop(self):
+        """Loop principale: forma batch, esegue predict e distribuisce risultati"""
+        while self.is_running:
+            batch = self._collect_batch()
+            if not batch:
+                continue
+
+            # Scarta frame già oltre il budget di latenza (il chiamante ha rinunciato)
+            now = time.monotonic()
+            valid = []
+            for request in batch:
+                if now - request.submitted_at > settings.target_latency_seconds:
+                    self.frames_expired += 1
+                    request.future.set_result(self._empty_result())
+                else:
+                    valid.append(request)
+
+            if not valid:
+                continue
+
+            # Una predict per dimensione di input: le sorgenti degradate non rallentano le altre
+            groups: Dict[Optional[int], List[_InferenceRequest]] = {}
+            for request in valid:
+                groups.setdefault(request.imgsz, []).append(request)
+
+            for imgsz, requests in groups.items():
+                try:
+                    results = self.detector.detect_arrays([r.frame for r in requests], imgsz)
+                except Exception as e:
+                    print(f"Errore inferenza batch: {e}")
+                    results = [self._empty_result() for _ in requests]
+
+                for request, detections in zip(requests, results):
+                    request.future.set_result(detections)
+
+                self.batches_processed += 1
+                self.frames_processed += len(requests)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Statistiche scheduler (per monitoraggio)"""
+        return {
+            'is_running': self.is_running,
+            'max_batch_size': self.max_batch_size,
+            'max_wait_ms': self.max_wait_seconds * 1000.0,
+            'pending': self.request_queue.qsize(),
+            'batches_processed': self.batches_processed,
+            'frames_processed': self.frames_processed,
+            'frames_expired': self.frames_expired,
+            'frames_timed_out': self.frames_timed_out,
+            'avg_batch_size': (
+                self.frames_processed / self.batches_processed
+                if self.batches_processed else 0.0
+            )
+        }
@@ -0,0 +1,152 @@
+"""Filtro di Kalman a velocità costante per box, in forma batch su tutti i track"""
+import numpy as np
+from typing import Dict, List, Iterable
+
+
+class BatchedKalmanBoxFilter:
+    """
+    Stato di Kalman per molti track in array contigui (stile SORT)
+
+    Stato per track: [cx, cy, w, h, vx, vy, vw, vh] in pixel e pixel/frame.
+    Misura: [cx, cy, w, h]. Il rumore di processo e di misura è proporzionale
+    alle dimensioni del box (oggetti grandi/vicini si muovono di più in pixel).
+    Predizione e aggiornamento sono operazioni matriciali batch: il costo per
+    frame non dipende dal numero di chiamate Python per track.
+    """
+
+    NDIM = 4
+    # Deviazioni standard relative alle dimensioni del box
+    STD_WEIGHT_POSITION = 1.0 / 20
+    STD_WEIGHT_VELOCITY = 1.0 / 160
+
+    def __init__(self, capacity: int = 64):
+        """
+        Args:
+            capacity: Righe preallocate (cresce automaticamente)
+        """
+        ndim = self.NDIM
+        self.motion = np.eye(2 * ndim)
+        self.motion[:ndim, ndim:] = np.eye(ndim)  # dt = 1 frame
+
+        self.mean = np.zeros((capacity, 2 * ndim))
+        self.covariance = np.zeros((capacity, 2 * ndim, 2 * ndim))
+        self.row_ids: List[int] = []  # track id per riga attiva
+        self.rows: Dict[int, int] = {}  # track id -> riga
+
+    def __len__(self) -> int:
+        return len(self.row_ids)
+
+    def __contains__(self, track_id: int) -> bool:
+        return track_id in self.rows
+
+    def _ensure_capacity(self, size: int):
+        if size <= len(self.mean):
+            return
+        capacity = max(size, 2 * len(self.mean))
+        mean = np.zeros((capacity, self.mean.shape[1]))
+        covariance = np.zeros((capacity,) + self.covariance.shape[1:])
+        n = len(self.row_ids)
+        mean[:n] = self.mean[:n]
+        covariance[:n] = self.covariance[:n]
+        self.mean, self.covariance = mean, covariance
+
+    @staticmethod
+    def _to_measurement(bboxes: np.ndarray) -> np.ndarray:
+        """[x1, y1, x2, y2] -> [cx, cy, w, h]"""
+        bboxes = np.asarray(bboxes, dtype=np.float64).reshape(-1, 4)
+        wh = bboxes[:, 2:] - bboxes[:, :2]
+        return np.hstack([bboxes[:, :2] + wh / 2.0, wh])
+
+    def add(self, track_id: int, bbox: List[float]):
+        """Inizializza lo stato di un nuovo track (velocità nulla, alta incertezza)"""
+        row = len(self.row_ids)
+        self._ensure_capacity(row + 1)
+        measurement = self._to_measurement(bbox)[0]
+        w, h = max(measurement[2], 1.0), max(measurement[3], 1.0)
+
+        self.mean[row, :self.NDIM] = measurement
+        self.mean[row, self.NDIM:] = 0.0
+        std = np.array([
+            2 * self.STD_WEIGHT_POSITION * w, 2 * self.STD_WEIGHT_POSITION * h,
+            2 * self.STD_WEIGHT_POSITION * w, 2 * self.STD_WEIGHT_POSITION * h,
+            10 * self.STD_WEIGHT_VELOCITY * w, 10 * self.STD_WEIGHT_VELOCITY * h,
+            10 * self.STD_WEIGHT_VELOCITY * w, 10 * self.STD_WEIGHT_VELOCITY * h
+        ])
+        self.covariance[row] = np.diag(std ** 2)
+
+        self.row_ids.append(track_id)
+        self.rows[track_id] = row
+
+    def remove(self, track_id: int):
+        """Rimuove un track spostando l'ultima riga al suo posto"""
+        row = self.rows.pop(track_id, None)
+        if row is None:
+            return
+        last = len(self.row_ids) - 1
+        if row != last:
+            moved_id = self.row_ids[last]
+            self.mean[row] = self.mean[last]
+            self.covariance[row] = self.covariance[last]
+            self.row_ids[row] = moved_id
+            self.rows[moved_id] = row
+        self.row_ids.pop()
+
+    def predict(self):
+        """Avanza di un frame lo stato di tutti i track"""
+        n = len(self.row_ids)
+        if n == 0:
+            return
+        mean = self.mean[:n]
+        wh = np.maximum(mean[:, 2:4], 1.0)
+        # Ordine [cx, cy, w, h, vx, vy, vw, vh]: deviazioni da (w, h, w, h)
+        std = np.hstack([
+            self.STD_WEIGHT_POSITION * wh[:, [0, 1, 0, 1]],
+            self.STD_WEIGHT_VELOCITY * wh[:, [0, 1, 0, 1]]
+        ])
+
+        self.mean[:n] = mean @ self.motion.T
+        covariance = self.motion @ self.covariance[:n] @ self.motion.T
+        diag = np.arange(2 * self.NDIM)
+        covariance[:, diag, diag] += std ** 2
+        self.covariance[:n] = covariance
+
+    def update(self, track_ids: Iterable[int], bboxes: np.ndarray):
+        """
+        Corregge lo stato dei track misurati in quest'ultimo frame (batch)
+
+        Args:
+            track_ids: Id dei track misurati
+            bboxes: Array Kx4 [x1, y1, x2, y2] delle misure, nello stesso ordine
+        """
+        rows = np.fromiter((self.rows[t] for t in track_ids), dtype=np.int64)
+        if rows.size == 0:
+            return
+        ndim = self.NDIM
+        measurement = self._to_measurement(bboxes)
+        mean = self.mean[rows]
+        covariance = self.covariance[rows]
+
+        wh = np.maximum(mean[:, 2:4], 1.0)
+        std = self.STD_WEIGHT_POSITION * wh[:, [0, 1, 0, 1]]
+        innovation_cov = covariance[:, :ndim, :ndim].copy()
+        diag = np.arange(ndim)
+        innovation_cov[:, diag, diag] += std ** 2
+
+        # K = P H^T S^-1 (S simmetrica): risolto come S K^T = H P
+        gain = np.linalg.solve(innovation_cov, covariance[:, :ndim, :]).transpose(0, 2, 1)
+        innovation = measurement - mean[:, :ndim]
+
+        self.mean[rows] = mean + np.einsum('kij,kj->ki', gain, innovation)
+        self.covariance[rows] = covariance - gain @ covariance[:, :ndim, :]
+
+    def boxes(self, track_ids: Iterable[int]) -> np.ndarray:
+        """Box stimati [x1, y1, x2, y2] (Kx4) per i track indicati"""
+        rows = np.fromiter((self.rows[t] for t in track_ids), dtype=np.int64)
+        state = self.mean[rows, :self.NDIM]
+        half = np.maximum(state[:, 2:], 0.0) / 2.0
+        return np.hstack([state[:, :2] - half, state[:, :2] + half])
+
+    def velocities(self, track_ids: Iterable[int]) -> np.ndarray:
+        """Velocità del centro (pixel/frame, Kx2) per i track indicati"""
+        rows = np.fromiter((self.rows[t] for t in track_ids), dtype=np.int64)
+        return self.mean[rows, self.NDIM:self.NDIM + 2].copy()
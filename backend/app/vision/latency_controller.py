@@ -0,0 +1,159 @@
+"""Controllo adattivo di risoluzione e frame rate in base alla latenza misurata"""
+import time
+from threading import Lock
+from typing import List, Dict, Any, Optional
+from app.config import settings
+
+
+class AdaptiveLatencyController:
+    """
+    Controller a retroazione per una singola sorgente
+
+    Misura la latenza di pipeline (acquisizione frame -> detection tracciate)
+    con una media mobile esponenziale e la confronta con il budget:
+    - sopra la soglia alta degrada prima la risoluzione di inferenza (imgsz),
+      poi dimezza il frame rate elaborato fino al minimo;
+    - sotto la soglia bassa recupera in ordine inverso (prima fps, poi imgsz).
+    Dopo ogni decisione attende cooldown_frames misure, così l'effetto del
+    cambio è visibile nella media prima di decidere di nuovo.
+    """
+
+    def __init__(
+        self,
+        source_id: str,
+        budget_seconds: Optional[float] = None,
+        imgsz_levels: Optional[List[int]] = None,
+        max_fps: Optional[float] = None,
+        min_fps: Optional[float] = None
+    ):
+        """
+        Args:
+            source_id: ID sorgente (per log)
+            budget_seconds: Latenza massima (default: settings.adaptive_latency_budget_seconds o target_latency_seconds)
+            imgsz_levels: Dimensioni input ammesse, dalla più grande (default: settings.adaptive_imgsz_levels)
+            max_fps: Frame rate massimo elaborato (default: settings.video_fps)
+            min_fps: Frame rate minimo sotto cui non scendere (default: settings.adaptive_min_fps)
+        """
+        self.source_id = source_id
+        self.budget_seconds = (
+            budget_seconds or settings.adaptive_latency_budget_seconds or settings.target_latency_seconds
+        )
+        self.imgsz_levels = sorted(set(imgsz_levels or settings.adaptive_imgsz_levels), reverse=True)
+        self.max_fps = float(max_fps or settings.video_fps)
+        self.min_fps = min(self.max_fps, float(min_fps or settings.adaptive_min_fps))
+        self.high_watermark = self.budget_seconds * settings.adaptive_high_watermark
+        self.low_watermark = self.budget_seconds * settings.adaptive_low_watermark
+        self.cooldown_frames = max(1, settings.adaptive_cooldown_frames)
+        self.smoothing = settings.adaptive_latency_smoothing
+
+        self.imgsz_index = 0
+        self.target_fps = self.max_fps
+        self.ewma_latency: Optional[float] = None
+        self.last_latency: Optional[float] = None
+        self.frames_since_change = 0
+        self._last_accepted: Optional[float] = None
+        self.lock = Lock()
+
+        # Statistiche
+        self.frames_measured = 0
+        self.frames_skipped = 0
+        self.over_budget_frames = 0
+        self.last_decision: Optional[str] = None
+        self.last_decision_time: Optional[float] = None
+
+    @property
+    def imgsz(self) -> int:
+        """Dimensione input inferenza corrente"""
+        return self.imgsz_levels[self.imgsz_index]
+
+    def should_process(self, now: Optional[float] = None) -> bool:
+        """
+        Decide se elaborare il frame corrente rispettando il frame rate obiettivo
+
+        I frame in eccesso vengono scartati prima di qualsiasi elaborazione.
+        """
+        now = time.monotonic() if now is None else now
+        with self.lock:
+            if self.target_fps >= self.max_fps or self._last_accepted is None:
+                self._last_accepted = now
+                return True
+            # Tolleranza del 10% per non perdere frame a causa del jitter
+            if now - self._last_accepted >= 0.9 / self.target_fps:
+                self._last_accepted = now
+                return True
+            self.frames_skipped += 1
+            return False
+
+    def record(self, latency_seconds: float):
+        """
+        Registra la latenza di un frame elaborato e aggiorna le decisioni
+
+        Args:
+            latency_seconds: Tempo tra acquisizione del frame e risultato del tracking
+        """
+        with self.lock:
+            self.last_latency = latency_seconds
+            self.frames_measured += 1
+            if latency_seconds > self.budget_seconds:
+                self.over_budget_frames += 1
+
+            if self.ewma_latency is None:
+                self.ewma_latency = latency_seconds
+            else:
+                self.ewma_latency += self.smoothing * (latency_seconds - self.ewma_latency)
+
+            self.frames_since_change += 1
+            if self.frames_since_change < self.cooldown_frames:
+                return
+
+            if self.ewma_latency > self.high_watermark:
+                self._degrade()
+            elif self.ewma_latency < self.low_watermark:
+                self._upgrade()
+
+    def _degrade(self):
+        """Riduce il carico di un passo: prima imgsz, poi fps"""
+        if self.imgsz_index < len(self.imgsz_levels) - 1:
+            self.imgsz_index += 1
+            self._decided(f"imgsz -> {self.imgsz}")
+        elif self.target_fps > self.min_fps:
+            self.target_fps = max(self.min_fps, self.target_fps / 2.0)
+            self._decided(f"fps -> {self.target_fps:.1f}")
+
+    def _upgrade(self):
+        """Aumenta la qualità di un passo: prima fps, poi imgsz"""
+        if self.target_fps < self.max_fps:
+            self.target_fps = min(self.max_fps, self.target_fps * 2.0)
+            self._decided(f"fps -> {self.target_fps:.1f}")
+        elif self.imgsz_index > 0:
+            self.imgsz_index -= 1
+            self._decided(f"imgsz -> {self.imgsz}")
+
+    def _decided(self, decision: str):
+        """Registra una decisione e riavvia il cooldown"""
+        self.frames_since_change = 0
+        self.last_decision = decision
+        self.last_decision_time = time.time()
+        print(
+            f"Controllo latenza {self.source_id}: {decision} "
+            f"(latenza media {self.ewma_latency:.2f}s, budget {self.budget_seconds:.2f}s)"
+        )
+
+    def get_state(self) -> Dict[str, Any]:
+        """Stato e decisioni correnti del controller"""
+        with self.lock:
+            return {
+                'imgsz': self.imgsz,
+                'imgsz_levels': self.imgsz_levels,
+                'target_fps': self.target_fps,
+                'max_fps': self.max_fps,
+                'min_fps': self.min_fps,
+                'budget_seconds': self.budget_seconds,
+                'ewma_latency_seconds': self.ewma_latency,
+                'last_latency_seconds': self.last_latency,
+                'frames_measured': self.frames_measured,
+                'frames_skipped': self.frames_skipped,
+                'over_budget_frames': self.over_budget_frames,
+                'last_decision': self.last_decision,
+                'last_decision_time': self.last_decision_time
+            }
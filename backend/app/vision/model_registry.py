@@ -0,0 +1,252 @@
+"""Registro modelli condiviso a livello di processo (caricamento lazy, condivisione e warmup)"""
+import os
+import time
+import numpy as np
+from threading import Lock, RLock
+from typing import Dict, Any, Optional, Tuple, List
+from app.config import settings
+
+try:
+    import cv2
+    OPENCV_AVAILABLE = True
+except ImportError:
+    OPENCV_AVAILABLE = False
+
+
+def _current_rss_bytes() -> Optional[int]:
+    """Memoria residente del processo in byte (None se non misurabile)"""
+    try:
+        with open('/proc/self/statm', 'r') as f:
+            resident_pages = int(f.read().split()[1])
+        return resident_pages * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError, AttributeError):
+        return None
+
+
+class ModelEntry:
+    """Modello residente nel registro"""
+
+    def __init__(self, model_path: str, backend: str):
+        self.model_path = model_path
+        self.backend = backend
+        self.model = None
+        # Serializza caricamento e inferenza: i modelli non sono thread-safe
+        self.lock = RLock()
+        self.memory_bytes: Optional[int] = None
+        self.load_seconds: Optional[float] = None
+        self.warmup_seconds: Optional[float] = None
+        self.warmed_up = False
+        self.users = 0
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Converte entry a dict per serializzazione"""
+        return {
+            'model_path': self.model_path,
+            'backend': self.backend,
+            'loaded': self.model is not None,
+            'warmed_up': self.warmed_up,
+            'users': self.users,
+            'memory_bytes': self.memory_bytes,
+            'memory_mb': round(self.memory_bytes / (1024 * 1024), 2) if self.memory_bytes else None,
+            'load_seconds': self.load_seconds,
+            'warmup_seconds': self.warmup_seconds
+        }
+
+
+class ModelRegistry:
+    """
+    Carica ogni modello una sola volta per processo e lo condivide tra le sorgenti
+
+    Le entry sono indicizzate per (model_path, backend). I chiamanti devono
+    usare entry.lock attorno all'inferenza.
+    """
+
+    BACKEND_HAAR = "haar"
+    BACKEND_DNN = "cv2_dnn"
+
+    def __init__(self):
+        self._entries: Dict[Tuple[str, str], ModelEntry] = {}
+        self._lock = Lock()
+
+    def _get_entry(self, model_path: str, backend: str) -> ModelEntry:
+        """Ottieni (o crea vuota) l'entry per una chiave"""
+        key = (model_path, backend)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                entry = ModelEntry(model_path, backend)
+                self._entries[key] = entry
+            return entry
+
+    def get_yolo(
+        self,
+        model_path: Optional[str] = None,
+        backend: Optional[str] = None,
+        int8: Optional[bool] = None,
+        warmup: bool = True
+    ) -> ModelEntry:
+        """
+        Ottieni modello YOLO condiviso, caricandolo al primo uso
+
+        Args:
+            model_path: Path al modello (default: settings.yolo_model)
+            backend: Backend di inferenza: pytorch, onnx, openvino (default: settings.yolo_backend)
+            int8: Usa variante quantizzata INT8 (default: settings.yolo_int8)
+            warmup: Esegui inferenza su frame fittizio dopo il caricamento
+        """
+        from app.vision.yolo_detector import ULTRALYTICS_AVAILABLE
+        from app.vision.yolo_backends import resolve_backend, backend_key, export_model
+        if not ULTRALYTICS_AVAILABLE:
+            raise ImportError("ultralytics non disponibile. Installa con: pip install ultralytics")
+
+        model_path = model_path or settings.yolo_model
+        backend = resolve_backend(backend)
+        int8 = settings.yolo_int8 if int8 is None else int8
+        entry = self._get_entry(model_path, backend_key(backend, int8))
+
+        with entry.lock:
+            if entry.model is None:
+                from ultralytics import YOLO
+
+                # Backend non PyTorch: export una tantum (poi riusato dalla cache)
+                load_path = export_model(model_path, backend, int8)
+
+                rss_before = _current_rss_bytes()
+                start = time.perf_counter()
+                entry.model = YOLO(load_path, task="detect")
+                entry.load_seconds = time.perf_counter() - start
+                entry.memory_bytes = self._torch_model_bytes(entry.model)
+                if entry.memory_bytes is None:
+                    entry.memory_bytes = self._rss_delta(rss_before)
+                print(f"Modello YOLO caricato: {load_path} ({entry.backend}) in {entry.load_seconds:.2f}s")
+
+            if warmup and not entry.warmed_up:
+                self._warmup_yolo(entry)
+
+            entry.users += 1
+
+        return entry
+
+    def get_face_cascade(self, cascade_path: str) -> ModelEntry:
+        """Ottieni Haar Cascade condiviso, caricandolo al primo uso"""
+        entry = self._get_entry(cascade_path, self.BACKEND_HAAR)
+
+        with entry.lock:
+            if entry.model is None and OPENCV_AVAILABLE and os.path.exists(cascade_path):
+                rss_before = _current_rss_bytes()
+                start = time.perf_counter()
+                cascade = cv2.CascadeClassifier(cascade_path)
+                entry.load_seconds = time.perf_counter() - start
+                if not cascade.empty():
+                    entry.model = cascade
+                    entry.memory_bytes = self._rss_delta(rss_before) or os.path.getsize(cascade_path)
+                    self._warmup_cascade(entry)
+
+            entry.users += 1
+
+        return entry
+
+    def get_reid_net(self, model_path: str) -> ModelEntry:
+        """Ottieni rete di re-identificazione (ONNX via cv2.dnn) condivisa, caricandola al primo uso"""
+        entry = self._get_entry(model_path, self.BACKEND_DNN)
+
+        with entry.lock:
+            if entry.model is None and OPENCV_AVAILABLE and os.path.exists(model_path):
+                rss_before = _current_rss_bytes()
+                start = time.perf_counter()
+                try:
+                    entry.model = cv2.dnn.readNet(model_path)
+                    entry.load_seconds = time.perf_counter() - start
+                    entry.memory_bytes = self._rss_delta(rss_before) or os.path.getsize(model_path)
+                    self._warmup_reid(entry)
+                    print(f"Modello re-id caricato: {model_path} in {entry.load_seconds:.2f}s")
+                except cv2.error as e:
+                    print(f"Warning: caricamento modello re-id {model_path} fallito: {e}")
+
+            entry.users += 1
+
+        return entry
+
+    def release(self, entry: ModelEntry):
+        """Segnala che un utilizzatore non usa più il modello (il modello resta residente)"""
+        with entry.lock:
+            entry.users = max(0, entry.users - 1)
+
+    def preload_default_models(self):
+        """Carica e scalda i modelli di default (da chiamare all'avvio)"""
+        # Il preload rende i modelli residenti ma non ne è un utilizzatore
+        try:
+            self.release(self.get_yolo())
+        except Exception as e:
+            print(f"Warning: preload modello YOLO fallito: {e}")
+
+        if settings.enable_face_detection and OPENCV_AVAILABLE:
+            cascade_path = settings.face_detection_model_path
+            if not cascade_path or not os.path.exists(cascade_path):
+                cascade_path = cv2.data.haarcascades + 'haarcascade_frontalface_default.xml'
+            self.release(self.get_face_cascade(cascade_path))
+
+    def get_stats(self) -> List[Dict[str, Any]]:
+        """Statistiche modelli residenti (memoria, tempi di caricamento/warmup)"""
+        with self._lock:
+            entries = list(self._entries.values())
+        return [entry.to_dict() for entry in entries]
+
+    def _warmup_yolo(self, entry: ModelEntry):
+        """Esegue un'inferenza su frame nero per pagare il cold-start subito"""
+        dummy = np.zeros(
+            (settings.camera_resolution_height, settings.camera_resolution_width, 3),
+            dtype=np.uint8
+        )
+        start = time.perf_counter()
+        try:
+            entry.model.predict(dummy, verbose=False)
+            entry.warmed_up = True
+            entry.warmup_seconds = time.perf_counter() - start
+        except Exception as e:
+            print(f"Warning: warmup modello {entry.model_path} fallito: {e}")
+
+    def _warmup_cascade(self, entry: ModelEntry):
+        """Warmup Haar Cascade su immagine fittizia"""
+        dummy = np.zeros((240, 320), dtype=np.uint8)
+        start = time.perf_counter()
+        entry.model.detectMultiScale(dummy)
+        entry.warmed_up = True
+        entry.warmup_seconds = time.perf_counter() - start
+
+    def _warmup_reid(self, entry: ModelEntry):
+        """Warmup rete re-id su un crop fittizio"""
+        dummy = np.zeros((settings.reid_input_height, settings.reid_input_width, 3), dtype=np.uint8)
+        start = time.perf_counter()
+        try:
+            entry.model.setInput(cv2.dnn.blobFromImage(
+                dummy, 1.0 / 255, (settings.reid_input_width, settings.reid_input_height)
+            ))
+            entry.model.forward()
+            entry.warmed_up = True
+            entry.warmup_seconds = time.perf_counter() - start
+        except cv2.error as e:
+            print(f"Warning: warmup modello {entry.model_path} fallito: {e}")
+
+    @staticmethod
+    def _torch_model_bytes(model) -> Optional[int]:
+        """Memoria di pesi e buffer di un modello PyTorch (None se non applicabile)"""
+        try:
+            torch_model = model.model
+            total = sum(p.numel() * p.element_size() for p in torch_model.parameters())
+            total += sum(b.numel() * b.element_size() for b in torch_model.buffers())
+            return int(total) if total > 0 else None
+        except Exception:
+            return None
+
+    @staticmethod
+    def _rss_delta(rss_before: Optional[int]) -> Optional[int]:
+        """Crescita memoria residente dal valore indicato"""
+        rss_after = _current_rss_bytes()
+        if rss_before is None or rss_after is None:
+            return None
+        return max(0, rss_after - rss_before)
+
+
+# Registro globale (singleton di processo)
+model_registry = ModelRegistry()
@@ -0,0 +1,94 @@
+"""Gate di movimento economico per saltare l'inferenza su scene statiche"""
+import cv2
+import numpy as np
+from typing import Optional, Dict, Any
+from app.config import settings
+
+
+class MotionGate:
+    """
+    Rileva cambiamenti nella scena con differenza su frame ridotto e sfondo mobile
+
+    Pensato per telecamere fisse: se la percentuale di pixel cambiati rispetto
+    allo sfondo è sotto soglia, il frame può saltare la detection YOLO.
+    """
+
+    def __init__(
+        self,
+        scale_width: Optional[int] = None,
+        pixel_threshold: Optional[int] = None,
+        min_area_ratio: Optional[float] = None,
+        max_skip_frames: Optional[int] = None,
+        background_alpha: Optional[float] = None
+    ):
+        """
+        Args:
+            scale_width: Larghezza (pixel) del frame ridotto su cui calcolare la differenza
+            pixel_threshold: Differenza di intensità (0-255) oltre cui un pixel è cambiato
+            min_area_ratio: Frazione minima di pixel cambiati per considerare movimento
+            max_skip_frames: Forza una detection dopo N frame consecutivi saltati
+            background_alpha: Velocità di aggiornamento dello sfondo (0-1)
+        """
+        self.scale_width = scale_width or settings.motion_gate_scale_width
+        self.pixel_threshold = pixel_threshold or settings.motion_gate_pixel_threshold
+        self.min_area_ratio = min_area_ratio if min_area_ratio is not None else settings.motion_gate_min_area_ratio
+        self.max_skip_frames = max_skip_frames or settings.motion_gate_max_skip_frames
+        self.background_alpha = background_alpha or settings.motion_gate_background_alpha
+
+        self.background: Optional[np.ndarray] = None
+        self.frames_skipped_in_row = 0
+
+        # Statistiche
+        self.frames_checked = 0
+        self.frames_skipped = 0
+        self.last_changed_ratio = 0.0
+
+    def has_motion(self, frame: np.ndarray) -> bool:
+        """
+        Verifica se il frame contiene movimento rispetto allo sfondo
+
+        Args:
+            frame: Frame video (BGR format)
+
+        Returns:
+            True se serve eseguire la detection sul frame
+        """
+        self.frames_checked += 1
+        small = self._preprocess(frame)
+
+        if self.background is None or self.background.shape != small.shape:
+            self.background = small.astype(np.float32)
+            self.frames_skipped_in_row = 0
+            return True
+
+        diff = cv2.absdiff(small, cv2.convertScaleAbs(self.background))
+        changed = np.count_nonzero(diff > self.pixel_threshold)
+        self.last_changed_ratio = float(changed) / diff.size
+
+        # Lo sfondo assorbe lentamente i cambiamenti di luce
+        cv2.accumulateWeighted(small, self.background, self.background_alpha)
+
+        if self.last_changed_ratio >= self.min_area_ratio or self.frames_skipped_in_row >= self.max_skip_frames:
+            self.frames_skipped_in_row = 0
+            return True
+
+        self.frames_skipped_in_row += 1
+        self.frames_skipped += 1
+        return False
+
+    def _preprocess(self, frame: np.ndarray) -> np.ndarray:
+        """Riduce, converte in grigio e sfoca il frame"""
+        h, w = frame.shape[:2]
+        if w > self.scale_width:
+            scale = self.scale_width / w
+            frame = cv2.resize(frame, (self.scale_width, max(1, int(h * scale))), interpolation=cv2.INTER_AREA)
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) if frame.ndim == 3 else frame
+        return cv2.GaussianBlur(gray, (5, 5), 0)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Statistiche gate"""
+        return {
+            'frames_checked': self.frames_checked,
+            'frames_skipped': self.frames_skipped,
+            'last_changed_ratio': self.last_changed_ratio
+        }
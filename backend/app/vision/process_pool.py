@@ -0,0 +1,543 @@
+"""Pool di processi per inferenza YOLO con frame in shared memory"""
+import os
+import time
+import queue
+import itertools
+import multiprocessing
+import numpy as np
+from multiprocessing import shared_memory
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from threading import Thread, Lock
+from typing import List, Dict, Any, Optional, Tuple
+from app.vision.detections import DetectionBatch
+from app.config import settings
+
+
+class SharedFrameRing:
+    """
+    Anello di slot per frame in un unico blocco multiprocessing.shared_memory
+
+    Il processo principale scrive il frame nello slot, il worker lo legge
+    come vista numpy sullo stesso buffer: nessun pickle del frame.
+    """
+
+    def __init__(self, num_slots: int, slot_bytes: int, name: Optional[str] = None):
+        """
+        Args:
+            num_slots: Numero di slot
+            slot_bytes: Dimensione massima di un frame (byte)
+            name: Nome blocco esistente a cui collegarsi (None = crea nuovo blocco)
+        """
+        self.num_slots = num_slots
+        self.slot_bytes = slot_bytes
+        self.owner = name is None
+
+        if self.owner:
+            self.shm = shared_memory.SharedMemory(create=True, size=num_slots * slot_bytes)
+        else:
+            # Il blocco appartiene al processo principale: il worker si limita a collegarsi
+            self.shm = shared_memory.SharedMemory(name=name)
+
+    @property
+    def name(self) -> str:
+        return self.shm.name
+
+    def slot_view(self, slot: int, shape: Tuple[int, ...]) -> np.ndarray:
+        """Vista numpy (uint8) sullo slot indicato"""
+        return np.ndarray(shape, dtype=np.uint8, buffer=self.shm.buf, offset=slot * self.slot_bytes)
+
+    def close(self):
+        """Chiude il blocco (e lo rimuove se creato da questo processo)"""
+        self.shm.close()
+        if self.owner:
+            try:
+                self.shm.unlink()
+            except FileNotFoundError:
+                pass
+
+
+# Messaggi worker -> processo principale (primo elemento della tupla)
+_MSG_READY = "ready"  # (tipo, pid, None): detector caricato
+_MSG_FAILED = "failed"  # (tipo, pid, errore): avvio fallito, il worker termina
+_MSG_RESULT = "result"  # (tipo, request_id, slot, boxes, scores, class_ids, errore)
+
+
+def _worker_main(
+    shm_name: str,
+    num_slots: int,
+    slot_bytes: int,
+    task_queue,
+    result_queue,
+    model_path: Optional[str],
+    max_batch_size: int
+):
+    """
+    Entry point processo worker: carica il detector e serve le richieste
+
+    All'avvio segnala _MSG_READY o _MSG_FAILED sulla result_queue.
+    Task: (request_id, slot, shape, tiled, imgsz) oppure None per terminare.
+    """
+    from app.vision.yolo_detector import YOLODetector
+
+    ring = SharedFrameRing(num_slots, slot_bytes, name=shm_name)
+    try:
+        detector = YOLODetector(model_path)
+    except Exception as e:
+        result_queue.put((_MSG_FAILED, os.getpid(), str(e)))
+        ring.close()
+        return
+    result_queue.put((_MSG_READY, os.getpid(), None))
+
+    running = True
+    while running:
+        task = task_queue.get()
+        if task is None:
+            break
+
+        # Raccoglie altri task già in coda per un'unica predict a batch
+        tasks = [task]
+        while len(tasks) < max_batch_size:
+            try:
+                next_task = task_queue.get_nowait()
+            except queue.Empty:
+                break
+            if next_task is None:
+                running = False
+                break
+            tasks.append(next_task)
+
+        # Frame interi raggruppati per imgsz (una predict per gruppo), tile uno per volta
+        plain: Dict[Optional[int], list] = {}
+        for t in tasks:
+            if not t[3]:
+                plain.setdefault(t[4], []).append(t)
+        tiled = [t for t in tasks if t[3]]
+        outputs = []
+
+        try:
+            for imgsz, group in plain.items():
+                frames = [ring.slot_view(slot, shape) for _, slot, shape, _, _ in group]
+                outputs.extend(zip(group, detector.detect_arrays(frames, imgsz)))
+            for t in tiled:
+                outputs.append((t, detector.detect_tiled_arrays(ring.slot_view(t[1], t[2]), t[4])))
+        except Exception as e:
+            for request_id, slot, _, _, _ in tasks:
+                result_queue.put((_MSG_RESULT, request_id, slot, None, None, None, str(e)))
+            continue
+
+        for (request_id, slot, _, _, _), batch in outputs:
+            result_queue.put((_MSG_RESULT, request_id, slot, batch.boxes, batch.scores, batch.class_ids, None))
+
+    ring.close()
+
+
+class ProcessPoolDetector:
+    """
+    Esegue l'inferenza in processi separati, fuori dal GIL del processo principale
+
+    Stessa interfaccia detect() di InferenceScheduler: i VideoProcessor
+    restano thread leggeri (decode, tracking) mentre YOLO gira nei worker.
+    I frame passano tramite SharedFrameRing, le detection tornano come
+    piccoli array su una multiprocessing.Queue.
+
+    start() attende che ogni worker segnali il caricamento del modello. Se
+    nessun worker parte, l'inferenza resta nel processo principale con un
+    YOLODetector locale. Il dispatcher controlla che i worker siano vivi:
+    alla morte di un worker libera gli slot dei task in corso, risolve le
+    richieste pendenti come non elaborate e riavvia il worker (se era partito).
+    """
+
+    def __init__(
+        self,
+        num_workers: Optional[int] = None,
+        num_slots: Optional[int] = None,
+        slot_bytes: Optional[int] = None,
+        model_path: Optional[str] = None
+    ):
+        """
+        Args:
+            num_workers: Numero processi worker
+            num_slots: Numero slot frame in shared memory
+            slot_bytes: Dimensione massima frame (byte)
+            model_path: Path modello YOLO (default: settings.yolo_model)
+        """
+        from app.vision.yolo_detector import YOLODetector
+
+        self.num_workers = max(1, num_workers or settings.process_pool_workers)
+        self.num_slots = max(self.num_workers, num_slots or settings.process_pool_slots)
+        self.slot_bytes = slot_bytes or (
+            settings.process_pool_max_frame_width * settings.process_pool_max_frame_height * 3
+        )
+        self.model_path = model_path or settings.yolo_model
+        self.class_names = YOLODetector.TARGET_CLASSES
+        self.iou_threshold = settings.yolo_iou_threshold
+
+        # spawn: i worker non ereditano thread e stato torch del processo principale
+        self._ctx = multiprocessing.get_context("spawn")
+        self.ring: Optional[SharedFrameRing] = None
+        # Protegge scrittura e chiusura della shared memory (detect() vs stop())
+        self.ring_lock = Lock()
+        self.task_queue = None
+        self.result_queue = None
+        self.workers: List[multiprocessing.Process] = []
+        self._ready_pids: set = set()  # worker che hanno caricato il modello
+
+        # Detector nel processo principale se nessun worker è disponibile
+        self.fallback = None
+        # Detector nel processo principale per i frame più grandi di uno slot (creato al primo uso)
+        self._oversize_detector = None
+        self._oversize_failed = False
+        self._oversize_lock = Lock()
+
+        self.free_slots: queue.Queue = queue.Queue()
+        self.pending: Dict[int, Future] = {}
+        self.in_flight: Dict[int, int] = {}  # request id -> slot non ancora restituito da un worker
+        self.pending_lock = Lock()
+        self._request_ids = itertools.count()
+        self.dispatcher: Optional[Thread] = None
+        self.is_running = False
+        self.lock = Lock()
+
+        # Statistiche
+        self.frames_processed = 0
+        self.frames_rejected = 0
+        self.frames_oversized = 0  # elaborati nel processo principale (oltre slot_bytes)
+        self.frames_timed_out = 0
+        self.workers_crashed = 0
+
+    def start(self):
+        """
+        Crea shared memory e avvia i worker, attendendo che carichino il modello
+
+        Raises:
+            Exception: se né i worker né il detector locale di fallback si avviano
+        """
+        with self.lock:
+            if self.is_running:
+                return
+
+            self.ring = SharedFrameRing(self.num_slots, self.slot_bytes)
+            for slot in range(self.num_slots):
+                self.free_slots.put(slot)
+
+            self.task_queue = self._ctx.Queue()
+            self.result_queue = self._ctx.Queue()
+            self.workers = [self._spawn_worker() for _ in range(self.num_workers)]
+
+            if not self._await_workers(settings.process_pool_start_timeout_seconds):
+                print("Warning: nessun worker di inferenza avviato, inferenza nel processo principale")
+                self._release_resources()
+                self._start_fallback()
+                self.is_running = True
+                return
+
+            self.is_running = True
+            self.dispatcher = Thread(target=self._dispatch_results, daemon=True)
+            self.dispatcher.start()
+            print(f"Pool inferenza avviato: {len(self.workers)} worker, {self.num_slots} slot")
+
+    def _spawn_worker(self) -> multiprocessing.Process:
+        """Avvia un processo worker collegato a ring e code correnti"""
+        worker = self._ctx.Process(
+            target=_worker_main,
+            args=(
+                self.ring.name,
+                self.num_slots,
+                self.slot_bytes,
+                self.task_queue,
+                self.result_queue,
+                self.model_path,
+                settings.inference_max_batch_size
+            ),
+            daemon=True
+        )
+        worker.start()
+        return worker
+
+    def _await_workers(self, timeout: float) -> int:
+        """
+        Attende l'esito di avvio dei worker (prima che arrivino risultati)
+
+        I worker falliti, morti o non pronti entro il timeout vengono terminati.
+
+        Returns:
+            Numero di worker pronti
+        """
+        deadline = time.monotonic() + timeout
+        waiting = {worker.pid for worker in self.workers}
+        while waiting and time.monotonic() < deadline:
+            try:
+                kind, pid, error = self.result_queue.get(timeout=0.5)
+            except queue.Empty:
+                waiting -= {worker.pid for worker in self.workers if not worker.is_alive()}
+                continue
+            waiting.discard(pid)
+            if kind == _MSG_READY:
+                self._ready_pids.add(pid)
+            else:
+                print(f"Errore avvio worker inferenza: {error}")
+
+        ready = []
+        for worker in self.workers:
+            if worker.pid in self._ready_pids and worker.is_alive():
+                ready.append(worker)
+            else:
+                worker.terminate()
+                worker.join(timeout=1.0)
+        self.workers = ready
+        return len(ready)
+
+    def _start_fallback(self):
+        """Detector YOLO nel processo principale (solleva eccezione se non disponibile)"""
+        from app.vision.yolo_detector import YOLODetector
+        self.fallback = YOLODetector(self.model_path)
+
+    def _release_resources(self):
+        """Termina i worker e rilascia code e shared memory"""
+        for _ in self.workers:
+            self.task_queue.put(None)
+        for worker in self.workers:
+            worker.join(timeout=5.0)
+            if worker.is_alive():
+                worker.terminate()
+        self.workers = []
+        self._ready_pids = set()
+
+        with self.pending_lock:
+            for future in self.pending.values():
+                if not future.done():
+                    future.set_result(None)
+            self.pending.clear()
+            self.in_flight.clear()
+
+        with self.ring_lock:
+            if self.ring is not None:
+                self.ring.close()
+                self.ring = None
+        self.free_slots = queue.Queue()
+
+    def stop(self):
+        """Ferma i worker e rilascia la shared memory"""
+        with self.lock:
+            if not self.is_running:
+                return
+            self.is_running = False
+
+            if self.dispatcher:
+                self.dispatcher.join(timeout=2.0)
+                self.dispatcher = None
+
+            self._release_resources()
+
+            if self.fallback is not None:
+                self.fallback.close()
+                self.fallback = None
+
+        with self._oversize_lock:
+            if self._oversize_detector is not None:
+                self._oversize_detector.close()
+                self._oversize_detector = None
+            self._oversize_failed = False
+
+    def detect(
+        self,
+        frame: np.ndarray,
+        source_id: str = "",
+        tiled: bool = False,
+        imgsz: Optional[int] = None
+    ) -> Optional[List[Dict[str, Any]]]:
+        """
+        Rileva oggetti in un frame tramite i worker (bloccante)
+
+        Args:
+            frame: Frame video (BGR format)
+            source_id: ID sorgente (per log)
+            tiled: Detection a tile (eseguita interamente nel worker)
+            imgsz: Dimensione input inferenza (deciso dal controllo adattivo di latenza)
+
+        Returns:
+            Lista detection, o None se il frame non è stato elaborato entro
+            target_latency_seconds (da non confondere con una scena vuota).
+            I frame più grandi di uno slot vengono elaborati nel processo principale.
+        """
+        if not self.is_running:
+            self.start()
+
+        fallback = self.fallback
+        if fallback is not None:
+            return fallback.detect_tiled(frame, imgsz) if tiled else fallback.detect(frame, imgsz)
+
+        if frame.nbytes > self.slot_bytes:
+            # Non entra nella shared memory: inferenza nel processo principale
+            detector = self._get_oversize_detector(frame, source_id)
+            if detector is None:
+                self.frames_rejected += 1
+                return None
+            self.frames_oversized += 1
+            return detector.detect_tiled(frame, imgsz) if tiled else detector.detect(frame, imgsz)
+
+        deadline = time.monotonic() + settings.target_latency_seconds
+        free_slots = self.free_slots
+        try:
+            slot = free_slots.get(timeout=settings.target_latency_seconds)
+        except queue.Empty:
+            # Tutti gli slot occupati: i worker sono saturi, il frame sarebbe comunque in ritardo
+            self.frames_rejected += 1
+            return None
+
+        request_id = next(self._request_ids)
+        future: Future = Future()
+        with self.ring_lock:
+            if not self.is_running or self.ring is None or free_slots is not self.free_slots:
+                return None  # Pool fermato (o passato al fallback) durante l'attesa
+
+            # Unica copia del frame: direttamente nella shared memory
+            np.copyto(self.ring.slot_view(slot, frame.shape), frame)
+            with self.pending_lock:
+                self.pending[request_id] = future
+                self.in_flight[request_id] = slot
+            self.task_queue.put((request_id, slot, frame.shape, tiled, imgsz))
+
+        try:
+            batch = future.result(timeout=max(0.0, deadline - time.monotonic()))
+        except FutureTimeoutError:
+            # Lo slot verrà liberato dal dispatcher quando arriva il risultato
+            with self.pending_lock:
+                self.pending.pop(request_id, None)
+            self.frames_timed_out += 1
+            return None
+
+        if batch is None:
+            return None  # Worker terminato con il frame in corso
+        return batch.to_dicts()
+
+    def _get_oversize_detector(self, frame: np.ndarray, source_id: str):
+        """
+        Detector locale per i frame oltre slot_bytes (avvisa una sola volta)
+
+        Returns:
+            YOLODetector, o None se non è stato possibile caricarlo
+        """
+        with self._oversize_lock:
+            if self._oversize_detector is None and not self._oversize_failed:
+                print(
+                    f"Warning: frame {frame.shape} di {source_id} oltre la dimensione degli slot shared memory "
+                    f"(process_pool_max_frame_*), inferenza nel processo principale"
+                )
+                try:
+                    from app.vision.yolo_detector import YOLODetector
+                    self._oversize_detector = YOLODetector(self.model_path)
+                except Exception as e:
+                    print(f"Errore avvio detector per frame grandi, frame non elaborati: {e}")
+                    self._oversize_failed = True
+            return self._oversize_detector
+
+    def _dispatch_results(self):
+        """Riceve risultati dai worker, libera gli slot, risolve le richieste e sorveglia i worker"""
+        last_check = time.monotonic()
+        while self.is_running:
+            if time.monotonic() - last_check > 0.5:
+                last_check = time.monotonic()
+                if not self._check_workers():
+                    break
+            try:
+                message = self.result_queue.get(timeout=0.2)
+            except queue.Empty:
+                continue
+            except (EOFError, OSError):
+                break
+
+            if message[0] == _MSG_READY:
+                self._ready_pids.add(message[1])
+                continue
+            if message[0] == _MSG_FAILED:
+                print(f"Errore avvio worker inferenza: {message[2]}")
+                continue
+
+            _, request_id, slot, boxes, scores, class_ids, error = message
+            with self.pending_lock:
+                if self.in_flight.pop(request_id, None) == slot:
+                    self.free_slots.put(slot)
+                future = self.pending.pop(request_id, None)
+            if future is None:
+                continue  # Richiesta già scaduta
+
+            if error is not None:
+                print(f"Errore inferenza worker: {error}")
+                future.set_result(DetectionBatch.empty(self.class_names))
+            else:
+                self.frames_processed += 1
+                future.set_result(DetectionBatch(boxes, scores, class_ids, self.class_names))
+
+    def _check_workers(self) -> bool:
+        """
+        Gestisce i worker terminati
+
+        Un worker ucciso mentre attende sulla coda può lasciarne bloccato il
+        lock interno: code nuove e riavvio di tutti i worker (quelli terminati
+        senza aver mai caricato il modello non vengono riavviati). Gli slot dei
+        task in corso vengono liberati e le richieste pendenti risolte come non
+        elaborate. Se non resta nessun worker l'inferenza passa al detector nel
+        processo principale.
+
+        Returns:
+            False se il pool è passato al fallback (il dispatcher termina)
+        """
+        dead = [worker for worker in self.workers if not worker.is_alive()]
+        if not dead:
+            return True
+
+        self.workers_crashed += len(dead)
+        alive = [worker for worker in self.workers if worker.is_alive()]
+        restart_count = len(alive) + sum(1 for worker in dead if worker.pid in self._ready_pids)
+        print(f"Warning: {len(dead)} worker di inferenza terminati, riavvio di {restart_count} worker")
+        for worker in alive:
+            worker.terminate()
+            worker.join(timeout=1.0)
+
+        # Stesso ordine di lock di detect(): nessun task può finire sulle code vecchie
+        with self.ring_lock, self.pending_lock:
+            for slot in self.in_flight.values():
+                self.free_slots.put(slot)
+            self.in_flight.clear()
+            for future in self.pending.values():
+                if not future.done():
+                    future.set_result(None)
+            self.pending.clear()
+
+            for old_queue in (self.task_queue, self.result_queue):
+                old_queue.close()
+                old_queue.cancel_join_thread()
+            self.task_queue = self._ctx.Queue()
+            self.result_queue = self._ctx.Queue()
+            self._ready_pids = set()
+            self.workers = [self._spawn_worker() for _ in range(restart_count)]
+
+        if self.workers:
+            return True
+
+        print("Warning: nessun worker di inferenza disponibile, inferenza nel processo principale")
+        try:
+            self._start_fallback()
+        except Exception as e:
+            print(f"Errore avvio detector di fallback: {e}")
+            return True  # Nessuna alternativa: le richieste continuano a scadere
+        self._release_resources()
+        return False
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Statistiche pool"""
+        return {
+            'is_running': self.is_running,
+            'in_process_fallback': self.fallback is not None,
+            'workers': len(self.workers),
+            'workers_alive': sum(1 for w in self.workers if w.is_alive()),
+            'workers_crashed': self.workers_crashed,
+            'slots': self.num_slots,
+            'free_slots': self.free_slots.qsize(),
+            'pending': len(self.pending),
+            'frames_processed': self.frames_processed,
+            'frames_rejected': self.frames_rejected,
+            'frames_oversized': self.frames_oversized,
+            'frames_timed_out': self.frames_timed_out
+        }
@@ -0,0 +1,108 @@
+"""Embedding di aspetto per la re-identificazione dei track"""
+import os
+import cv2
+import numpy as np
+from typing import List, Optional
+from app.vision.model_registry import model_registry
+from app.config import settings
+
+
+class AppearanceEmbedder:
+    """
+    Calcola embedding normalizzati (L2) dei crop delle detection
+
+    Con un modello ONNX (settings.reid_model_path, es. OSNet) tutti i crop di
+    un frame passano in un'unica inferenza batch via cv2.dnn. Senza modello
+    usa istogrammi colore HSV delle metà alta e bassa del crop: meno
+    discriminanti ma senza dipendenze e a costo trascurabile.
+    """
+
+    # Normalizzazione ImageNet attesa dai modelli re-id più comuni (ordine RGB)
+    MEAN = np.array([0.485, 0.456, 0.406], dtype=np.float32)
+    STD = np.array([0.229, 0.224, 0.225], dtype=np.float32)
+    # Bin istogramma (tonalità, saturazione) e dimensione crop ridotto
+    HIST_BINS = [16, 8]
+    HIST_CROP_SIZE = (32, 64)
+
+    def __init__(self, model_path: Optional[str] = None):
+        """
+        Args:
+            model_path: Modello ONNX di re-id (default: settings.reid_model_path)
+        """
+        model_path = model_path or settings.reid_model_path
+        self.input_size = (settings.reid_input_width, settings.reid_input_height)
+        self.model_entry = None
+        self.net = None
+        self._released = False
+
+        if model_path:
+            if os.path.exists(model_path):
+                self.model_entry = model_registry.get_reid_net(model_path)
+                self.net = self.model_entry.model
+            else:
+                print(f"Warning: modello re-id non trovato: {model_path}. Uso istogrammi colore")
+
+        self.backend = "onnx" if self.net is not None else "hsv_histogram"
+
+    def embed(self, frame: np.ndarray, bboxes: List[List[float]]) -> np.ndarray:
+        """
+        Embedding dei crop indicati, in un solo batch
+
+        Args:
+            frame: Frame BGR
+            bboxes: Lista di box [x1, y1, x2, y2]
+
+        Returns:
+            Array KxD float32 con righe a norma unitaria
+        """
+        crops = self._crops(frame, bboxes)
+        if not crops:
+            return np.zeros((0, 0), dtype=np.float32)
+
+        if self.net is not None:
+            embeddings = self._embed_dnn(crops)
+        else:
+            embeddings = np.stack([self._histogram(crop) for crop in crops])
+
+        norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+        return embeddings / np.maximum(norms, 1e-12)
+
+    def close(self):
+        """Rilascia la rete re-id condivisa nel registro (il modello resta residente)"""
+        if self.model_entry is not None and not self._released:
+            self._released = True
+            model_registry.release(self.model_entry)
+    
+    def _crops(self, frame: np.ndarray, bboxes: List[List[float]]) -> List[np.ndarray]:
+        """Ritaglia i box (limitati al frame, almeno 1x1 pixel)"""
+        height, width = frame.shape[:2]
+        crops = []
+        for x1, y1, x2, y2 in bboxes:
+            x1 = min(max(int(x1), 0), width - 1)
+            y1 = min(max(int(y1), 0), height - 1)
+            x2 = min(max(int(x2), x1 + 1), width)
+            y2 = min(max(int(y2), y1 + 1), height)
+            crops.append(frame[y1:y2, x1:x2])
+        return crops
+
+    def _embed_dnn(self, crops: List[np.ndarray]) -> np.ndarray:
+        """Inferenza batch della rete re-id"""
+        blob = cv2.dnn.blobFromImages(crops, 1.0 / 255, self.input_size, swapRB=True)
+        blob = (blob - self.MEAN[None, :, None, None]) / self.STD[None, :, None, None]
+        # La rete cv2.dnn non è thread-safe ed è condivisa tra le sorgenti
+        with self.model_entry.lock:
+            self.net.setInput(blob)
+            output = self.net.forward()
+        return output.reshape(len(crops), -1).astype(np.float32)
+
+    def _histogram(self, crop: np.ndarray) -> np.ndarray:
+        """Istogrammi HSV (tonalità x saturazione) di metà alta e bassa del crop"""
+        small = cv2.resize(crop, self.HIST_CROP_SIZE, interpolation=cv2.INTER_AREA)
+        hsv = cv2.cvtColor(small, cv2.COLOR_BGR2HSV)
+        half = hsv.shape[0] // 2
+        parts = [
+            cv2.calcHist([part], [0, 1], None, self.HIST_BINS, [0, 180, 0, 256]).ravel()
+            for part in (hsv[:half], hsv[half:])
+        ]
+        # Radice quadrata: distanza coseno ~ distanza di Hellinger tra istogrammi
+        return np.sqrt(np.concatenate(parts)).astype(np.float32)
@@ -0,0 +1,140 @@
+"""Utility per inferenza a tile su frame ad alta risoluzione (oggetti piccoli da drone)"""
+import numpy as np
+from typing import List, Tuple
+from app.vision.detections import DetectionBatch
+from app.config import settings
+
+Tile = Tuple[int, int, int, int]  # (x1, y1, x2, y2) in pixel frame
+
+
+def compute_tiles(width: int, height: int, tile_size: int, overlap: float) -> List[Tile]:
+    """
+    Calcola tile sovrapposti che coprono l'intero frame
+
+    L'ultimo tile di ogni riga/colonna è allineato al bordo del frame, così
+    tutti i tile hanno la stessa dimensione (utile per il batch).
+
+    Args:
+        width: Larghezza frame
+        height: Altezza frame
+        tile_size: Lato del tile (pixel)
+        overlap: Sovrapposizione tra tile adiacenti (0-1)
+    """
+    def _starts(length: int) -> List[int]:
+        if length <= tile_size:
+            return [0]
+        stride = max(1, int(tile_size * (1.0 - overlap)))
+        starts = list(range(0, length - tile_size, stride))
+        starts.append(length - tile_size)
+        return starts
+
+    tiles = []
+    for y in _starts(height):
+        for x in _starts(width):
+            tiles.append((x, y, min(x + tile_size, width), min(y + tile_size, height)))
+    return tiles
+
+
+def split_frame(
+    frame: np.ndarray,
+    tile_size: int = None,
+    overlap: float = None,
+    include_full_frame: bool = None
+) -> Tuple[List[np.ndarray], List[Tuple[int, int]]]:
+    """
+    Divide un frame in tile (viste, nessuna copia)
+
+    Returns:
+        Tuple (immagini, offset) con offset (x, y) di ogni immagine nel frame.
+        Se include_full_frame, l'ultima immagine è il frame intero (per oggetti grandi
+        tagliati dai tile).
+    """
+    tile_size = tile_size or settings.tiled_inference_tile_size
+    overlap = settings.tiled_inference_overlap if overlap is None else overlap
+    if include_full_frame is None:
+        include_full_frame = settings.tiled_inference_include_full_frame
+
+    h, w = frame.shape[:2]
+    tiles = compute_tiles(w, h, tile_size, overlap)
+
+    images = [frame[y1:y2, x1:x2] for (x1, y1, x2, y2) in tiles]
+    offsets = [(x1, y1) for (x1, y1, _, _) in tiles]
+
+    if include_full_frame and len(tiles) > 1:
+        images.append(frame)
+        offsets.append((0, 0))
+
+    return images, offsets
+
+
+def non_max_suppression(
+    boxes: np.ndarray,
+    scores: np.ndarray,
+    class_ids: np.ndarray,
+    iou_threshold: float
+) -> np.ndarray:
+    """
+    NMS per classe (una classe non sopprime mai un'altra)
+
+    Args:
+        boxes: Array Nx4 [x1, y1, x2, y2]
+        scores: Array N confidenze
+        class_ids: Array N classi
+        iou_threshold: Soglia IoU di soppressione
+
+    Returns:
+        Indici delle box mantenute, in ordine di confidenza decrescente
+    """
+    if len(boxes) == 0:
+        return np.empty(0, dtype=np.int64)
+
+    # Sposta ogni classe in una regione disgiunta: un solo passaggio NMS per tutte
+    offset = class_ids.astype(np.float64)[:, None] * (boxes.max() + 1.0)
+    shifted = boxes.astype(np.float64) + offset
+
+    x1, y1, x2, y2 = shifted[:, 0], shifted[:, 1], shifted[:, 2], shifted[:, 3]
+    areas = np.maximum(0.0, x2 - x1) * np.maximum(0.0, y2 - y1)
+    order = np.argsort(-scores, kind='stable')
+
+    keep = []
+    while order.size > 0:
+        i = order[0]
+        keep.append(i)
+        rest = order[1:]
+        xx1 = np.maximum(x1[i], x1[rest])
+        yy1 = np.maximum(y1[i], y1[rest])
+        xx2 = np.minimum(x2[i], x2[rest])
+        yy2 = np.minimum(y2[i], y2[rest])
+        inter = np.maximum(0.0, xx2 - xx1) * np.maximum(0.0, yy2 - yy1)
+        union = areas[i] + areas[rest] - inter
+        iou = np.where(union > 0, inter / np.maximum(union, 1e-9), 0.0)
+        order = rest[iou <= iou_threshold]
+
+    return np.asarray(keep, dtype=np.int64)
+
+
+def merge_tile_batches(
+    batches: List[DetectionBatch],
+    offsets: List[Tuple[int, int]],
+    iou_threshold: float = None
+) -> DetectionBatch:
+    """
+    Riporta le detection dei tile in coordinate frame e rimuove i duplicati sulle giunzioni
+
+    Args:
+        batches: Detection per ogni immagine restituita da split_frame
+        offsets: Offset (x, y) di ogni immagine
+        iou_threshold: Soglia NMS (default: settings.yolo_iou_threshold)
+    """
+    iou_threshold = settings.yolo_iou_threshold if iou_threshold is None else iou_threshold
+    class_names = batches[0].class_names if batches else {}
+
+    merged = DetectionBatch.concatenate(
+        [batch.shifted(ox, oy) for batch, (ox, oy) in zip(batches, offsets) if len(batch)],
+        class_names
+    )
+    if len(merged) <= 1:
+        return merged
+
+    keep = non_max_suppression(merged.boxes, merged.scores, merged.class_ids, iou_threshold)
+    return merged.select(keep)
@@ -0,0 +1,125 @@
+"""Stato dei track in forma di array paralleli (struct-of-arrays) con riuso degli slot"""
+import numpy as np
+from typing import Dict, List, Optional
+
+
+class TrackStore:
+    """
+    Track attivi in array preallocati, indicizzati per slot
+
+    Ogni track occupa uno slot; gli slot liberati vengono riusati dai track
+    successivi, quindi la memoria resta proporzionale al numero massimo di
+    oggetti contemporanei e non al numero di oggetti visti. Invecchiamento,
+    scadenza e filtro sugli hit diventano operazioni su maschere di array.
+    Il centro del box non è memorizzato: è sempre il centro di bbox.
+    """
+
+    def __init__(self, capacity: int = 64):
+        """
+        Args:
+            capacity: Slot preallocati (raddoppiano quando esauriti)
+        """
+        self.ids = np.zeros(capacity, dtype=np.int64)
+        self.active = np.zeros(capacity, dtype=bool)
+        self.bbox = np.zeros((capacity, 4), dtype=np.float64)
+        self.velocity = np.zeros((capacity, 2), dtype=np.float64)  # pixel/frame
+        self.measured_center = np.zeros((capacity, 2), dtype=np.float64)
+        self.measured_frame = np.zeros(capacity, dtype=np.int64)
+        self.class_id = np.zeros(capacity, dtype=np.int64)
+        self.confidence = np.zeros(capacity, dtype=np.float64)
+        self.age = np.zeros(capacity, dtype=np.int64)
+        self.hits = np.zeros(capacity, dtype=np.int64)
+        self.time_since_update = np.zeros(capacity, dtype=np.int64)
+
+        self.class_names: Dict[int, str] = {}  # id classe -> nome (ultimo visto)
+        self.index: Dict[int, int] = {}  # track id -> slot
+        self._free: List[int] = list(range(capacity - 1, -1, -1))  # pila: slot bassi per primi
+
+    _ARRAYS = (
+        'ids', 'active', 'bbox', 'velocity', 'measured_center', 'measured_frame',
+        'class_id', 'confidence', 'age', 'hits', 'time_since_update'
+    )
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    def __contains__(self, track_id: int) -> bool:
+        return track_id in self.index
+
+    @property
+    def capacity(self) -> int:
+        return len(self.ids)
+
+    def _grow(self):
+        """Raddoppia la capacità mantenendo gli slot esistenti"""
+        old = self.capacity
+        new = max(1, 2 * old)
+        for name in self._ARRAYS:
+            array = getattr(self, name)
+            grown = np.zeros((new,) + array.shape[1:], dtype=array.dtype)
+            grown[:old] = array
+            setattr(self, name, grown)
+        self._free = list(range(new - 1, old - 1, -1)) + self._free
+
+    def add(
+        self,
+        track_id: int,
+        bbox: List[float],
+        class_id: int,
+        class_name: str,
+        confidence: float,
+        frame: int
+    ) -> int:
+        """
+        Crea un track nel primo slot libero
+
+        Returns:
+            Slot assegnato
+        """
+        if not self._free:
+            self._grow()
+        slot = self._free.pop()
+
+        self.ids[slot] = track_id
+        self.active[slot] = True
+        self.bbox[slot] = bbox
+        self.velocity[slot] = 0.0
+        self.measured_center[slot] = self.centers(slot)
+        self.measured_frame[slot] = frame
+        self.class_id[slot] = class_id
+        self.confidence[slot] = confidence
+        self.age[slot] = 0
+        self.hits[slot] = 1
+        self.time_since_update[slot] = 0
+        self.class_names[class_id] = class_name
+
+        self.index[track_id] = slot
+        return slot
+
+    def remove(self, slots: np.ndarray):
+        """Libera gli slot indicati (i dati restano finché lo slot viene riusato)"""
+        slots = np.asarray(slots, dtype=np.int64).reshape(-1)
+        if slots.size == 0:
+            return
+        self.active[slots] = False
+        for track_id in self.ids[slots].tolist():
+            del self.index[track_id]
+        self._free.extend(sorted(slots.tolist(), reverse=True))
+
+    def active_slots(self) -> np.ndarray:
+        """Slot attivi ordinati per track id (ordine di creazione)"""
+        slots = np.flatnonzero(self.active)
+        return slots[np.argsort(self.ids[slots], kind='stable')]
+
+    def slot_of(self, track_id: int) -> Optional[int]:
+        """Slot del track (None se non esiste)"""
+        return self.index.get(track_id)
+
+    def centers(self, slots) -> np.ndarray:
+        """Centri dei box degli slot indicati"""
+        bbox = self.bbox[slots]
+        return (bbox[..., :2] + bbox[..., 2:]) / 2.0
+
+    def class_name_list(self, slots: np.ndarray) -> List[str]:
+        """Nomi classe degli slot indicati"""
+        return [self.class_names.get(class_id, str(class_id)) for class_id in self.class_id[slots].tolist()]
@@ -1,33 +1,105 @@
 """Object tracker per mantenere ID consistenti tra frame"""
 from typing import List, Dict, Any, Optional
 import numpy as np
-from collections import defaultdict
+from collections import deque
+from app.config import settings
+from app.vision.kalman import BatchedKalmanBoxFilter
+from app.vision.track_store import TrackStore
+from app.vision.assignment import gated_assignment
+from app.vision.reid import AppearanceEmbedder
 
-try:
-    from deep_sort import DeepSort
-    DEEPSORT_AVAILABLE = True
-except ImportError:
-    DEEPSORT_AVAILABLE = False
-    # Fallback a tracker semplice basato su IoU
-    print("Warning: deep_sort non disponibile. Userò tracker IoU-based semplice")
+
+def iou_matrix(boxes_a: np.ndarray, boxes_b: np.ndarray) -> np.ndarray:
+    """
+    IoU tra tutte le coppie di box in un'unica operazione vettoriale
+    
+    Args:
+        boxes_a: Array Nx4 [x1, y1, x2, y2]
+        boxes_b: Array Mx4 [x1, y1, x2, y2]
+    
+    Returns:
+        Matrice NxM di IoU
+    """
+    boxes_a = np.asarray(boxes_a, dtype=np.float64).reshape(-1, 4)
+    boxes_b = np.asarray(boxes_b, dtype=np.float64).reshape(-1, 4)
+    
+    inter_w = np.clip(
+        np.minimum(boxes_a[:, None, 2], boxes_b[None, :, 2]) - np.maximum(boxes_a[:, None, 0], boxes_b[None, :, 0]),
+        0.0, None
+    )
+    inter_h = np.clip(
+        np.minimum(boxes_a[:, None, 3], boxes_b[None, :, 3]) - np.maximum(boxes_a[:, None, 1], boxes_b[None, :, 1]),
+        0.0, None
+    )
+    inter = inter_w * inter_h
+    
+    area_a = (boxes_a[:, 2] - boxes_a[:, 0]) * (boxes_a[:, 3] - boxes_a[:, 1])
+    area_b = (boxes_b[:, 2] - boxes_b[:, 0]) * (boxes_b[:, 3] - boxes_b[:, 1])
+    union = area_a[:, None] + area_b[None, :] - inter
+    
+    return np.divide(inter, union, out=np.zeros_like(inter), where=union > 0)
 
 
 class SimpleIOUTracker:
-    """Tracker semplice basato su IoU (Intersection over Union)"""
+    """
+    Tracker semplice basato su IoU (Intersection over Union)
+    
+    Modelli di moto:
+    - "velocity": velocità media mobile tra misure, box spostati rigidamente
+    - "kalman": filtro di Kalman a velocità costante (stile SORT) su tutti i
+      track in forma batch; l'associazione avviene contro i box predetti
     
-    def __init__(self, max_age: int = 30, min_hits: int = 3, iou_threshold: float = 0.3):
+    Associazione:
+    - "greedy": per detection, in ordine, il track con IoU massimo
+    - "hungarian": assegnamento ottimo su costo 1 - IoU, con gating su soglia
+      IoU e classe, risolto per blocchi indipendenti
+    """
+    
+    # Smoothing esponenziale della velocità stimata (0-1, più alto = più reattivo)
+    VELOCITY_SMOOTHING = 0.5
+    # Spostamento predetto (in frazione del lato minore del box) oltre il quale un track è incerto
+    UNCERTAIN_DISPLACEMENT_RATIO = 0.5
+    
+    def __init__(
+        self,
+        max_age: int = 30,
+        min_hits: int = 3,
+        iou_threshold: float = 0.3,
+        motion_model: Optional[str] = None,
+        association: Optional[str] = None
+    ):
         """
         Args:
             max_age: Numero massimo di frame senza match prima di rimuovere track
             min_hits: Numero minimo di match prima di considerare track valido
             iou_threshold: Soglia IoU minima per associare detection a track
+            motion_model: "velocity" o "kalman" (None = settings.tracker_motion_model)
+            association: "greedy" o "hungarian" (None = settings.tracker_association)
         """
+        motion_model = motion_model or settings.tracker_motion_model
+        if motion_model not in ("velocity", "kalman"):
+            print(f"Warning: modello di moto '{motion_model}' sconosciuto, uso 'velocity'")
+            motion_model = "velocity"
+        self.motion_model = motion_model
+        # Stato di Kalman indicizzato per slot dello store
+        self.kalman: Optional[BatchedKalmanBoxFilter] = (
+            BatchedKalmanBoxFilter() if motion_model == "kalman" else None
+        )
+        
+        association = association or settings.tracker_association
+        if association not in ("greedy", "hungarian"):
+            print(f"Warning: associazione '{association}' sconosciuta, uso 'greedy'")
+            association = "greedy"
+        self.association = association
+        
         self.max_age = max_age
         self.min_hits = min_hits
         self.iou_threshold = iou_threshold
-        self.tracks: Dict[int, Dict[str, Any]] = {}
+        self.store = TrackStore()
         self.next_id = 1
         self.frame_count = 0
+        # True se l'ultimo update ha visto comparire/sparire oggetti confermati
+        self.last_update_uncertain = False
     
     def update(self, detections: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
         """
@@ -40,137 +112,530 @@ class SimpleIOUTracker:
             Lista di detection con track_id aggiunto
         """
         self.frame_count += 1
+        self.last_update_uncertain = False
+        store = self.store
+        
+        if self.kalman is not None:
+            # Associa contro i box predetti per il frame corrente
+            self.kalman.predict()
+            self._sync_from_kalman()
+        
+        # Snapshot ordinato degli slot: gli indici dell'associazione si riferiscono a questo
+        slots = store.active_slots()
         
         if not detections:
             # Nessuna detection, incrementa age di tutti i track
-            for track_id in list(self.tracks.keys()):
-                self.tracks[track_id]['age'] += 1
-                if self.tracks[track_id]['age'] > self.max_age:
-                    del self.tracks[track_id]
+            # (incerto solo al primo frame mancato di un track confermato)
+            self.last_update_uncertain = bool(
+                ((store.hits[slots] >= self.min_hits) & (store.age[slots] == 0)).any()
+            )
+            store.age[slots] += 1
+            self._expire(slots)
             return []
         
         # Calcola IoU tra detections e tracks esistenti
         matched, unmatched_dets, unmatched_trks = self._associate_detections_to_trackers(
-            detections, list(self.tracks.values())
+            detections, slots
         )
         
-        # Aggiorna matched tracks
-        for det_idx, trk_idx in matched:
-            track = list(self.tracks.values())[trk_idx]
-            track_id = track['id']
-            self.tracks[track_id].update({
-                'bbox': detections[det_idx]['bbox'],
-                'center': detections[det_idx]['center'],
-                'class_id': detections[det_idx]['class_id'],
-                'class_name': detections[det_idx]['class_name'],
-                'confidence': detections[det_idx]['confidence'],
-                'age': 0,
-                'hits': track['hits'] + 1,
-                'time_since_update': 0
-            })
-            detections[det_idx]['track_id'] = track_id
+        # Aggiorna matched tracks (in blocco sugli slot)
+        if matched:
+            det_indices = [det_idx for det_idx, _ in matched]
+            matched_slots = slots[[trk_idx for _, trk_idx in matched]]
+            boxes = np.array([detections[d]['bbox'] for d in det_indices], dtype=np.float64)
+            centers = (boxes[:, :2] + boxes[:, 2:]) / 2.0
+            
+            if self.kalman is None:
+                self._estimate_velocity(matched_slots, centers)
+            store.bbox[matched_slots] = boxes
+            store.class_id[matched_slots] = [detections[d]['class_id'] for d in det_indices]
+            store.confidence[matched_slots] = [detections[d]['confidence'] for d in det_indices]
+            store.age[matched_slots] = 0
+            store.hits[matched_slots] += 1
+            store.time_since_update[matched_slots] = 0
+            store.measured_center[matched_slots] = centers
+            store.measured_frame[matched_slots] = self.frame_count
+            
+            if self.kalman is not None:
+                # Correzione batch di tutti i track misurati
+                slot_list = matched_slots.tolist()
+                self.kalman.update(slot_list, boxes)
+                store.velocity[matched_slots] = self.kalman.velocities(slot_list)
+            
+            for det_idx, track_id in zip(det_indices, store.ids[matched_slots].tolist()):
+                det = detections[det_idx]
+                det['track_id'] = track_id
+                store.class_names[det['class_id']] = det['class_name']
+            
+            # Oggetto nuovo: solo se rivisto in almeno due detection e non ancora oltre la conferma
+            # (falsi positivi e volti di un solo frame non anticipano la detection)
+            hits = store.hits[matched_slots]
+            if ((hits >= 2) & (hits <= self.min_hits)).any():
+                self.last_update_uncertain = True
         
         # Crea nuovi tracks per detection non matched
         for det_idx in unmatched_dets:
+            det = detections[det_idx]
             track_id = self.next_id
             self.next_id += 1
-            self.tracks[track_id] = {
-                'id': track_id,
-                'bbox': detections[det_idx]['bbox'],
-                'center': detections[det_idx]['center'],
-                'class_id': detections[det_idx]['class_id'],
-                'class_name': detections[det_idx]['class_name'],
-                'confidence': detections[det_idx]['confidence'],
-                'age': 0,
-                'hits': 1,
-                'time_since_update': 0
-            }
-            detections[det_idx]['track_id'] = track_id
+            slot = store.add(
+                track_id, det['bbox'], det['class_id'], det['class_name'], det['confidence'], self.frame_count
+            )
+            if self.kalman is not None:
+                self.kalman.add(slot, det['bbox'])
+            det['track_id'] = track_id
+        
+        if unmatched_dets and self.min_hits <= 1:
+            # Track confermati già alla creazione
+            self.last_update_uncertain = True
         
-        # Rimuovi tracks troppo vecchi o non matched
-        for trk_idx in unmatched_trks:
-            track_id = list(self.tracks.keys())[trk_idx]
-            self.tracks[track_id]['age'] += 1
-            if self.tracks[track_id]['age'] > self.max_age:
-                del self.tracks[track_id]
+        # Invecchia e rimuovi tracks non matched
+        # (slot dallo snapshot: i track creati sopra non spostano gli indici)
+        if unmatched_trks:
+            stale = slots[unmatched_trks]
+            # Oggetto sparito: solo al primo frame mancato, non per tutta la permanenza in memoria
+            if ((store.hits[stale] >= self.min_hits) & (store.age[stale] == 0)).any():
+                self.last_update_uncertain = True
+            store.age[stale] += 1
+            self._expire(stale)
         
         # Filtra solo tracks con hits sufficienti
-        tracked_detections = [
-            det for det in detections 
-            if 'track_id' in det and self.tracks[det['track_id']]['hits'] >= self.min_hits
-        ]
+        tracked_detections = []
+        for det in detections:
+            slot = store.slot_of(det.get('track_id'))
+            if slot is not None and store.hits[slot] >= self.min_hits:
+                det['velocity'] = store.velocity[slot].tolist()
+                tracked_detections.append(det)
         
         return tracked_detections
     
-    def _iou(self, box1: List[float], box2: List[float]) -> float:
-        """Calcola IoU tra due bounding box"""
-        x1_1, y1_1, x2_1, y2_1 = box1
-        x1_2, y1_2, x2_2, y2_2 = box2
+    def predict(self, apply_motion: bool = True) -> List[Dict[str, Any]]:
+        """
+        Avanza i track di un frame usando solo il modello di moto (nessuna detection)
+        
+        I track non invecchiano: in assenza di detection non c'è evidenza che
+        siano spariti. Vengono restituiti solo i track confermati associati
+        all'ultima detection: un track già mancato resta in memoria per il
+        recupero ma non viene disegnato come oggetto fantasma.
+        
+        Args:
+            apply_motion: Se False i track restano fermi (scena statica, es. motion gate)
+        
+        Returns:
+            Lista di detection predette per i track confermati
+        """
+        self.frame_count += 1
+        store = self.store
         
-        # Area di intersezione
-        xi1 = max(x1_1, x1_2)
-        yi1 = max(y1_1, y1_2)
-        xi2 = min(x2_1, x2_2)
-        yi2 = min(y2_1, y2_2)
+        if apply_motion and self.kalman is not None:
+            self.kalman.predict()
+            self._sync_from_kalman()
         
-        inter_area = max(0, xi2 - xi1) * max(0, yi2 - yi1)
+        slots = store.active_slots()
+        if apply_motion and self.kalman is None:
+            store.bbox[slots] += np.tile(store.velocity[slots], 2)
+        store.time_since_update[slots] += 1
+        
+        confirmed = slots[(store.hits[slots] >= self.min_hits) & (store.age[slots] == 0)]
+        if confirmed.size == 0:
+            return []
+        
+        # Una sola conversione a liste Python per array
+        return [
+            {
+                'bbox': bbox,
+                'center': center,
+                'class_id': class_id,
+                'class_name': class_name,
+                'confidence': confidence,
+                'track_id': track_id,
+                'velocity': velocity,
+                'predicted': True
+            }
+            for bbox, center, class_id, class_name, confidence, track_id, velocity in zip(
+                store.bbox[confirmed].tolist(),
+                store.centers(confirmed).tolist(),
+                store.class_id[confirmed].tolist(),
+                store.class_name_list(confirmed),
+                store.confidence[confirmed].tolist(),
+                store.ids[confirmed].tolist(),
+                store.velocity[confirmed].tolist()
+            )
+        ]
+    
+    def is_uncertain(self) -> bool:
+        """
+        Verifica se la predizione non è più affidabile e serve una detection completa
         
-        # Area di unione
-        box1_area = (x2_1 - x1_1) * (y2_1 - y1_1)
-        box2_area = (x2_2 - x1_2) * (y2_2 - y1_2)
-        union_area = box1_area + box2_area - inter_area
+        Incerto se l'ultimo update ha visto oggetti comparire/sparire, oppure se
+        lo spostamento predetto di un track associato all'ultima detection
+        supera UNCERTAIN_DISPLACEMENT_RATIO volte il lato minore del suo box
+        (i track già mancati non vengono seguiti e non contano).
+        """
+        if self.last_update_uncertain:
+            return True
         
-        return inter_area / union_area if union_area > 0 else 0.0
+        store = self.store
+        slots = np.flatnonzero(store.active & (store.hits >= self.min_hits) & (store.age == 0))
+        if slots.size == 0:
+            return False
+        boxes = store.bbox[slots]
+        box_side = np.maximum(1.0, np.minimum(boxes[:, 2] - boxes[:, 0], boxes[:, 3] - boxes[:, 1]))
+        displacement = np.linalg.norm(store.centers(slots) - store.measured_center[slots], axis=1)
+        return bool((displacement > self.UNCERTAIN_DISPLACEMENT_RATIO * box_side).any())
+    
+    def _expire(self, slots: np.ndarray):
+        """Rimuove, tra gli slot indicati, i track oltre max_age"""
+        expired = slots[self.store.age[slots] > self.max_age]
+        if expired.size:
+            self._delete_tracks(expired)
+    
+    def _delete_tracks(self, slots: np.ndarray):
+        """Rimuove i track negli slot indicati (e il loro stato di Kalman)"""
+        if self.kalman is not None:
+            for slot in slots.tolist():
+                self.kalman.remove(slot)
+        self.store.remove(slots)
+    
+    def _sync_from_kalman(self):
+        """Copia box e velocità stimati dal filtro di Kalman nello store"""
+        slots = self.store.active_slots()
+        if slots.size == 0:
+            return
+        slot_list = slots.tolist()
+        self.store.bbox[slots] = self.kalman.boxes(slot_list)
+        self.store.velocity[slots] = self.kalman.velocities(slot_list)
+    
+    def _estimate_velocity(self, slots: np.ndarray, centers: np.ndarray):
+        """Aggiorna la velocità (pixel/frame) tra ultima misura e nuove detection"""
+        store = self.store
+        elapsed = np.maximum(1, self.frame_count - store.measured_frame[slots])
+        measured = (centers - store.measured_center[slots]) / elapsed[:, None]
+        alpha = self.VELOCITY_SMOOTHING
+        store.velocity[slots] = alpha * measured + (1 - alpha) * store.velocity[slots]
     
     def _associate_detections_to_trackers(
         self,
         detections: List[Dict[str, Any]],
-        trackers: List[Dict[str, Any]]
+        slots: np.ndarray
     ) -> tuple:
-        """Associa detection a tracker usando IoU"""
-        if len(trackers) == 0:
-            return [], list(range(len(detections))), []
+        """
+        Associa detection a tracker usando IoU
         
-        iou_matrix = np.zeros((len(detections), len(trackers)))
+        La matrice IoU è calcolata in forma vettoriale; il matching greedy
+        (per detection, in ordine) e la raccolta dei non associati usano
+        maschere booleane, con costo lineare nel numero di coppie. In modalità
+        "hungarian" l'assegnamento è ottimo tra le sole coppie della stessa
+        classe con IoU sopra soglia.
         
-        for d, det in enumerate(detections):
-            for t, trk in enumerate(trackers):
-                iou_matrix[d, t] = self._iou(det['bbox'], trk['bbox'])
+        Args:
+            detections: Detection del frame
+            slots: Slot dei track candidati (gli indici restituiti si riferiscono a questo array)
+        """
+        if len(slots) == 0:
+            return [], list(range(len(detections))), []
+        if len(detections) == 0:
+            return [], [], list(range(len(slots)))
+        
+        return self._assign(self._track_ious(detections, slots), detections, slots)
+    
+    def _track_ious(self, detections: List[Dict[str, Any]], slots: np.ndarray) -> np.ndarray:
+        """Matrice IoU detection x track"""
+        det_boxes = np.array([det['bbox'] for det in detections], dtype=np.float64)
+        return iou_matrix(det_boxes, self.store.bbox[slots])
+    
+    def _assign(
+        self,
+        ious: np.ndarray,
+        detections: List[Dict[str, Any]],
+        slots: np.ndarray
+    ) -> tuple:
+        """Associazione su matrice IoU (greedy o ungherese, vedi self.association)"""
+        if self.association == "hungarian":
+            det_classes = np.array([det['class_id'] for det in detections])
+            trk_classes = self.store.class_id[slots]
+            feasible = (ious >= self.iou_threshold) & (det_classes[:, None] == trk_classes[None, :])
+            return gated_assignment(1.0 - ious, feasible)
         
+        ious = ious.copy()  # le colonne assegnate vengono azzerate
         matched_indices = []
         unmatched_dets = []
-        unmatched_trks = []
+        track_matched = np.zeros(len(slots), dtype=bool)
         
         # Greedy matching basato su IoU
-        if iou_matrix.size > 0:
-            for d in range(len(detections)):
-                best_t = np.argmax(iou_matrix[d, :])
-                if iou_matrix[d, best_t] >= self.iou_threshold:
-                    matched_indices.append((d, best_t))
-                    iou_matrix[:, best_t] = -1  # Rimuovi colonna
-                else:
-                    unmatched_dets.append(d)
-            
-            unmatched_trks = [t for t in range(len(trackers)) 
-                            if not any((d, t) in matched_indices for d in range(len(detections)))]
-        else:
-            unmatched_dets = list(range(len(detections)))
-            unmatched_trks = list(range(len(trackers)))
+        for d in range(len(detections)):
+            row = ious[d]
+            best_t = int(np.argmax(row))
+            if row[best_t] >= self.iou_threshold:
+                matched_indices.append((d, best_t))
+                track_matched[best_t] = True
+                ious[:, best_t] = -1  # Rimuovi colonna
+            else:
+                unmatched_dets.append(d)
+        
+        unmatched_trks = np.flatnonzero(~track_matched).tolist()
         
         return matched_indices, unmatched_dets, unmatched_trks
 
 
+class AppearanceTracker(SimpleIOUTracker):
+    """
+    Tracker IoU con re-identificazione per aspetto
+    
+    L'associazione IoU resta il primo stadio. Gli embedding vengono calcolati,
+    in un solo batch per frame, solo per le detection nuove (non associate) e
+    per i match incerti (IoU sotto reid_confident_iou o con più candidati):
+    - un match incerto il cui aspetto non corrisponde alla gallery del track
+      viene annullato (evita scambi di ID negli incroci)
+    - le detection rimaste libere si associano ai track persi per distanza
+      coseno dalla gallery, con gating su classe e reid_max_distance
+    Ogni track conserva gli ultimi reid_gallery_size embedding (i più vecchi
+    vengono scartati). Un track perso con gallery resta recuperabile per
+    reid_max_age frame; senza gallery scade dopo max_age come nel tracker IoU.
+    """
+    
+    def __init__(
+        self,
+        embedder: Optional[AppearanceEmbedder] = None,
+        reid_max_age: Optional[int] = None,
+        **kwargs
+    ):
+        """
+        Args:
+            embedder: Calcolo embedding (default: AppearanceEmbedder da settings)
+            reid_max_age: Frame senza match prima di rimuovere un track con gallery
+                (default: settings.reid_max_age)
+            **kwargs: Parametri di SimpleIOUTracker
+        """
+        super().__init__(**kwargs)
+        self.reid_max_age = max(self.max_age, reid_max_age or settings.reid_max_age)
+        self.embedder = embedder or AppearanceEmbedder()
+        self.gallery_size = settings.reid_gallery_size
+        self.max_distance = settings.reid_max_distance
+        self.confident_iou = settings.reid_confident_iou
+        self.galleries: Dict[int, deque] = {}  # track id -> ultimi embedding
+        self._frame: Optional[np.ndarray] = None
+        self._pending_embeddings: Dict[int, np.ndarray] = {}
+        
+        # Statistiche
+        self.embeddings_computed = 0
+        self.embedding_batches = 0
+        self.matches_rejected = 0
+        self.tracks_recovered = 0
+    
+    def update(self, detections: List[Dict[str, Any]], frame: Optional[np.ndarray] = None) -> List[Dict[str, Any]]:
+        """
+        Aggiorna tracker con nuove detection
+        
+        Args:
+            detections: Lista di detection dal detector YOLO
+            frame: Frame da cui ritagliare i crop (None = solo IoU)
+        
+        Returns:
+            Lista di detection con track_id aggiunto
+        """
+        self._frame = frame
+        self._pending_embeddings = {}
+        try:
+            tracked = super().update(detections)
+            
+            # Aggiorna le gallery dei track (nuovi o associati) con gli embedding calcolati,
+            # esclusi i crop sovrapposti ad altre detection (aspetto contaminato)
+            occluded = self._occluded(detections, list(self._pending_embeddings.keys()))
+            for det_idx, embedding in self._pending_embeddings.items():
+                track_id = detections[det_idx].get('track_id')
+                if track_id not in self.store or det_idx in occluded:
+                    continue
+                gallery = self.galleries.get(track_id)
+                if gallery is None:
+                    gallery = self.galleries[track_id] = deque(maxlen=self.gallery_size)
+                gallery.append(embedding)
+            return tracked
+        finally:
+            self._frame = None
+            self._pending_embeddings = {}
+    
+    def _associate_detections_to_trackers(
+        self,
+        detections: List[Dict[str, Any]],
+        slots: np.ndarray
+    ) -> tuple:
+        """Associazione IoU seguita da verifica e recupero per aspetto"""
+        if self._frame is None or len(detections) == 0:
+            return super()._associate_detections_to_trackers(detections, slots)
+        if len(slots) == 0:
+            self._embed(detections, list(range(len(detections))))
+            return [], list(range(len(detections))), []
+        
+        ious = self._track_ious(detections, slots)
+        matched, unmatched_dets, unmatched_trks = self._assign(ious, detections, slots)
+        track_ids = self.store.ids[slots].tolist()
+        
+        # Match incerti: IoU bassa o più candidati sopra soglia per la detection o il track
+        candidates = ious >= self.iou_threshold
+        det_candidates = candidates.sum(axis=1)
+        trk_candidates = candidates.sum(axis=0)
+        uncertain = [
+            (d, t) for d, t in matched
+            if ious[d, t] < self.confident_iou or det_candidates[d] > 1 or trk_candidates[t] > 1
+        ]
+        
+        embeddings = self._embed(detections, unmatched_dets + [d for d, _ in uncertain])
+        if not embeddings:
+            return matched, unmatched_dets, unmatched_trks
+        
+        # Verifica aspetto dei match incerti (i crop coperti da altre detection non sono affidabili)
+        occluded = self._occluded(detections, [d for d, _ in uncertain])
+        uncertain = [(d, t) for d, t in uncertain if d not in occluded]
+        if uncertain:
+            distances = self._gallery_distances(
+                np.stack([embeddings[d] for d, _ in uncertain]),
+                [track_ids[t] for _, t in uncertain]
+            ).diagonal()
+            rejected = {
+                pair for pair, distance in zip(uncertain, distances)
+                if np.isfinite(distance) and distance > self.max_distance
+            }
+            if rejected:
+                self.matches_rejected += len(rejected)
+                matched = [pair for pair in matched if pair not in rejected]
+                unmatched_dets = sorted(unmatched_dets + [d for d, _ in rejected])
+                unmatched_trks = sorted(unmatched_trks + [t for _, t in rejected])
+        
+        # Recupero per aspetto tra detection e track rimasti liberi
+        lost = [t for t in unmatched_trks if self.galleries.get(track_ids[t])]
+        if unmatched_dets and lost:
+            cost = self._gallery_distances(
+                np.stack([embeddings[d] for d in unmatched_dets]),
+                [track_ids[t] for t in lost]
+            )
+            det_classes = np.array([detections[d]['class_id'] for d in unmatched_dets])
+            trk_classes = self.store.class_id[slots[lost]]
+            feasible = (cost <= self.max_distance) & (det_classes[:, None] == trk_classes[None, :])
+            recovered, _, _ = gated_assignment(cost, feasible)
+            if recovered:
+                self.tracks_recovered += len(recovered)
+                recovered = [(unmatched_dets[r], lost[c]) for r, c in recovered]
+                matched = sorted(matched + recovered)
+                recovered_dets = {d for d, _ in recovered}
+                recovered_trks = {t for _, t in recovered}
+                unmatched_dets = [d for d in unmatched_dets if d not in recovered_dets]
+                unmatched_trks = [t for t in unmatched_trks if t not in recovered_trks]
+        
+        return matched, unmatched_dets, unmatched_trks
+    
+    def _occluded(self, detections: List[Dict[str, Any]], det_indices: List[int]) -> set:
+        """Detection (tra quelle indicate) con IoU sopra iou_threshold con un'altra detection"""
+        if not det_indices or len(detections) < 2:
+            return set()
+        ious = iou_matrix(
+            np.array([detections[d]['bbox'] for d in det_indices], dtype=np.float64),
+            np.array([det['bbox'] for det in detections], dtype=np.float64)
+        )
+        ious[np.arange(len(det_indices)), det_indices] = 0.0
+        return {d for d, overlap in zip(det_indices, ious.max(axis=1)) if overlap > self.iou_threshold}
+    
+    def _embed(self, detections: List[Dict[str, Any]], det_indices: List[int]) -> Dict[int, np.ndarray]:
+        """Embedding batch delle detection indicate (registrati per le gallery)"""
+        if not det_indices:
+            return {}
+        embeddings = self.embedder.embed(self._frame, [detections[d]['bbox'] for d in det_indices])
+        self.embeddings_computed += len(det_indices)
+        self.embedding_batches += 1
+        result = dict(zip(det_indices, embeddings))
+        self._pending_embeddings.update(result)
+        return result
+    
+    def _expire(self, slots: np.ndarray):
+        """Rimuove i track oltre max_age, o oltre reid_max_age se hanno una gallery"""
+        ages = self.store.age[slots]
+        has_gallery = np.array(
+            [bool(self.galleries.get(track_id)) for track_id in self.store.ids[slots].tolist()],
+            dtype=bool
+        )
+        limits = np.where(has_gallery, self.reid_max_age, self.max_age)
+        expired = slots[ages > limits]
+        if expired.size:
+            self._delete_tracks(expired)
+    
+    def _delete_tracks(self, slots: np.ndarray):
+        """Rimuove i track e le loro gallery"""
+        for track_id in self.store.ids[slots].tolist():
+            self.galleries.pop(track_id, None)
+        super()._delete_tracks(slots)
+    
+    def _gallery_distances(self, embeddings: np.ndarray, track_ids: List[int]) -> np.ndarray:
+        """
+        Distanza coseno minima tra ogni embedding e la gallery di ogni track
+        
+        Returns:
+            Matrice KxT (inf per track senza gallery)
+        """
+        distances = np.full((len(embeddings), len(track_ids)), np.inf)
+        galleries = [
+            (i, np.stack(self.galleries[track_id]))
+            for i, track_id in enumerate(track_ids) if self.galleries.get(track_id)
+        ]
+        if not galleries:
+            return distances
+        
+        # Tutte le gallery in un'unica matrice: un solo prodotto, poi massimo per segmento
+        columns = [i for i, _ in galleries]
+        stacked = np.concatenate([gallery for _, gallery in galleries])
+        offsets = np.cumsum([0] + [len(gallery) for _, gallery in galleries[:-1]])
+        similarity = np.maximum.reduceat(embeddings @ stacked.T, offsets, axis=1)
+        distances[:, columns] = 1.0 - similarity
+        return distances
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """Statistiche re-identificazione"""
+        return {
+            'backend': self.embedder.backend,
+            'embeddings_computed': self.embeddings_computed,
+            'embedding_batches': self.embedding_batches,
+            'matches_rejected': self.matches_rejected,
+            'tracks_recovered': self.tracks_recovered
+        }
+
+
 class ObjectTracker:
-    """Wrapper per tracker oggetti (usa DeepSORT se disponibile, altrimenti IoU tracker)"""
+    """Wrapper per tracker oggetti (IoU o re-identificazione per aspetto, vedi settings.tracker_type)"""
     
-    def __init__(self):
-        if DEEPSORT_AVAILABLE:
-            # TODO: Implementare DeepSORT quando disponibile
-            self.tracker = SimpleIOUTracker()
-        else:
-            self.tracker = SimpleIOUTracker()
+    def __init__(self, tracker_type: Optional[str] = None):
+        """
+        Args:
+            tracker_type: "iou" o "appearance" (default: settings.tracker_type)
+        """
+        tracker_type = tracker_type or settings.tracker_type
+        if tracker_type not in ("iou", "appearance"):
+            print(f"Warning: tracker '{tracker_type}' sconosciuto, uso 'iou'")
+            tracker_type = "iou"
+        self.tracker_type = tracker_type
+        self.tracker = AppearanceTracker() if tracker_type == "appearance" else SimpleIOUTracker()
     
-    def update(self, detections: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
-        """Aggiorna tracker con nuove detection"""
+    def update(self, detections: List[Dict[str, Any]], frame: Optional[np.ndarray] = None) -> List[Dict[str, Any]]:
+        """Aggiorna tracker con nuove detection (il frame serve solo alla re-identificazione)"""
+        if isinstance(self.tracker, AppearanceTracker):
+            return self.tracker.update(detections, frame)
         return self.tracker.update(detections)
+    
+    def predict(self, apply_motion: bool = True) -> List[Dict[str, Any]]:
+        """Avanza i track senza detection (frame intermedi)"""
+        return self.tracker.predict(apply_motion)
+    
+    def is_uncertain(self) -> bool:
+        """Verifica se serve anticipare una detection completa"""
+        return self.tracker.is_uncertain()
+    
+    def close(self):
+        """Rilascia i modelli usati dal tracker (rete re-id)"""
+        if isinstance(self.tracker, AppearanceTracker):
+            self.tracker.embedder.close()
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """Statistiche tracker"""
+        stats = {'type': self.tracker_type, 'tracks': len(self.tracker.store)}
+        if isinstance(self.tracker, AppearanceTracker):
+            stats['reid'] = self.tracker.get_stats()
+        return stats
 
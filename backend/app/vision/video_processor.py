@@ -1,11 +1,15 @@
 """Processore video per gestione stream e elaborazione frame"""
 import cv2
+import time
 import numpy as np
 from typing import Optional, Callable, Generator
 from threading import Thread, Lock
 import queue
 from app.vision.yolo_detector import YOLODetector
 from app.vision.face_detector import FaceDetector
+from app.vision.frame_grabber import LatestFrameGrabber
+from app.vision.motion_gate import MotionGate
+from app.vision.latency_controller import AdaptiveLatencyController
 from app.vision.tracker import ObjectTracker
 from app.config import settings
 
@@ -16,17 +20,27 @@ class VideoProcessor:
     def __init__(
         self,
         source_id: str,
-        on_detection_callback: Optional[Callable] = None
+        on_detection_callback: Optional[Callable] = None,
+        inference_scheduler=None,
+        detection_interval: Optional[int] = None,
+        motion_gate: bool = False,
+        tiled_inference: bool = False,
+        adaptive_latency: bool = False
     ):
         """
         Args:
             source_id: ID sorgente video
             on_detection_callback: Callback chiamato quando ci sono nuove detection
+            inference_scheduler: InferenceScheduler o ProcessPoolDetector condiviso (se None usa detector locale)
+            detection_interval: Detection completa ogni N frame (default: settings.detection_interval_frames)
+            motion_gate: Salta la detection sui frame senza movimento (telecamere fisse)
+            tiled_inference: Detection a tile per oggetti piccoli (droni in quota)
+            adaptive_latency: Adatta imgsz e fps alla latenza misurata (budget settings.target_latency_seconds)
         """
-        self.source_id = source_id
         self.on_detection_callback = on_detection_callback
-        self.detector = YOLODetector()
-        self.tracker = ObjectTracker()
+        self.inference_scheduler = inference_scheduler
+        self.detector = YOLODetector() if inference_scheduler is None else None
+        self.configure(source_id, detection_interval, motion_gate, tiled_inference, adaptive_latency)
         
         # Face detector (opzionale, se abilitato nelle configurazioni)
         self.face_detector = None
@@ -45,19 +59,53 @@ class VideoProcessor:
         
         self.cap: Optional[cv2.VideoCapture] = None
         self.rtmp_receiver = None  # Per RTMPStreamReceiver
+        self.frame_grabber: Optional[LatestFrameGrabber] = None  # Ultimo frame per stream live
         self.is_processing = False
         self.process_thread: Optional[Thread] = None
         self.frame_queue = queue.Queue(maxsize=settings.video_buffer_size)
         self.lock = Lock()
     
+    def configure(
+        self,
+        source_id: str,
+        detection_interval: Optional[int] = None,
+        motion_gate: bool = False,
+        tiled_inference: bool = False,
+        adaptive_latency: bool = False
+    ):
+        """
+        Imposta lo stato legato alla sorgente (tracker, cadenza, gate, controllo latenza)
+        
+        Separato dal costruttore: un processor pre-scaldato (modelli già
+        caricati) viene assegnato a una nuova sorgente senza ricrearlo.
+        Da chiamare prima di start_processing.
+        
+        Args: vedi __init__
+        """
+        self.source_id = source_id
+        if getattr(self, 'tracker', None) is not None:
+            # Processor riassegnato: il tracker della sorgente precedente non serve più
+            self.tracker.close()
+        self.tracker = ObjectTracker()
+        
+        # Cadenza detection: nei frame intermedi i track avanzano per predizione
+        self.detection_interval = max(1, detection_interval or settings.detection_interval_frames)
+        self.frames_since_detection = 0
+        self.detections_dropped = 0  # inferenze non concluse entro il budget di latenza
+        self.motion_gate: Optional[MotionGate] = MotionGate() if motion_gate else None
+        self.tiled_inference = tiled_inference
+        self.latency_controller: Optional[AdaptiveLatencyController] = (
+            AdaptiveLatencyController(source_id) if adaptive_latency else None
+        )
+    
     def start_processing(self, video_source):
         """
         Avvia elaborazione video
         
         Args:
-            video_source: Stream video (cv2.VideoCapture, RTMPStreamReceiver, URL, o file path)
+            video_source: Stream video (cv2.VideoCapture, RTMPStreamReceiver, FrameSubscription, URL, o file path)
         """
-        # Controlla se è un RTMPStreamReceiver
+        # Controlla se è un RTMPStreamReceiver (o sottoscrizione FrameHub, stesso contratto)
         if hasattr(video_source, 'read_frame'):
             # È un RTMPStreamReceiver
             self.rtmp_receiver = video_source
@@ -75,6 +123,11 @@ class VideoProcessor:
         if self.cap and not self.cap.isOpened():
             raise RuntimeError(f"Impossibile aprire stream video per sorgente {self.source_id}")
         
+        # Per stream live il decode gira in un thread dedicato che tiene solo l'ultimo frame
+        if self.cap and settings.video_grab_latest_frame and self._is_live_capture(self.cap):
+            self.frame_grabber = LatestFrameGrabber(self.cap)
+            self.frame_grabber.start()
+        
         self.is_processing = True
         self.process_thread = Thread(target=self._process_loop, daemon=True)
         self.process_thread.start()
@@ -84,11 +137,26 @@ class VideoProcessor:
         self.is_processing = False
         if self.rtmp_receiver:
             self.rtmp_receiver.stop()
+        if self.frame_grabber:
+            # Ferma il grabber prima di rilasciare il VideoCapture che sta leggendo
+            self.frame_grabber.stop()
         if self.cap:
             self.cap.release()
         if self.process_thread:
             self.process_thread.join(timeout=2.0)
     
+    def close(self):
+        """
+        Rilascia i modelli condivisi (detector, volti, re-id) nel registro
+        
+        Da chiamare quando il processor viene scartato, dopo stop_processing.
+        """
+        if self.detector is not None:
+            self.detector.close()
+        if self.face_detector is not None:
+            self.face_detector.close()
+        self.tracker.close()
+    
     def _process_loop(self):
         """Loop principale elaborazione frame"""
         while self.is_processing:
@@ -99,9 +167,17 @@ class VideoProcessor:
                 # Usa RTMPStreamReceiver
                 frame = self.rtmp_receiver.read_frame()
                 if frame is None:
-                    import time
+                    if not getattr(self.rtmp_receiver, 'is_running', True):
+                        break  # Stream terminato
                     time.sleep(0.033)  # ~30 fps
                     continue
+            elif self.frame_grabber:
+                # Usa ultimo frame decodificato dal grabber
+                frame = self.frame_grabber.read_frame()
+                if frame is None:
+                    if not self.frame_grabber.is_running:
+                        break  # Stream terminato
+                    continue
             elif self.cap:
                 # Usa cv2.VideoCapture
                 ret, frame = self.cap.read()
@@ -113,17 +189,32 @@ class VideoProcessor:
             if frame is None:
                 continue
             
-            # Detection con YOLO
-            detections = self.detector.detect(frame)
+            # Istante di acquisizione (impostato da grabber/receiver, altrimenti lettura corrente)
+            capture_time = getattr(frame, 'capture_time', None) or time.time()
             
-            # Face detection (se abilitato)
-            if self.face_detector is not None:
-                face_detections = self.face_detector.detect(frame)
-                # Aggiungi detection volti alle detection YOLO
-                detections.extend(face_detections)
+            # Frame rate ridotto dal controllo latenza: scarta prima di qualsiasi elaborazione
+            if self.latency_controller is not None and not self.latency_controller.should_process():
+                continue
             
-            # Tracking
-            tracked_detections = self.tracker.update(detections)
+            if self.motion_gate is not None and not self.motion_gate.has_motion(frame):
+                # Scena invariata: nessuna inferenza, i track esistenti restano vivi
+                tracked_detections = self.tracker.predict(apply_motion=False)
+            elif self._should_run_detection():
+                tracked_detections = self._detect_and_track(frame)
+                if tracked_detections is None:
+                    # Inferenza scaduta: nessuna evidenza che gli oggetti siano spariti,
+                    # i track avanzano per predizione e la detection si ritenta al frame successivo
+                    self.detections_dropped += 1
+                    tracked_detections = self.tracker.predict()
+                else:
+                    self.frames_since_detection = 0
+                if self.latency_controller is not None:
+                    # Solo i frame con inferenza: la sola predizione non misura il carico
+                    self.latency_controller.record(time.time() - capture_time)
+            else:
+                # Frame intermedio: solo predizione del moto dei track
+                tracked_detections = self.tracker.predict()
+                self.frames_since_detection += 1
             
             # Limita numero oggetti tracciati
             if len(tracked_detections) > settings.max_tracked_objects:
@@ -141,6 +232,77 @@ class VideoProcessor:
                     tracked_detections
                 )
     
+    @staticmethod
+    def _is_live_capture(cap: cv2.VideoCapture) -> bool:
+        """Verifica se il VideoCapture è uno stream live (i file hanno un numero di frame noto)"""
+        return cap.get(cv2.CAP_PROP_FRAME_COUNT) <= 0
+    
+    def get_stats(self) -> dict:
+        """Statistiche elaborazione sorgente"""
+        stats = {
+            'source_id': self.source_id,
+            'is_processing': self.is_processing,
+            'detection_interval': self.detection_interval,
+            'tiled_inference': self.tiled_inference,
+            'detections_dropped': self.detections_dropped,
+            'tracker': self.tracker.get_stats()
+        }
+        if self.rtmp_receiver and hasattr(self.rtmp_receiver, 'get_stats'):
+            stats['receiver'] = self.rtmp_receiver.get_stats()
+        if self.frame_grabber:
+            stats['grabber'] = self.frame_grabber.get_stats()
+        if self.motion_gate:
+            stats['motion_gate'] = self.motion_gate.get_stats()
+        if self.latency_controller:
+            stats['latency_controller'] = self.latency_controller.get_state()
+        return stats
+    
+    def _should_run_detection(self) -> bool:
+        """Decide se eseguire la detection completa sul frame corrente"""
+        if self.detection_interval <= 1:
+            return True
+        if self.frames_since_detection + 1 >= self.detection_interval:
+            return True
+        return settings.detection_adaptive and self.tracker.is_uncertain()
+    
+    def _detect_and_track(self, frame: np.ndarray) -> Optional[list]:
+        """
+        Esegue detection completa (YOLO + volti) e aggiorna il tracker
+        
+        Returns:
+            Detection tracciate, o None se l'inferenza condivisa non ha risposto
+            entro il budget di latenza (tracker non aggiornato)
+        """
+        # Dimensione input decisa dal controllo latenza (None = default modello)
+        imgsz = self.latency_controller.imgsz if self.latency_controller is not None else None
+        
+        # Detection con YOLO (batch condiviso se disponibile)
+        if self.inference_scheduler is not None:
+            detections = self.inference_scheduler.detect(
+                frame, self.source_id, tiled=self.tiled_inference, imgsz=imgsz
+            )
+            if detections is None:
+                return None
+        elif self.tiled_inference:
+            detections = self.detector.detect_tiled(frame, imgsz)
+        else:
+            detections = self.detector.detect(frame, imgsz)
+        
+        # Face detection (se abilitato)
+        if self.face_detector is not None:
+            if settings.face_detection_mode == "persons":
+                # Solo nella parte alta dei box person, a scala ridotta
+                face_detections = self.face_detector.detect_in_persons(frame, detections)
+            else:
+                face_detections = self.face_detector.detect(frame)
+            # Aggiungi detection volti alle detection YOLO
+            detections.extend(face_detections)
+        
+        # Tracking
+        tracked_detections = self.tracker.update(detections, frame)
+        
+        return tracked_detections
+    
     def get_frame_dimensions(self) -> Optional[tuple]:
         """Ottieni dimensioni frame (width, height)"""
         if self.cap:
@@ -148,5 +310,7 @@ class VideoProcessor:
                 int(self.cap.get(cv2.CAP_PROP_FRAME_WIDTH)),
                 int(self.cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
             )
+        if self.rtmp_receiver and getattr(self.rtmp_receiver, 'width', None):
+            return (self.rtmp_receiver.width, self.rtmp_receiver.height)
         return None
 
@@ -0,0 +1,331 @@
+"""Backend CPU alternativi per YOLO (ONNX Runtime, OpenVINO) con export in cache e INT8"""
+import os
+import shutil
+import time
+import argparse
+import numpy as np
+from threading import Lock
+from typing import List, Dict, Any, Optional
+from app.config import settings
+
+try:
+    import onnxruntime  # noqa: F401
+    ONNXRUNTIME_AVAILABLE = True
+except ImportError:
+    ONNXRUNTIME_AVAILABLE = False
+
+try:
+    import openvino  # noqa: F401
+    OPENVINO_AVAILABLE = True
+except ImportError:
+    OPENVINO_AVAILABLE = False
+
+BACKEND_PYTORCH = "pytorch"
+BACKEND_ONNX = "onnx"
+BACKEND_OPENVINO = "openvino"
+
+# Serializza gli export: sono lenti e scrivono nella stessa cache
+_export_lock = Lock()
+
+_IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp')
+
+
+def resolve_backend(backend: Optional[str] = None) -> str:
+    """
+    Verifica che il backend richiesto sia installato (fallback a PyTorch)
+
+    Args:
+        backend: Nome backend (default: settings.yolo_backend)
+    """
+    backend = (backend or settings.yolo_backend).lower()
+    if backend == BACKEND_ONNX and not ONNXRUNTIME_AVAILABLE:
+        print("Warning: onnxruntime non installato, uso backend PyTorch. Installa con: pip install onnxruntime")
+        return BACKEND_PYTORCH
+    if backend == BACKEND_OPENVINO and not OPENVINO_AVAILABLE:
+        print("Warning: openvino non installato, uso backend PyTorch. Installa con: pip install openvino")
+        return BACKEND_PYTORCH
+    if backend not in (BACKEND_PYTORCH, BACKEND_ONNX, BACKEND_OPENVINO):
+        print(f"Warning: backend YOLO sconosciuto '{backend}', uso PyTorch")
+        return BACKEND_PYTORCH
+    return backend
+
+
+def backend_key(backend: str, int8: bool) -> str:
+    """Chiave registro modelli per backend + quantizzazione"""
+    return f"{backend}-int8" if int8 and backend != BACKEND_PYTORCH else backend
+
+
+def _cached_export_path(model_path: str, backend: str, int8: bool, imgsz: int) -> str:
+    """Path in cache del modello esportato"""
+    stem = os.path.splitext(os.path.basename(model_path))[0]
+    suffix = f"_{imgsz}" + ("_int8" if int8 else "")
+    if backend == BACKEND_ONNX:
+        # Quantizzazione statica QDQ: nome distinto dagli export INT8 dinamici di versioni precedenti
+        suffix += "_qdq" if int8 else ""
+        return os.path.join(settings.yolo_export_dir, f"{stem}{suffix}.onnx")
+    return os.path.join(settings.yolo_export_dir, f"{stem}{suffix}_openvino_model")
+
+
+def export_model(
+    model_path: str,
+    backend: str,
+    int8: bool = False,
+    imgsz: Optional[int] = None
+) -> str:
+    """
+    Esporta il modello PyTorch nel formato del backend (una volta sola, poi usa la cache)
+
+    Args:
+        model_path: Path modello .pt
+        backend: BACKEND_ONNX o BACKEND_OPENVINO
+        int8: Produce variante quantizzata INT8
+        imgsz: Dimensione input di export
+
+    Returns:
+        Path del modello esportato, caricabile con YOLO(path, task='detect')
+    """
+    if backend == BACKEND_PYTORCH:
+        return model_path
+
+    imgsz = imgsz or settings.yolo_export_imgsz
+    target = _cached_export_path(model_path, backend, int8, imgsz)
+
+    with _export_lock:
+        if os.path.exists(target):
+            return target
+
+        from ultralytics import YOLO
+
+        os.makedirs(settings.yolo_export_dir, exist_ok=True)
+        start = time.perf_counter()
+        model = YOLO(model_path)
+
+        if backend == BACKEND_ONNX:
+            # Batch dinamico: lo scheduler e i tile inviano più immagini per chiamata
+            fp32_target = _cached_export_path(model_path, backend, False, imgsz)
+            if not os.path.exists(fp32_target):
+                exported = model.export(format="onnx", imgsz=imgsz, dynamic=True, simplify=True)
+                shutil.move(str(exported), fp32_target)
+            if int8:
+                _quantize_onnx_static(fp32_target, target, imgsz)
+        else:
+            export_args = {"format": "openvino", "imgsz": imgsz, "dynamic": True}
+            if int8:
+                # La quantizzazione OpenVINO (NNCF) richiede un dataset di calibrazione
+                export_args.update({"int8": True, "data": settings.yolo_int8_calibration_data})
+            exported = model.export(**export_args)
+            shutil.move(str(exported), target)
+
+        print(f"Modello esportato ({backend_key(backend, int8)}): {target} in {time.perf_counter() - start:.1f}s")
+        return target
+
+
+def _calibration_images(source: str, limit: int) -> List[str]:
+    """
+    Immagini di calibrazione INT8
+
+    Args:
+        source: Cartella di immagini o dataset YAML Ultralytics (si usa lo split 'val')
+        limit: Numero massimo di immagini
+    """
+    if os.path.isdir(source):
+        roots = [source]
+    else:
+        from ultralytics.data.utils import check_det_dataset
+        val = check_det_dataset(source)['val']
+        roots = val if isinstance(val, list) else [val]
+
+    images = []
+    for root in roots:
+        if os.path.isfile(root):
+            images.append(root)
+            continue
+        for dirpath, _, filenames in sorted(os.walk(root)):
+            images.extend(
+                os.path.join(dirpath, name) for name in sorted(filenames)
+                if name.lower().endswith(_IMAGE_EXTENSIONS)
+            )
+    return images[:limit]
+
+
+def _letterbox(image: np.ndarray, imgsz: int) -> np.ndarray:
+    """Preprocessing come in inferenza Ultralytics: letterbox, RGB, CHW, [0, 1]"""
+    import cv2
+
+    height, width = image.shape[:2]
+    scale = min(imgsz / height, imgsz / width)
+    new_w, new_h = int(round(width * scale)), int(round(height * scale))
+    resized = cv2.resize(image, (new_w, new_h), interpolation=cv2.INTER_LINEAR)
+    canvas = np.full((imgsz, imgsz, 3), 114, dtype=np.uint8)
+    top, left = (imgsz - new_h) // 2, (imgsz - new_w) // 2
+    canvas[top:top + new_h, left:left + new_w] = resized
+    return (canvas[:, :, ::-1].transpose(2, 0, 1)[None] / 255.0).astype(np.float32)
+
+
+def _quantize_onnx_static(fp32_path: str, target: str, imgsz: int):
+    """
+    Quantizzazione statica INT8 (QDQ) con calibrazione delle attivazioni
+
+    La quantizzazione dinamica genera nodi ConvInteger/DynamicQuantizeLinear
+    che su CPU sono in genere più lenti del modello FP32: per una CNN come
+    YOLO servono scale di attivazione calibrate su immagini reali
+    (settings.yolo_int8_calibration_data).
+    """
+    import cv2
+    import onnxruntime
+    from onnxruntime.quantization import (
+        CalibrationDataReader, QuantFormat, QuantType, quantize_static
+    )
+
+    images = _calibration_images(settings.yolo_int8_calibration_data, settings.yolo_int8_calibration_samples)
+    if not images:
+        raise ValueError(f"Nessuna immagine di calibrazione in {settings.yolo_int8_calibration_data}")
+    input_name = onnxruntime.InferenceSession(
+        fp32_path, providers=["CPUExecutionProvider"]
+    ).get_inputs()[0].name
+
+    class _Reader(CalibrationDataReader):
+        def __init__(self):
+            self._paths = iter(images)
+
+        def get_next(self):
+            for path in self._paths:
+                image = cv2.imread(path)
+                if image is not None:
+                    return {input_name: _letterbox(image, imgsz)}
+            return None
+
+    quantize_static(
+        fp32_path,
+        target,
+        _Reader(),
+        quant_format=QuantFormat.QDQ,
+        activation_type=QuantType.QUInt8,
+        weight_type=QuantType.QInt8,
+        per_channel=True
+    )
+    print(f"Quantizzazione INT8 statica: {len(images)} immagini di calibrazione")
+
+
+def _box_iou(box1: List[float], box2: List[float]) -> float:
+    """IoU tra due box [x1, y1, x2, y2]"""
+    inter_w = max(0.0, min(box1[2], box2[2]) - max(box1[0], box2[0]))
+    inter_h = max(0.0, min(box1[3], box2[3]) - max(box1[1], box2[1]))
+    inter = inter_w * inter_h
+    union = (
+        (box1[2] - box1[0]) * (box1[3] - box1[1]) +
+        (box2[2] - box2[0]) * (box2[3] - box2[1]) - inter
+    )
+    return inter / union if union > 0 else 0.0
+
+
+def _match_detections(
+    reference: List[Dict[str, Any]],
+    candidate: List[Dict[str, Any]],
+    iou_threshold: float = 0.5
+) -> int:
+    """Numero di detection candidate che corrispondono (stessa classe, IoU >= soglia) al riferimento"""
+    used = set()
+    matches = 0
+    for cand in candidate:
+        best_iou, best_idx = 0.0, None
+        for idx, ref in enumerate(reference):
+            if idx in used or ref['class_id'] != cand['class_id']:
+                continue
+            iou = _box_iou(ref['bbox'], cand['bbox'])
+            if iou > best_iou:
+                best_iou, best_idx = iou, idx
+        if best_idx is not None and best_iou >= iou_threshold:
+            used.add(best_idx)
+            matches += 1
+    return matches
+
+
+def compare_backends(
+    video_path: str,
+    backends: Optional[List[str]] = None,
+    max_frames: int = 100,
+    model_path: Optional[str] = None
+) -> List[Dict[str, Any]]:
+    """
+    Confronta latenza e accuratezza dei backend rispetto a PyTorch su un clip
+
+    L'accuratezza è misurata come precision/recall delle detection di ogni
+    backend rispetto a quelle di PyTorch (IoU >= 0.5, stessa classe).
+
+    Args:
+        video_path: Clip video di esempio
+        backends: Chiavi backend da confrontare (es. ["onnx", "onnx-int8", "openvino"])
+        max_frames: Numero massimo di frame da usare
+        model_path: Modello YOLO (default: settings.yolo_model)
+
+    Returns:
+        Una riga di report per backend (il primo è sempre il riferimento PyTorch)
+    """
+    import cv2
+    from app.vision.yolo_detector import YOLODetector
+
+    backends = backends or [BACKEND_ONNX, f"{BACKEND_ONNX}-int8", BACKEND_OPENVINO]
+
+    cap = cv2.VideoCapture(video_path)
+    frames = []
+    while len(frames) < max_frames:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        frames.append(frame)
+    cap.release()
+    if not frames:
+        raise ValueError(f"Nessun frame letto da {video_path}")
+
+    def _run(detector: YOLODetector):
+        outputs, latencies = [], []
+        for frame in frames:
+            start = time.perf_counter()
+            outputs.append(detector.detect(frame))
+            latencies.append((time.perf_counter() - start) * 1000.0)
+        return outputs, np.array(latencies)
+
+    baseline_outputs, baseline_latencies = _run(YOLODetector(model_path, backend=BACKEND_PYTORCH, int8=False))
+    baseline_total = sum(len(d) for d in baseline_outputs)
+    report = [{
+        'backend': BACKEND_PYTORCH,
+        'mean_latency_ms': float(baseline_latencies.mean()),
+        'p95_latency_ms': float(np.percentile(baseline_latencies, 95)),
+        'speedup': 1.0,
+        'precision': 1.0,
+        'recall': 1.0
+    }]
+
+    for key in backends:
+        backend, _, quant = key.partition("-")
+        if resolve_backend(backend) != backend:
+            continue
+        outputs, latencies = _run(YOLODetector(model_path, backend=backend, int8=(quant == "int8")))
+        matches = sum(_match_detections(ref, out) for ref, out in zip(baseline_outputs, outputs))
+        total = sum(len(d) for d in outputs)
+        report.append({
+            'backend': key,
+            'mean_latency_ms': float(latencies.mean()),
+            'p95_latency_ms': float(np.percentile(latencies, 95)),
+            'speedup': float(baseline_latencies.mean() / max(latencies.mean(), 1e-9)),
+            'precision': matches / total if total else 1.0,
+            'recall': matches / baseline_total if baseline_total else 1.0
+        })
+
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Confronto backend YOLO su clip di esempio")
+    parser.add_argument("video", help="Path clip video")
+    parser.add_argument("--frames", type=int, default=100, help="Numero massimo di frame")
+    parser.add_argument("--backends", nargs="*", default=None, help="Es: onnx onnx-int8 openvino openvino-int8")
+    args = parser.parse_args()
+
+    print(f"{'backend':<16}{'mean ms':>10}{'p95 ms':>10}{'speedup':>10}{'precision':>11}{'recall':>9}")
+    for row in compare_backends(args.video, args.backends, args.frames):
+        print(
+            f"{row['backend']:<16}{row['mean_latency_ms']:>10.1f}{row['p95_latency_ms']:>10.1f}"
+            f"{row['speedup']:>10.2f}{row['precision']:>11.3f}{row['recall']:>9.3f}"
+        )
@@ -1,7 +1,10 @@
 """Wrapper YOLO per object detection"""
-from typing import List, Tuple, Dict, Any
+from typing import List, Tuple, Dict, Any, Optional
 import numpy as np
 from app.config import settings
+from app.vision.model_registry import model_registry
+from app.vision.tiling import split_frame, merge_tile_batches
+from app.vision.detections import DetectionBatch
 
 try:
     from ultralytics import YOLO
@@ -23,25 +26,31 @@ class YOLODetector:
         7: 'truck'
     }
     
-    def __init__(self, model_path: str = None):
+    def __init__(self, model_path: str = None, backend: str = None, int8: bool = None):
         """
         Args:
             model_path: Path al modello YOLO (default: usa modello pre-addestrato)
+            backend: Backend di inferenza: pytorch, onnx, openvino (default: settings.yolo_backend)
+            int8: Usa variante quantizzata INT8 (default: settings.yolo_int8)
         """
         if not ULTRALYTICS_AVAILABLE:
             raise ImportError("ultralytics non disponibile. Installa con: pip install ultralytics")
         
-        model_path = model_path or settings.yolo_model
-        self.model = YOLO(model_path)
+        # Modello condiviso tra tutte le sorgenti (caricato e scaldato una volta sola)
+        self.model_entry = model_registry.get_yolo(model_path or settings.yolo_model, backend, int8)
+        self.model = self.model_entry.model
+        self._released = False
         self.conf_threshold = settings.yolo_conf_threshold
         self.iou_threshold = settings.yolo_iou_threshold
+        self.target_class_ids = list(self.TARGET_CLASSES.keys())
     
-    def detect(self, frame: np.ndarray) -> List[Dict[str, Any]]:
+    def detect(self, frame: np.ndarray, imgsz: Optional[int] = None) -> List[Dict[str, Any]]:
         """
         Rileva oggetti in un frame
         
         Args:
             frame: Frame video come numpy array (BGR format)
+            imgsz: Dimensione input inferenza (default: quella del modello)
         
         Returns:
             Lista di detection con formato:
@@ -52,39 +61,98 @@ class YOLODetector:
                 'confidence': float
             }
         """
-        results = self.model.predict(
-            frame,
-            conf=self.conf_threshold,
-            iou=self.iou_threshold,
-            verbose=False
-        )
-        
-        detections = []
-        if results and len(results) > 0:
-            result = results[0]
-            
-            # Filtra solo classi di interesse
-            for box in result.boxes:
-                class_id = int(box.cls[0])
-                
-                if class_id in self.TARGET_CLASSES:
-                    x1, y1, x2, y2 = box.xyxy[0].cpu().numpy()
-                    confidence = float(box.conf[0])
-                    
-                    detections.append({
-                        'bbox': [float(x1), float(y1), float(x2), float(y2)],
-                        'class_id': class_id,
-                        'class_name': self.TARGET_CLASSES[class_id],
-                        'confidence': confidence,
-                        'center': [
-                            float((x1 + x2) / 2),
-                            float((y1 + y2) / 2)
-                        ]
-                    })
-        
-        return detections
+        return self.detect_arrays([frame], imgsz)[0].to_dicts()
+    
+    def detect_tiled(self, frame: np.ndarray, imgsz: Optional[int] = None) -> List[Dict[str, Any]]:
+        """
+        Rileva oggetti piccoli dividendo il frame in tile sovrapposti
+        
+        Tutti i tile vengono elaborati in un solo batch; i duplicati sulle
+        giunzioni sono rimossi con NMS.
+        
+        Args:
+            frame: Frame video ad alta risoluzione (BGR format)
+            imgsz: Dimensione input inferenza per ogni tile (default: quella del modello)
+        
+        Returns:
+            Lista di detection in coordinate del frame originale
+        """
+        return self.detect_tiled_arrays(frame, imgsz).to_dicts()
+    
+    def detect_tiled_arrays(self, frame: np.ndarray, imgsz: Optional[int] = None) -> DetectionBatch:
+        """Come detect_tiled, ma restituisce il risultato in forma di array"""
+        images, offsets = split_frame(frame)
+        return merge_tile_batches(self.detect_arrays(images, imgsz), offsets, self.iou_threshold)
+    
+    def detect_batch(self, frames: List[np.ndarray]) -> List[List[Dict[str, Any]]]:
+        """
+        Rileva oggetti in più frame con una sola chiamata predict
+        
+        Args:
+            frames: Lista di frame video (BGR format)
+        
+        Returns:
+            Lista di liste di detection, una per frame, nello stesso ordine di input
+        """
+        return [batch.to_dicts() for batch in self.detect_arrays(frames)]
+    
+    def detect_arrays(self, frames: List[np.ndarray], imgsz: Optional[int] = None) -> List[DetectionBatch]:
+        """
+        Rileva oggetti in più frame restituendo risultati in forma di array
+        
+        Le classi di interesse sono passate all'inferenza, così l'NMS non
+        spreca tempo su box che verrebbero scartati.
+        
+        Args:
+            frames: Lista di frame video (BGR format)
+            imgsz: Dimensione input inferenza (default: quella del modello)
+        
+        Returns:
+            Un DetectionBatch per frame, nello stesso ordine di input
+        """
+        if not frames:
+            return []
+        
+        predict_args = {}
+        if imgsz:
+            predict_args['imgsz'] = imgsz
+        
+        with self.model_entry.lock:
+            results = self.model.predict(
+                frames,
+                conf=self.conf_threshold,
+                iou=self.iou_threshold,
+                classes=self.target_class_ids,
+                verbose=False,
+                **predict_args
+            )
+        
+        return [self._parse_result(result) for result in results]
+    
+    def _parse_result(self, result) -> DetectionBatch:
+        """Converte risultato ultralytics in DetectionBatch (una conversione per array)"""
+        boxes = result.boxes
+        if boxes is None or len(boxes) == 0:
+            return DetectionBatch.empty(self.TARGET_CLASSES)
+        
+        xyxy = boxes.xyxy.cpu().numpy()
+        scores = boxes.conf.cpu().numpy()
+        class_ids = boxes.cls.cpu().numpy().astype(np.int64)
+        
+        # Alcuni backend esportati ignorano il filtro classi: ripeti il filtro in forma vettoriale
+        mask = np.isin(class_ids, self.target_class_ids)
+        if not mask.all():
+            xyxy, scores, class_ids = xyxy[mask], scores[mask], class_ids[mask]
+        
+        return DetectionBatch(xyxy, scores, class_ids, self.TARGET_CLASSES)
     
     def is_available(self) -> bool:
         """Verifica se il detector è disponibile"""
         return ULTRALYTICS_AVAILABLE and self.model is not None
+    
+    def close(self):
+        """Rilascia il modello condiviso nel registro (il modello resta residente)"""
+        if not self._released:
+            self._released = True
+            model_registry.release(self.model_entry)
 
@@ -0,0 +1,96 @@
+"""Micro-benchmark tracker: costo per frame al crescere del numero di oggetti
+
+Uso (dalla cartella backend):
+    python -m examples.benchmark_tracker --objects 20 50 100 200 400 --frames 200
+    python -m examples.benchmark_tracker --motion-model kalman
+"""
+import argparse
+import time
+import numpy as np
+from app.vision.tracker import SimpleIOUTracker, iou_matrix
+
+
+def _python_iou_matrix(boxes_a: np.ndarray, boxes_b: np.ndarray) -> np.ndarray:
+    """Riferimento: doppio loop Python (implementazione precedente)"""
+    result = np.zeros((len(boxes_a), len(boxes_b)))
+    for i, a in enumerate(boxes_a.tolist()):
+        for j, b in enumerate(boxes_b.tolist()):
+            inter = max(0.0, min(a[2], b[2]) - max(a[0], b[0])) * max(0.0, min(a[3], b[3]) - max(a[1], b[1]))
+            union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - inter
+            result[i, j] = inter / union if union > 0 else 0.0
+    return result
+
+
+def _make_scene(num_objects: int, num_frames: int, seed: int = 0):
+    """Oggetti che si muovono a velocità costante con rumore, su frame 1920x1080"""
+    rng = np.random.default_rng(seed)
+    centers = rng.uniform([50, 50], [1870, 1030], size=(num_objects, 2))
+    sizes = rng.uniform([20, 40], [60, 120], size=(num_objects, 2))
+    velocities = rng.uniform(-4, 4, size=(num_objects, 2))
+
+    frames = []
+    for _ in range(num_frames):
+        centers = centers + velocities + rng.normal(0, 0.5, size=centers.shape)
+        boxes = np.hstack([centers - sizes / 2, centers + sizes / 2])
+        frames.append(boxes)
+    return frames
+
+
+def _to_detections(boxes: np.ndarray):
+    return [
+        {
+            'bbox': box,
+            'center': [(box[0] + box[2]) / 2, (box[1] + box[3]) / 2],
+            'class_id': 0,
+            'class_name': 'person',
+            'confidence': 0.9
+        }
+        for box in boxes.tolist()
+    ]
+
+
+def benchmark(num_objects: int, num_frames: int, motion_model: str = "velocity") -> dict:
+    """Tempo medio di update e di calcolo IoU per un numero di oggetti"""
+    frames = _make_scene(num_objects, num_frames)
+    detections = [_to_detections(boxes) for boxes in frames]
+
+    tracker = SimpleIOUTracker(motion_model=motion_model)
+    start = time.perf_counter()
+    for dets in detections:
+        tracker.update(dets)
+    update_ms = (time.perf_counter() - start) * 1000.0 / num_frames
+
+    start = time.perf_counter()
+    for boxes in frames[:20]:
+        iou_matrix(boxes, boxes)
+    vector_ms = (time.perf_counter() - start) * 1000.0 / 20
+
+    loops = 3 if num_objects > 100 else 20
+    start = time.perf_counter()
+    for boxes in frames[:loops]:
+        _python_iou_matrix(boxes, boxes)
+    loop_ms = (time.perf_counter() - start) * 1000.0 / loops
+
+    return {
+        'objects': num_objects,
+        'update_ms': update_ms,
+        'iou_vector_ms': vector_ms,
+        'iou_loop_ms': loop_ms,
+        'tracks': len(tracker.store)
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark SimpleIOUTracker")
+    parser.add_argument("--objects", type=int, nargs="*", default=[20, 50, 100, 200, 400])
+    parser.add_argument("--frames", type=int, default=200)
+    parser.add_argument("--motion-model", choices=["velocity", "kalman"], default="velocity")
+    args = parser.parse_args()
+
+    print(f"{'oggetti':>8}{'update ms':>12}{'IoU vett. ms':>14}{'IoU loop ms':>13}{'track':>7}")
+    for n in args.objects:
+        row = benchmark(n, args.frames, args.motion_model)
+        print(
+            f"{row['objects']:>8}{row['update_ms']:>12.3f}{row['iou_vector_ms']:>14.3f}"
+            f"{row['iou_loop_ms']:>13.2f}{row['tracks']:>7}"
+        )
@@ -0,0 +1,70 @@
+"""Verifica della cadenza di detection adattiva: un oggetto che esce anticipa una sola detection
+
+Simula la regola di VideoProcessor._should_run_detection (detection ogni
+`interval` frame, anticipata se tracker.is_uncertain()) su una scena con un
+oggetto fermo e uno che attraversa il frame e poi esce. Dopo l'uscita il
+tracker conserva il track perso per max_age frame (reid_max_age con
+l'aspetto), ma l'incertezza deve valere solo al primo frame mancato:
+una detection anticipata, poi di nuovo la cadenza regolare.
+
+Uso (dalla cartella backend):
+    python -m examples.check_detection_cadence --interval 5
+"""
+import argparse
+import sys
+from typing import Any, Dict, List
+from app.vision.tracker import SimpleIOUTracker
+
+# Frame in cui il secondo oggetto esce dalla scena
+DEPARTURE_FRAME = 60
+
+
+def _detections(frame: int) -> List[Dict[str, Any]]:
+    """Oggetto fermo sempre presente, oggetto in movimento fino a DEPARTURE_FRAME"""
+    boxes = [[500.0, 100.0, 540.0, 180.0]]
+    if frame < DEPARTURE_FRAME:
+        x = 100.0 + 3.0 * frame
+        boxes.append([x, 100.0, x + 40.0, 180.0])
+    return [
+        {
+            'bbox': box,
+            'center': [(box[0] + box[2]) / 2, (box[1] + box[3]) / 2],
+            'class_id': 0,
+            'class_name': 'person',
+            'confidence': 0.9
+        }
+        for box in boxes
+    ]
+
+
+def early_detections(motion_model: str, interval: int, num_frames: int) -> List[int]:
+    """Frame, dopo l'uscita dell'oggetto, in cui la detection è stata anticipata"""
+    tracker = SimpleIOUTracker(motion_model=motion_model)
+    frames_since_detection = 0
+    early = []
+    for frame in range(num_frames):
+        scheduled = frame == 0 or frames_since_detection + 1 >= interval
+        if scheduled or tracker.is_uncertain():
+            if not scheduled and frame >= DEPARTURE_FRAME:
+                early.append(frame)
+            tracker.update(_detections(frame))
+            frames_since_detection = 0
+        else:
+            tracker.predict()
+            frames_since_detection += 1
+    return early
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Cadenza detection adattiva all'uscita di un oggetto")
+    parser.add_argument("--interval", type=int, default=5)
+    parser.add_argument("--frames", type=int, default=200)
+    args = parser.parse_args()
+
+    failures = 0
+    for motion_model in ("velocity", "kalman"):
+        early = early_detections(motion_model, args.interval, args.frames)
+        ok = len(early) == 1
+        failures += not ok
+        print(f"{motion_model:>9}  detection anticipate dopo l'uscita: {early}  {'ok' if ok else 'ERRORE (attesa 1)'}")
+    sys.exit(1 if failures else 0)
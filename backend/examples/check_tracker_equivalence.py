@@ -0,0 +1,319 @@
+"""Verifica di equivalenza: SimpleIOUTracker (TrackStore) contro un riferimento a dizionari
+
+Il riferimento tiene i track in un dizionario per id (come l'implementazione
+precedente a TrackStore) e lo stato di Kalman indicizzato per track id, quindi
+senza riuso di righe o slot. Sulla stessa sequenza di frame i due tracker
+devono produrre gli stessi id, box, velocità, predizioni e incertezza.
+La scena ha ricambio continuo di oggetti e detection mancate, così da
+esercitare scadenza dei track, riuso degli slot liberati, rimozione delle
+righe di Kalman e crescita della capacità dello store.
+
+Uso (dalla cartella backend):
+    python -m examples.check_tracker_equivalence --frames 600 --seeds 0 1 2
+"""
+import argparse
+import copy
+import sys
+from typing import Any, Dict, List
+import numpy as np
+from app.vision.assignment import gated_assignment
+from app.vision.kalman import BatchedKalmanBoxFilter
+from app.vision.tracker import SimpleIOUTracker, iou_matrix
+
+TOLERANCE = 1e-9
+
+
+class _ReferenceTracker:
+    """Tracker IoU con track in un dizionario id -> attributi (riferimento)"""
+
+    def __init__(self, max_age: int, min_hits: int, iou_threshold: float, motion_model: str, association: str):
+        self.max_age = max_age
+        self.min_hits = min_hits
+        self.iou_threshold = iou_threshold
+        self.association = association
+        self.kalman = BatchedKalmanBoxFilter() if motion_model == "kalman" else None
+        self.tracks: Dict[int, Dict[str, Any]] = {}  # ordine di inserimento = ordine degli id
+        self.next_id = 1
+        self.frame_count = 0
+        self.last_update_uncertain = False
+        self.expired = 0
+
+    def update(self, detections: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        self.frame_count += 1
+        self.last_update_uncertain = False
+        if self.kalman is not None:
+            self.kalman.predict()
+            self._sync_from_kalman()
+
+        track_ids = list(self.tracks.keys())
+        if not detections:
+            self.last_update_uncertain = any(
+                t['hits'] >= self.min_hits and t['age'] == 0 for t in self.tracks.values()
+            )
+            self._age(track_ids)
+            return []
+
+        matched, unmatched_dets, unmatched_trks = self._associate(detections, track_ids)
+
+        for det_idx, trk_idx in matched:
+            track = self.tracks[track_ids[trk_idx]]
+            det = detections[det_idx]
+            bbox = np.asarray(det['bbox'], dtype=np.float64)
+            center = (bbox[:2] + bbox[2:]) / 2.0
+            if self.kalman is None:
+                elapsed = max(1, self.frame_count - track['measured_frame'])
+                measured = (center - track['measured_center']) / elapsed
+                track['velocity'] = 0.5 * measured + 0.5 * track['velocity']
+            track.update(
+                bbox=bbox, class_id=det['class_id'], confidence=det['confidence'], age=0,
+                hits=track['hits'] + 1, measured_center=center, measured_frame=self.frame_count
+            )
+            det['track_id'] = track['id']
+
+        if matched:
+            if self.kalman is not None:
+                matched_ids = [track_ids[t] for _, t in matched]
+                self.kalman.update(matched_ids, np.array([detections[d]['bbox'] for d, _ in matched]))
+                for track_id, velocity in zip(matched_ids, self.kalman.velocities(matched_ids)):
+                    self.tracks[track_id]['velocity'] = velocity
+            hits = [self.tracks[track_ids[t]]['hits'] for _, t in matched]
+            if any(2 <= h <= self.min_hits for h in hits):
+                self.last_update_uncertain = True
+
+        for det_idx in unmatched_dets:
+            det = detections[det_idx]
+            bbox = np.asarray(det['bbox'], dtype=np.float64)
+            track_id = self.next_id
+            self.next_id += 1
+            self.tracks[track_id] = {
+                'id': track_id, 'bbox': bbox, 'class_id': det['class_id'],
+                'class_name': det['class_name'], 'confidence': det['confidence'],
+                'age': 0, 'hits': 1, 'velocity': np.zeros(2),
+                'measured_center': (bbox[:2] + bbox[2:]) / 2.0, 'measured_frame': self.frame_count
+            }
+            if self.kalman is not None:
+                self.kalman.add(track_id, bbox)
+            det['track_id'] = track_id
+        if unmatched_dets and self.min_hits <= 1:
+            self.last_update_uncertain = True
+
+        if unmatched_trks:
+            stale = [track_ids[t] for t in unmatched_trks]
+            if any(self.tracks[t]['hits'] >= self.min_hits and self.tracks[t]['age'] == 0 for t in stale):
+                self.last_update_uncertain = True
+            self._age(stale)
+
+        tracked = []
+        for det in detections:
+            track = self.tracks.get(det.get('track_id'))
+            if track is not None and track['hits'] >= self.min_hits:
+                det['velocity'] = track['velocity'].tolist()
+                tracked.append(det)
+        return tracked
+
+    def predict(self, apply_motion: bool = True) -> List[Dict[str, Any]]:
+        self.frame_count += 1
+        if apply_motion and self.kalman is not None:
+            self.kalman.predict()
+            self._sync_from_kalman()
+        predicted = []
+        for track_id, track in self.tracks.items():
+            if apply_motion and self.kalman is None:
+                track['bbox'] = track['bbox'] + np.tile(track['velocity'], 2)
+            if track['hits'] >= self.min_hits and track['age'] == 0:
+                predicted.append({
+                    'bbox': track['bbox'].tolist(), 'track_id': track_id,
+                    'velocity': track['velocity'].tolist(), 'class_name': track['class_name']
+                })
+        return predicted
+
+    def is_uncertain(self) -> bool:
+        if self.last_update_uncertain:
+            return True
+        for track in self.tracks.values():
+            if track['hits'] < self.min_hits or track['age'] > 0:
+                continue
+            bbox = track['bbox']
+            side = max(1.0, min(bbox[2] - bbox[0], bbox[3] - bbox[1]))
+            if np.linalg.norm((bbox[:2] + bbox[2:]) / 2.0 - track['measured_center']) > 0.5 * side:
+                return True
+        return False
+
+    def _age(self, track_ids: List[int]):
+        for track_id in track_ids:
+            track = self.tracks[track_id]
+            track['age'] += 1
+            if track['age'] > self.max_age:
+                del self.tracks[track_id]
+                if self.kalman is not None:
+                    self.kalman.remove(track_id)
+                self.expired += 1
+
+    def _sync_from_kalman(self):
+        track_ids = list(self.tracks.keys())
+        if not track_ids:
+            return
+        for track_id, bbox, velocity in zip(
+            track_ids, self.kalman.boxes(track_ids), self.kalman.velocities(track_ids)
+        ):
+            self.tracks[track_id]['bbox'] = bbox
+            self.tracks[track_id]['velocity'] = velocity
+
+    def _associate(self, detections: List[Dict[str, Any]], track_ids: List[int]) -> tuple:
+        if not track_ids:
+            return [], list(range(len(detections))), []
+        ious = iou_matrix(
+            np.array([det['bbox'] for det in detections]),
+            np.array([self.tracks[t]['bbox'] for t in track_ids])
+        )
+        if self.association == "hungarian":
+            det_classes = np.array([det['class_id'] for det in detections])
+            trk_classes = np.array([self.tracks[t]['class_id'] for t in track_ids])
+            feasible = (ious >= self.iou_threshold) & (det_classes[:, None] == trk_classes[None, :])
+            return gated_assignment(1.0 - ious, feasible)
+
+        matched, unmatched_dets, taken = [], [], set()
+        for d in range(len(detections)):
+            best_t, best_iou = None, -1.0
+            for t in range(len(track_ids)):
+                if t not in taken and ious[d, t] > best_iou:
+                    best_t, best_iou = t, ious[d, t]
+            if best_t is not None and best_iou >= self.iou_threshold:
+                matched.append((d, best_t))
+                taken.add(best_t)
+            else:
+                unmatched_dets.append(d)
+        return matched, unmatched_dets, [t for t in range(len(track_ids)) if t not in taken]
+
+
+def _make_churn_scene(num_frames: int, seed: int):
+    """
+    Passi della scena: ('update', detection) oppure ('predict', apply_motion)
+
+    Gli oggetti nascono e muoiono di continuo e vengono mancati a caso, così
+    i track scadono e gli slot vengono riusati; qualche frame è vuoto.
+    """
+    rng = np.random.default_rng(seed)
+    objects = []
+    steps = []
+    for _ in range(num_frames):
+        for _ in range(rng.poisson(1.5)):
+            objects.append({
+                'center': rng.uniform([50, 50], [1870, 1030]),
+                'size': rng.uniform([20, 40], [80, 160]),
+                'velocity': rng.uniform(-6, 6, size=2),
+                'class_id': int(rng.integers(0, 2)),
+                'frames_left': int(rng.integers(5, 60))
+            })
+        for obj in objects:
+            obj['center'] = obj['center'] + obj['velocity'] + rng.normal(0, 0.5, size=2)
+            obj['frames_left'] -= 1
+        objects = [obj for obj in objects if obj['frames_left'] > 0]
+
+        roll = rng.random()
+        if roll < 0.15:
+            steps.append(('predict', bool(rng.random() < 0.8)))
+            continue
+        visible = [] if roll < 0.2 else [obj for obj in objects if rng.random() < 0.85]
+        detections = []
+        for obj in visible:
+            box = np.hstack([obj['center'] - obj['size'] / 2, obj['center'] + obj['size'] / 2]).tolist()
+            detections.append({
+                'bbox': box,
+                'center': [(box[0] + box[2]) / 2, (box[1] + box[3]) / 2],
+                'class_id': obj['class_id'],
+                'class_name': 'person' if obj['class_id'] == 0 else 'car',
+                'confidence': float(rng.uniform(0.3, 1.0))
+            })
+        steps.append(('update', detections))
+    return steps
+
+
+def _same_output(result: List[Dict[str, Any]], expected: List[Dict[str, Any]]) -> bool:
+    """Stessi track, nello stesso ordine, con stessi box e velocità"""
+    if [r['track_id'] for r in result] != [e['track_id'] for e in expected]:
+        return False
+    return all(
+        np.allclose(r['bbox'], e['bbox'], atol=TOLERANCE)
+        and np.allclose(r['velocity'], e['velocity'], atol=TOLERANCE)
+        for r, e in zip(result, expected)
+    )
+
+
+def _check_state(tracker: SimpleIOUTracker, reference: _ReferenceTracker) -> str:
+    """Confronta lo stato interno; restituisce la prima differenza ('' se nessuna)"""
+    store = tracker.store
+    if sorted(store.index) != list(reference.tracks):
+        return "track attivi diversi"
+    for track_id, track in reference.tracks.items():
+        slot = store.slot_of(track_id)
+        if store.ids[slot] != track_id or not store.active[slot]:
+            return f"indice slot incoerente per il track {track_id}"
+        if store.age[slot] != track['age'] or store.hits[slot] != track['hits']:
+            return f"age/hits diversi per il track {track_id}"
+        if not np.allclose(store.bbox[slot], track['bbox'], atol=TOLERANCE):
+            return f"box diverso per il track {track_id}"
+        if not np.allclose(store.velocity[slot], track['velocity'], atol=TOLERANCE):
+            return f"velocità diversa per il track {track_id}"
+    if tracker.kalman is not None and sorted(tracker.kalman.rows) != sorted(store.index.values()):
+        return "righe di Kalman non allineate agli slot attivi"
+    return ""
+
+
+def check(motion_model: str, association: str, num_frames: int, seed: int, max_age: int = 4, min_hits: int = 3) -> dict:
+    """Esegue tracker e riferimento sulla stessa scena, fermandosi alla prima differenza"""
+    steps = _make_churn_scene(num_frames, seed)
+    tracker = SimpleIOUTracker(
+        max_age=max_age, min_hits=min_hits, motion_model=motion_model, association=association
+    )
+    reference = _ReferenceTracker(max_age, min_hits, tracker.iou_threshold, motion_model, association)
+
+    error = ""
+    for frame, (kind, payload) in enumerate(steps):
+        if kind == 'predict':
+            result, expected = tracker.predict(payload), reference.predict(payload)
+        else:
+            result = tracker.update(copy.deepcopy(payload))
+            expected = reference.update(copy.deepcopy(payload))
+        if not _same_output(result, expected):
+            error = "output diverso"
+        elif tracker.is_uncertain() != reference.is_uncertain():
+            error = "incertezza diversa"
+        else:
+            error = _check_state(tracker, reference)
+        if error:
+            error = f"frame {frame} ({kind}): {error}"
+            break
+
+    return {
+        'motion_model': motion_model,
+        'association': association,
+        'seed': seed,
+        'track_ids': tracker.next_id - 1,
+        'expired': reference.expired,
+        'capacity': tracker.store.capacity,
+        'error': error
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Equivalenza SimpleIOUTracker / riferimento a dizionari")
+    parser.add_argument("--frames", type=int, default=600)
+    parser.add_argument("--seeds", type=int, nargs="*", default=[0, 1, 2])
+    args = parser.parse_args()
+
+    failures = 0
+    print(f"{'moto':>9}{'assoc.':>11}{'seed':>6}{'id':>7}{'scaduti':>9}{'slot':>6}  esito")
+    for motion_model in ("velocity", "kalman"):
+        for association in ("greedy", "hungarian"):
+            for seed in args.seeds:
+                row = check(motion_model, association, args.frames, seed)
+                # Il riuso degli slot è verificato solo se gli id superano la capacità dello store
+                if not row['error'] and row['track_ids'] <= row['capacity']:
+                    row['error'] = "scena troppo corta: nessuno slot riusato"
+                failures += bool(row['error'])
+                print(
+                    f"{row['motion_model']:>9}{row['association']:>11}{row['seed']:>6}{row['track_ids']:>7}"
+                    f"{row['expired']:>9}{row['capacity']:>6}  {row['error'] or 'ok'}"
+                )
+    sys.exit(1 if failures else 0)